@@ -3,9 +3,16 @@ set -e
 
 : "${DJANGO_SETTINGS_MODULE:=firstproject.settings}"
 : "${DJANGO_DEBUG:=0}"
+# cold, warm or preload (see docker/gunicorn.conf.py); compare them with `python manage.py measure_startup`
+export GUNICORN_STARTUP_MODE="${GUNICORN_STARTUP_MODE:-preload}"
 
 mkdir -p /app/staticfiles /app/media
 
+# Each gunicorn worker writes its metrics here and /metrics sums them; start from an empty directory
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 echo "Running migrations..."
 python manage.py migrate --noinput
 
@@ -15,9 +22,18 @@ python manage.py collectstatic --noinput
 if [ "${RUNSERVER_PLUS:-0}" = "1" ]; then
   echo "Starting Django dev server..."
   exec python manage.py runserver 0.0.0.0:8000
+elif [ "${SERVER_INTERFACE:-wsgi}" = "asgi" ]; then
+  echo "Starting Gunicorn with Uvicorn workers (ASGI)..."
+  exec gunicorn firstproject.asgi:application \
+      --config docker/gunicorn.conf.py \
+      --worker-class uvicorn.workers.UvicornWorker \
+      --bind 0.0.0.0:8000 \
+      --workers ${GUNICORN_WORKERS:-3} \
+      --timeout ${GUNICORN_TIMEOUT:-60}
 else
   echo "Starting Gunicorn..."
   exec gunicorn firstproject.wsgi:application \
+      --config docker/gunicorn.conf.py \
       --bind 0.0.0.0:8000 \
       --workers ${GUNICORN_WORKERS:-3} \
       --timeout ${GUNICORN_TIMEOUT:-60}
@@ -0,0 +1,50 @@
+import gc
+import os
+
+from prometheus_client import multiprocess
+
+# GUNICORN_STARTUP_MODE:
+#   cold    - every worker imports the app itself and pays for matplotlib on its first statistics request
+#   warm    - every worker imports the app and draws a few small charts before it accepts requests
+#   preload - the master imports and warms the app once, then forks; workers share those pages
+#             copy-on-write. Code is not reloaded on HUP in this mode; restart the container instead.
+STARTUP_MODES = ('cold', 'warm', 'preload')
+startup_mode = os.environ.get('GUNICORN_STARTUP_MODE', 'cold')
+if startup_mode not in STARTUP_MODES:
+    raise RuntimeError(f'GUNICORN_STARTUP_MODE must be one of {", ".join(STARTUP_MODES)}.')
+
+preload_app = startup_mode == 'preload'
+
+if preload_app:
+    # gunicorn reads this file before it imports a preloaded app (no server hook runs that early), so
+    # collections cannot leave holes in the pages the workers will share while the app loads
+    gc.disable()
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported and before the first worker is forked
+    if preload_app:
+        from firstapp.warmup import prepare_fork, warm_up
+
+        timings = warm_up()
+        prepare_fork()
+        # Frozen objects are never scanned again, so the master and every worker forked from now on can
+        # collect as usual
+        gc.enable()
+        server.log.info('Warmed up in the master: %s', _format_timings(timings))
+
+
+def post_worker_init(worker):
+    if startup_mode == 'warm':
+        from firstapp.warmup import warm_up
+
+        worker.log.info('Worker %s warmed up: %s', worker.pid, _format_timings(warm_up()))
+
+
+def child_exit(server, worker):
+    # Drop the in-flight gauge of a worker that exited so it does not count towards the live sum
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def _format_timings(timings):
+    return ', '.join(f'{step} {seconds * 1000:.0f} ms' for step, seconds in timings.items())
@@ -1,5 +1,46 @@
 from django.contrib import admin
-from .models import Reservation
+from django.core.paginator import Paginator
+from django.db.models import Sum
+from django.utils.functional import cached_property
+
+from .models import Reservation, ReservationDay
 # Register your models here.
 
-admin.site.register(Reservation)
+
+class EstimatedCountPaginator(Paginator):
+    # An unfiltered changelist takes its total from the daily rollup instead of COUNT(*) over every row
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            return ReservationDay.objects.aggregate(total=Sum('reservations'))['total'] or 0
+        return super().count
+
+
+class GuestCountFilter(admin.SimpleListFilter):
+    title = 'guest count'
+    parameter_name = 'guests'
+    ranges = {
+        '1-2': (1, 2),
+        '3-4': (3, 4),
+        '5-8': (5, 8),
+        '9+': (9, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, key) for key in self.ranges]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        queryset = queryset.filter(guest_count__gte=low)
+        return queryset.filter(guest_count__lte=high) if high is not None else queryset
+
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'first_name', 'last_name', 'guest_count', 'reservation_time')
+    list_filter = ('reservation_time', GuestCountFilter)
+    ordering = ('-reservation_time', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,209 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from .charts import default_chart_format
+from .metrics import record_admission
+from .render_jobs import render_queue_has_room
+from .serialization import JsonResponse, loads
+
+# Rough milliseconds of worker time per row parsed and per chart drawn (see benchmark_statistics)
+ROW_COST_MS = 0.01
+CHART_COST_MS = {'png': 300, 'svg': 40}
+# Streamed uploads are costed from their size; a CSV or NDJSON row is rarely shorter than this
+UPLOAD_BYTES_PER_ROW = 16
+POLL_INTERVAL = 0.025
+# Views that can answer without charts when there is no room to render them
+DEGRADABLE_VIEWS = ('statistics', 'statistics-async')
+
+
+class AdmissionMiddleware:
+    # Expensive statistics requests need one of STATISTICS_ADMISSION_SLOTS slots, shared by every worker
+    # through lock files, so cheap pages always find a free worker. A request that finds no free slot waits
+    # up to STATISTICS_ADMISSION_WAIT seconds in a queue of STATISTICS_ADMISSION_QUEUE places; after that
+    # it is answered without charts where possible, or with a 503 and Retry-After.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estimate = _expensive_request(request)
+        if estimate is None:
+            return self.get_response(request)
+        steps = _acquire_slot()
+        try:
+            while True:
+                time.sleep(next(steps))
+        except StopIteration as acquired:
+            slot = acquired.value
+        if slot is None:
+            return self._overloaded(request, estimate) or self.get_response(request)
+        fd, result = slot
+        record_admission(result)
+        try:
+            return self.get_response(request)
+        finally:
+            _unlock(fd)
+
+    async def __acall__(self, request):
+        estimate = _expensive_request(request)
+        if estimate is None:
+            return await self.get_response(request)
+        steps = _acquire_slot()
+        try:
+            while True:
+                await asyncio.sleep(next(steps))
+        except StopIteration as acquired:
+            slot = acquired.value
+        if slot is None:
+            return self._overloaded(request, estimate) or await self.get_response(request)
+        fd, result = slot
+        record_admission(result)
+        try:
+            return await self.get_response(request)
+        finally:
+            _unlock(fd)
+
+    def _overloaded(self, request, estimate):
+        # Returns the 503, or None after marking the request to be answered without charts
+        if estimate['degradable'] and getattr(settings, 'STATISTICS_ADMISSION_OVERLOAD', 'degrade') == 'degrade':
+            record_admission('degraded')
+            request.statistics_degraded = True
+            return None
+        record_admission('rejected')
+        retry_after = getattr(settings, 'STATISTICS_ADMISSION_RETRY_AFTER', 5)
+        response = JsonResponse({'error': 'The server is busy with other statistics requests; retry shortly.',
+                                 'retry_after': retry_after}, status=503)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+def estimate_cost(url_name, request):
+    # Returns {'cost', 'degradable'} in rough milliseconds, or None for requests that are never limited.
+    # Frequencies are summed rather than expanded anywhere in the pipeline, so total frequency does not
+    # change the cost and is not part of the estimate.
+    if request.method == 'GET' and url_name == 'statistics-session':
+        charts = 2 if request.GET.get('charts', '').lower() in ('1', 'true', 'yes', 'on') else 0
+        return {'cost': charts * _chart_cost(request.GET.get('chartFormat')), 'degradable': False}
+    if request.method != 'POST':
+        return None
+    if url_name == 'statistics-upload':
+        rows = int(request.META.get('CONTENT_LENGTH') or 0) // UPLOAD_BYTES_PER_ROW
+        return {'cost': rows * ROW_COST_MS, 'degradable': False}
+    if url_name not in DEGRADABLE_VIEWS and url_name != 'statistics-batch':
+        return None
+
+    try:
+        payload = loads(request.body or '{}')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # The view answers with a 400 without doing any work
+        return None
+    # Saved so the view does not decode the body a second time
+    request.statistics_payload = payload
+
+    if url_name == 'statistics-batch':
+        datasets = payload if isinstance(payload, list) else payload.get('datasets') if isinstance(payload, dict) else None
+        if not isinstance(datasets, list):
+            return None
+        include_charts = isinstance(payload, dict) and bool(payload.get('includeCharts'))
+        cost = 0
+        for dataset in datasets:
+            if isinstance(dataset, dict):
+                cost += _rows(dataset) * ROW_COST_MS
+                if include_charts:
+                    cost += 2 * _chart_cost(dataset.get('chartFormat'))
+        return {'cost': cost, 'degradable': False}
+
+    if not isinstance(payload, dict):
+        return None
+    render_mode = payload.get('renderMode') or getattr(settings, 'STATISTICS_RENDER_MODE', 'sync')
+    # Queued render jobs are drawn by the bounded render pool, not by this worker, but with the render
+    # queue full the view draws the charts inline, so they are costed as a sync request's would be
+    charts = 0 if render_mode == 'async' and url_name == 'statistics' and render_queue_has_room() else 2
+    rows_cost = _rows(payload) * ROW_COST_MS
+    cost = rows_cost + charts * _chart_cost(payload.get('chartFormat'))
+    # Without charts the request is only worth admitting if the statistics alone are cheap
+    return {'cost': cost, 'degradable': bool(charts) and rows_cost < _threshold()}
+
+
+def _expensive_request(request):
+    if not getattr(settings, 'STATISTICS_ADMISSION', True):
+        return None
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    estimate = estimate_cost(match.url_name, request)
+    if estimate is None or estimate['cost'] < _threshold():
+        return None
+    return estimate
+
+
+def _acquire_slot():
+    # Generator yielding how long to sleep between attempts; returns (lock fd, 'admitted' | 'queued') or None
+    slot = _try_lock('slot', getattr(settings, 'STATISTICS_ADMISSION_SLOTS', 2))
+    if slot is not None:
+        return slot, 'admitted'
+    place = _try_lock('queue', getattr(settings, 'STATISTICS_ADMISSION_QUEUE', 4))
+    if place is None:
+        return None
+    try:
+        deadline = time.monotonic() + getattr(settings, 'STATISTICS_ADMISSION_WAIT', 2.0)
+        while time.monotonic() < deadline:
+            yield POLL_INTERVAL
+            slot = _try_lock('slot', getattr(settings, 'STATISTICS_ADMISSION_SLOTS', 2))
+            if slot is not None:
+                return slot, 'queued'
+        return None
+    finally:
+        _unlock(place)
+
+
+def _try_lock(kind, count):
+    # flock() locks disappear with the process that held them, so a killed worker never leaks a slot
+    directory = _lock_directory()
+    for index in range(count):
+        fd = os.open(os.path.join(directory, f'{kind}-{index}.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        return fd
+    return None
+
+
+def _unlock(fd):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def _lock_directory():
+    directory = getattr(settings, 'STATISTICS_ADMISSION_DIR', None) or os.path.join(settings.BASE_DIR, 'cache', 'admission')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _rows(payload):
+    rows = payload.get('rows')
+    return len(rows) if isinstance(rows, list) else 0
+
+
+def _chart_cost(chart_format):
+    return CHART_COST_MS.get(chart_format or default_chart_format(), CHART_COST_MS['png'])
+
+
+def _threshold():
+    return getattr(settings, 'STATISTICS_ADMISSION_COST_THRESHOLD', 250)
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
 
 
 class FirstappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'firstapp'
+
+    def ready(self):
+        from . import menu, rollups  # noqa: F401 (connects the model signal handlers)
+
+        post_migrate.connect(enable_wal, sender=self)
+
+
+def enable_wal(using, **kwargs):
+    # WAL lets readers run alongside the single writer. The mode is stored in the database file, so it is
+    # set once here rather than on every connection, which would rewrite the file's header on any command.
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
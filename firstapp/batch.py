@@ -0,0 +1,46 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_batch_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Started like the render pool: never a fork of the threaded web worker
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'STATISTICS_BATCH_WORKERS', 2),
+                mp_context=multiprocessing.get_context(getattr(settings, 'STATISTICS_RENDER_START_METHOD', 'forkserver')),
+                initializer=django.setup,
+            )
+        return _executor
+
+
+def discard_batch_executor(executor):
+    # A pool whose worker died refuses all further work; the next batch starts a fresh one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def map_datasets(function, items):
+    # Small batches are cheaper to run inline than to ship to another process
+    workers = getattr(settings, 'STATISTICS_BATCH_WORKERS', 2)
+    if workers <= 1 or len(items) < getattr(settings, 'STATISTICS_BATCH_PARALLEL_THRESHOLD', 8):
+        return [function(item) for item in items]
+    chunksize = max(1, len(items) // (workers * 4))
+    executor = get_batch_executor()
+    try:
+        return list(executor.map(function, items, chunksize=chunksize))
+    except BrokenProcessPool:
+        discard_batch_executor(executor)
+        raise
@@ -0,0 +1,180 @@
+import gc
+import json
+import random
+import statistics as pystats
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from .charts import get_chart_backend
+from .statistics import (
+    analyse_grouped_rows,
+    compute_grouped_statistics,
+    compute_ungrouped_statistics,
+    parse_grouped_rows,
+    parse_ungrouped_rows,
+)
+
+CHART_FORMATS = ('png', 'svg')
+
+
+def ungrouped_dataset(size, rng, cumulative=False, huge=False):
+    values = sorted(rng.sample(range(size * 10), size))
+    frequencies = [rng.randint(10 ** 11, 10 ** 12) if huge else rng.randint(1, 100) for _ in values]
+    if cumulative:
+        frequencies = _running_total(frequencies)
+    key = 'cumulative' if cumulative else 'frequency'
+    return [{'value': str(value / 10), key: str(frequency)} for value, frequency in zip(values, frequencies)]
+
+
+def grouped_dataset(size, rng, cumulative=False, huge=False):
+    width = rng.choice((5, 10, 25))
+    frequencies = [rng.randint(10 ** 11, 10 ** 12) if huge else rng.randint(1, 100) for _ in range(size)]
+    if cumulative:
+        frequencies = _running_total(frequencies)
+    key = 'cumulative' if cumulative else 'frequency'
+    return [{'interval': f'{index * width}-{(index + 1) * width}', key: str(frequency)}
+            for index, frequency in enumerate(frequencies)]
+
+
+def build_datasets(sizes, seed):
+    # Every dataset comes from its own seeded generator, so a name always means the same rows
+    datasets = {}
+    for size in sizes:
+        for data_type, generate in (('ungrouped', ungrouped_dataset), ('grouped', grouped_dataset)):
+            for variant in ('plain', 'cumulative', 'huge'):
+                rng = random.Random(f'{seed}:{data_type}:{variant}:{size}')
+                rows = generate(size, rng, cumulative=variant == 'cumulative', huge=variant == 'huge')
+                datasets[f'{data_type}-{variant}-{size}'] = {
+                    'dataType': data_type,
+                    'usingCumulative': variant == 'cumulative',
+                    'rows': rows,
+                    'size': size,
+                }
+    return datasets
+
+
+def dataset_stages(dataset, render_max_rows, include_view):
+    # Returns {stage name: zero-argument callable}; each stage repeats the work of one pipeline step
+    rows = dataset['rows']
+    cumulative = dataset['usingCumulative']
+    stages = {}
+    if dataset['dataType'] == 'ungrouped':
+        pairs = parse_ungrouped_rows(rows, cumulative)
+        stats = compute_ungrouped_statistics(pairs)
+        stages['parse_ungrouped_rows'] = lambda: parse_ungrouped_rows(rows, cumulative)
+        stages['compute_ungrouped_statistics'] = lambda: compute_ungrouped_statistics(pairs)
+        renders = {
+            'histogram': lambda backend: backend.render_ungrouped_histogram(
+                stats['values'], stats['weights'], stats['median'], stats['mode_values']),
+            'ogive': lambda backend: backend.render_ogive(
+                stats['ogive_points'], stats['total_frequency'], stats['median'], 'Values'),
+        }
+    else:
+        classes = parse_grouped_rows(rows, cumulative)
+        stats = compute_grouped_statistics(classes)
+        stages['parse_grouped_rows'] = lambda: parse_grouped_rows(rows, cumulative)
+        stages['compute_grouped_statistics'] = lambda: compute_grouped_statistics(classes)
+        stages['analyse_grouped_rows'] = lambda: analyse_grouped_rows(rows, cumulative)
+        renders = {
+            'histogram': lambda backend: backend.render_grouped_histogram(
+                classes, stats['median'], stats['mode'], stats['modal_index']),
+            'ogive': lambda backend: backend.render_ogive(
+                stats['cumulative_points'], stats['total_frequency'], stats['median'], 'Upper class boundary'),
+        }
+
+    if dataset['size'] <= render_max_rows:
+        for chart_format in CHART_FORMATS:
+            backend = get_chart_backend(chart_format)
+            for name, render in renders.items():
+                stages[f'render_{name}_{chart_format}'] = lambda render=render, backend=backend: render(backend)
+        if include_view:
+            stages['statistics_view'] = _view_stage(dataset)
+    return stages
+
+
+def measure(stage, repeat):
+    # Times are taken without tracemalloc; one extra traced call measures peak memory
+    stage()
+    gc.collect()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stage()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'median_s': pystats.median(timings),
+        'min_s': min(timings),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold):
+    # A stage regresses when its median time grows by more than the threshold fraction
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None or not previous.get('median_s'):
+            continue
+        ratio = result['median_s'] / previous['median_s']
+        result['baseline_median_s'] = previous['median_s']
+        result['change'] = round(ratio - 1, 4)
+        if ratio > 1 + threshold:
+            regressions.append(key)
+    return regressions
+
+
+@contextmanager
+def scratch_chart_caches():
+    # The view stage stores what it renders; keep that out of the caches the site serves from
+    chart_alias = getattr(settings, 'CHART_CACHE_ALIAS', 'charts')
+    image_alias = getattr(settings, 'CHART_IMAGE_CACHE_ALIAS', 'chart_images')
+    with tempfile.TemporaryDirectory(prefix='benchmark-charts-') as directory:
+        with override_settings(CACHES={
+            **settings.CACHES,
+            chart_alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-charts'},
+            image_alias: {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }):
+            yield
+
+
+def _view_stage(dataset):
+    client = Client()
+    payload = {key: dataset[key] for key in ('dataType', 'usingCumulative', 'rows')}
+    body = json.dumps({**payload, 'renderMode': 'sync', 'chartFormat': 'png'})
+    chart_cache = caches[getattr(settings, 'CHART_CACHE_ALIAS', 'charts')]
+    url = reverse('statistics')
+
+    def run():
+        # Start cold on every call: no cached charts, and the stored run is rolled back afterwards
+        chart_cache.clear()
+        with transaction.atomic():
+            response = client.post(url, body, content_type='application/json')
+            transaction.set_rollback(True)
+        if response.status_code != 200:
+            raise RuntimeError(f'statistics_view returned {response.status_code}: {response.content[:200]!r}')
+
+    return run
+
+
+def _running_total(frequencies):
+    total = 0
+    cumulative = []
+    for frequency in frequencies:
+        total += frequency
+        cumulative.append(total)
+    return cumulative
@@ -0,0 +1,66 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import cache_lookup_counts, record_cache_lookup
+
+# Bump when the chart output changes so stale images are not served after a deploy.
+CHART_CACHE_VERSION = 3
+
+
+def get_chart_cache():
+    return caches[getattr(settings, 'CHART_CACHE_ALIAS', 'charts')]
+
+
+def get_chart_image_cache():
+    return caches[getattr(settings, 'CHART_IMAGE_CACHE_ALIAS', 'chart_images')]
+
+
+def chart_cache_key(kind, data, params):
+    canonical = json.dumps(
+        {'kind': kind, 'data': data, 'params': params, 'version': CHART_CACHE_VERSION},
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return 'chart:' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_cached_chart(kind, data, params):
+    image = get_chart_cache().get(chart_cache_key(kind, data, params))
+    record_cache_lookup('charts', image is not None)
+    return image
+
+
+def set_cached_chart(kind, data, params, image):
+    get_chart_cache().set(chart_cache_key(kind, data, params), image)
+
+
+def store_chart_image(image):
+    digest = hashlib.sha256(image).hexdigest()
+    cache = get_chart_image_cache()
+    key = _chart_image_key(digest)
+    if not cache.has_key(key):
+        cache.set(key, image)
+    return digest
+
+
+def get_chart_image(digest):
+    image = get_chart_image_cache().get(_chart_image_key(digest))
+    record_cache_lookup('chart_images', image is not None)
+    return image
+
+
+def chart_cache_stats():
+    hits, misses = cache_lookup_counts('charts')
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def _chart_image_key(digest):
+    return 'chart-image:' + digest
@@ -0,0 +1,143 @@
+import math
+from importlib import import_module
+
+from django.conf import settings
+
+FIGURE_SIZE = (7, 4)
+FIGURE_DPI = 150
+
+# Chart format -> module providing render_ungrouped_histogram, render_grouped_histogram and render_ogive
+CHART_BACKENDS = {
+    'png': 'firstapp.charts.png',
+    'svg': 'firstapp.charts.svg',
+}
+CHART_CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def default_chart_format():
+    return getattr(settings, 'STATISTICS_CHART_FORMAT', 'png')
+
+
+def get_chart_backend(chart_format):
+    if chart_format not in CHART_BACKENDS:
+        raise ValueError('Chart format must be either png or svg.')
+    return import_module(CHART_BACKENDS[chart_format])
+
+
+def chart_image_format(image):
+    return 'png' if image.startswith(b'\x89PNG') else 'svg'
+
+
+def chart_point_limit():
+    return getattr(settings, 'STATISTICS_CHART_MAX_POINTS', 1000)
+
+
+def chart_bar_limit():
+    return getattr(settings, 'STATISTICS_CHART_MAX_BARS', 600)
+
+
+def downsample_points(points, max_points):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and, from each bucket of points in
+    # between, the one spanning the largest triangle with the point kept before it and the average of the
+    # next bucket. Only real points are kept, so an ogive stays monotonic and its steep parts keep their shape.
+    if max_points < 3 or len(points) <= max_points:
+        return points
+    import numpy as np
+
+    data = np.asarray(points, dtype=float)
+    xs, ys = data[:, 0], data[:, 1]
+    bounds = np.floor(np.linspace(1, len(points) - 1, max_points - 1)).astype(int)
+    kept = [0]
+    for index in range(max_points - 2):
+        start, end = bounds[index], bounds[index + 1]
+        if index + 2 < len(bounds):
+            next_x = xs[end:bounds[index + 2]].mean()
+            next_y = ys[end:bounds[index + 2]].mean()
+        else:
+            next_x, next_y = xs[-1], ys[-1]
+        previous_x, previous_y = xs[kept[-1]], ys[kept[-1]]
+        areas = np.abs((previous_x - next_x) * (ys[start:end] - previous_y)
+                       - (previous_x - xs[start:end]) * (next_y - previous_y))
+        kept.append(start + int(areas.argmax()))
+    kept.append(len(points) - 1)
+    return [(float(xs[index]), float(ys[index])) for index in kept]
+
+
+def reduce_classes(classes, max_bars):
+    # Above max_bars, runs of neighbouring classes are drawn as one bar as tall as the tallest class in the
+    # run. Each run is then only a pixel or two wide, so the outline (and the height of the modal class)
+    # looks the same while the number of bars drawn stays bounded.
+    if len(classes) <= max_bars:
+        return classes
+    size = math.ceil(len(classes) / max_bars)
+    return [
+        {
+            'lower': classes[start]['lower'],
+            'upper': classes[min(start + size, len(classes)) - 1]['upper'],
+            'frequency': max(cls['frequency'] for cls in classes[start:start + size]),
+        }
+        for start in range(0, len(classes), size)
+    ]
+
+
+def ogive_median_point(points, total_frequency, median_value):
+    median_level = total_frequency / 2 if total_frequency else None
+    if median_level is None or not points:
+        return None
+
+    intersection_x = None
+    for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
+        if (y0 <= median_level <= y1) or (y1 <= median_level <= y0):
+            if y1 == y0:
+                intersection_x = x1
+            else:
+                ratio = (median_level - y0) / (y1 - y0)
+                intersection_x = x0 + ratio * (x1 - x0)
+            break
+
+    target_x = intersection_x if intersection_x is not None else median_value
+    if target_x is None:
+        return None
+    return points[0][0], target_x, median_level
+
+
+def mode_construction(classes, mode_value, modal_index):
+    construction = {'segments': [], 'point': None, 'line': None}
+    if not 0 <= modal_index < len(classes):
+        return construction
+
+    modal_class = classes[modal_index]
+    prev_class = classes[modal_index - 1] if modal_index > 0 else None
+    next_class = classes[modal_index + 1] if modal_index < len(classes) - 1 else None
+
+    if prev_class and next_class:
+        construction['segments'] = [
+            ((prev_class['upper'], prev_class['frequency']), (modal_class['lower'], modal_class['frequency'])),
+            ((modal_class['upper'], modal_class['frequency']), (next_class['lower'], next_class['frequency'])),
+        ]
+        intersection = line_intersection(
+            (prev_class['upper'], prev_class['frequency']),
+            (modal_class['lower'], modal_class['frequency']),
+            (next_class['lower'], next_class['frequency']),
+            (modal_class['upper'], modal_class['frequency'])
+        )
+        if intersection:
+            construction['point'] = intersection
+            construction['line'] = intersection
+    elif mode_value is not None:
+        construction['line'] = (mode_value, modal_class['frequency'])
+    return construction
+
+
+def line_intersection(p1, p2, p3, p4):
+    (x1, y1), (x2, y2) = p1, p2
+    (x3, y3), (x4, y4) = p3, p4
+    denominator = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+    if abs(denominator) < 1e-12:
+        return None
+    numerator_x = (x1 * y2 - y1 * x2) * (x3 - x4) - (x1 - x2) * (x3 * y4 - y3 * x4)
+    numerator_y = (x1 * y2 - y1 * x2) * (y3 - y4) - (y1 - y2) * (x3 * y4 - y3 * x4)
+    return numerator_x / denominator, numerator_y / denominator
@@ -0,0 +1,110 @@
+from io import BytesIO
+
+from ..timing import timed_phase
+from ..utils import format_number
+from . import (
+    FIGURE_DPI,
+    FIGURE_SIZE,
+    chart_bar_limit,
+    chart_point_limit,
+    downsample_points,
+    mode_construction,
+    ogive_median_point,
+    reduce_classes,
+)
+
+
+def render_ungrouped_histogram(values, weights, median_value, mode_values):
+    if not values:
+        return None
+
+    bins = min(10, max(1, len(values)))
+    fig, ax = _new_figure()
+    ax.hist(values, bins=bins, weights=weights, color='#6366f1', edgecolor='#312e81', alpha=0.85)
+    ax.set_xlabel('Values')
+    ax.set_ylabel('Frequency')
+    if median_value is not None:
+        ax.axvline(median_value, color='#0ea5e9', linestyle='--', linewidth=1.4,
+                   label=f'Median {format_number(median_value)}')
+    for index, mode_value in enumerate(mode_values):
+        ax.axvline(mode_value, color='#f97316', linestyle='-', linewidth=1.2,
+                   label='Mode' if index == 0 else None)
+    return _finish(fig, ax)
+
+
+def render_grouped_histogram(classes, median_value, mode_value, modal_index):
+    fig, ax = _new_figure()
+    # Markers are placed from the full classes; only the bars themselves are reduced
+    bars = reduce_classes(classes, chart_bar_limit())
+    if bars is classes:
+        ax.bar([cls['lower'] for cls in bars], [cls['frequency'] for cls in bars],
+               width=[cls['upper'] - cls['lower'] for cls in bars], align='edge', color='#38bdf8', edgecolor='#0f172a',
+               alpha=0.85)
+    else:
+        # One collection instead of a Rectangle artist per bar
+        from matplotlib.collections import PolyCollection
+
+        ax.add_collection(PolyCollection(
+            [[(cls['lower'], 0), (cls['lower'], cls['frequency']), (cls['upper'], cls['frequency']), (cls['upper'], 0)]
+             for cls in bars], facecolors='#38bdf8', linewidths=0, alpha=0.85))
+        ax.autoscale_view()
+
+    if median_value is not None:
+        ax.axvline(median_value, color='#0ea5e9', linestyle='--', linewidth=1.4,
+                   label=f'Median {format_number(median_value)}')
+
+    construction = mode_construction(classes, mode_value, modal_index)
+    for index, ((x0, y0), (x1, y1)) in enumerate(construction['segments']):
+        ax.plot([x0, x1], [y0, y1], color='#f97316', linestyle='--', linewidth=1.2,
+                label='Mode construction' if index == 0 else None)
+    if construction['point']:
+        ax.scatter(*construction['point'], color='#f97316')
+    if construction['line']:
+        mode_x, mode_y = construction['line']
+        ax.vlines(mode_x, 0, mode_y, color='#f97316', linewidth=1.4, label='Mode')
+    ax.set_xlabel('Class intervals')
+    ax.set_ylabel('Frequency')
+    return _finish(fig, ax, 'best' if bars is classes else 'upper right')
+
+
+def render_ogive(points, total_frequency, median_value, xlabel):
+    fig, ax = _new_figure()
+    line = points
+    if points:
+        # The median construction below still uses every point
+        line = downsample_points(points, chart_point_limit())
+        xs, ys = zip(*line)
+        ax.plot(xs, ys, marker='o' if line is points else None, color='#22c55e')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('Cumulative frequency')
+    median_point = ogive_median_point(points, total_frequency, median_value)
+    if median_point:
+        start_x, target_x, median_level = median_point
+        ax.hlines(median_level, start_x, target_x, colors='#0ea5e9', linestyles='--', linewidth=1.2,
+                  label='Median level (N/2)')
+        ax.vlines(target_x, 0, median_level, colors='#0ea5e9', linestyles='-', linewidth=1.5,
+                  label=f'Median {format_number(target_x)}')
+        ax.scatter(target_x, median_level, color='#0ea5e9')
+    return _finish(fig, ax, 'best' if line is points else 'upper left')
+
+
+def _new_figure():
+    # Imported here so workers that never draw a PNG do not pay for matplotlib.
+    # Figure is used instead of pyplot to keep rendering free of global state.
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIGURE_SIZE)
+    return fig, fig.subplots()
+
+
+def _finish(fig, ax, legend_loc='best'):
+    ax.grid(alpha=0.2)
+    handles, labels = ax.get_legend_handles_labels()
+    if labels:
+        # 'best' tests every drawn vertex, so reduced charts pass a fixed corner instead
+        ax.legend(loc=legend_loc)
+    fig.tight_layout()
+    buffer = BytesIO()
+    with timed_phase('png-encode'):
+        fig.savefig(buffer, format='png', dpi=FIGURE_DPI)
+    return buffer.getvalue()
@@ -0,0 +1,184 @@
+import math
+from xml.sax.saxutils import escape
+
+from ..utils import format_number
+from . import (
+    FIGURE_SIZE,
+    chart_bar_limit,
+    chart_point_limit,
+    downsample_points,
+    mode_construction,
+    ogive_median_point,
+    reduce_classes,
+)
+
+WIDTH = FIGURE_SIZE[0] * 100
+HEIGHT = FIGURE_SIZE[1] * 100
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 56, 16, 16, 44
+PLOT_WIDTH = WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+PLOT_HEIGHT = HEIGHT - MARGIN_TOP - MARGIN_BOTTOM
+
+
+def render_ungrouped_histogram(values, weights, median_value, mode_values):
+    if not values:
+        return None
+
+    edges, counts = _histogram(values, weights, min(10, max(1, len(values))))
+    plot = _Plot(edges[0], edges[-1], max(counts), 'Values', 'Frequency')
+    for lower, upper, count in zip(edges[:-1], edges[1:], counts):
+        plot.bar(lower, upper, count, fill='#6366f1', stroke='#312e81')
+    if median_value is not None:
+        plot.vline(median_value, 0, plot.y_max, '#0ea5e9', width=1.4, dashed=True,
+                   label=f'Median {format_number(median_value)}')
+    for index, mode_value in enumerate(mode_values):
+        plot.vline(mode_value, 0, plot.y_max, '#f97316', width=1.2, label='Mode' if index == 0 else None)
+    return plot.render()
+
+
+def render_grouped_histogram(classes, median_value, mode_value, modal_index):
+    plot = _Plot(classes[0]['lower'], classes[-1]['upper'], max(cls['frequency'] for cls in classes),
+                 'Class intervals', 'Frequency')
+    bars = reduce_classes(classes, chart_bar_limit())
+    for cls in bars:
+        plot.bar(cls['lower'], cls['upper'], cls['frequency'], fill='#38bdf8',
+                 stroke='#0f172a' if bars is classes else 'none')
+
+    if median_value is not None:
+        plot.vline(median_value, 0, plot.y_max, '#0ea5e9', width=1.4, dashed=True,
+                   label=f'Median {format_number(median_value)}')
+
+    construction = mode_construction(classes, mode_value, modal_index)
+    for index, segment in enumerate(construction['segments']):
+        plot.polyline(segment, '#f97316', width=1.2, dashed=True,
+                      label='Mode construction' if index == 0 else None)
+    if construction['point']:
+        plot.marker(*construction['point'], '#f97316')
+    if construction['line']:
+        mode_x, mode_y = construction['line']
+        plot.vline(mode_x, 0, mode_y, '#f97316', width=1.4, label='Mode')
+    return plot.render()
+
+
+def render_ogive(points, total_frequency, median_value, xlabel):
+    xs = [x for x, _ in points] or [0]
+    plot = _Plot(min(xs), max(xs), max((y for _, y in points), default=0), xlabel, 'Cumulative frequency')
+    if points:
+        line = downsample_points(points, chart_point_limit())
+        plot.polyline(line, '#22c55e', width=1.5)
+        if line is points:
+            for x, y in points:
+                plot.marker(x, y, '#22c55e')
+    median_point = ogive_median_point(points, total_frequency, median_value)
+    if median_point:
+        start_x, target_x, median_level = median_point
+        plot.polyline([(start_x, median_level), (target_x, median_level)], '#0ea5e9', width=1.2, dashed=True,
+                      label='Median level (N/2)')
+        plot.vline(target_x, 0, median_level, '#0ea5e9', width=1.5, label=f'Median {format_number(target_x)}')
+        plot.marker(target_x, median_level, '#0ea5e9')
+    return plot.render()
+
+
+class _Plot:
+    def __init__(self, x_min, x_max, y_max, xlabel, ylabel):
+        padding = (x_max - x_min) * 0.05 or 0.5
+        self.x_min, self.x_max = x_min - padding, x_max + padding
+        self.y_max = y_max * 1.05 if y_max > 0 else 1
+        self.xlabel, self.ylabel = xlabel, ylabel
+        self.elements = []
+        self.legend = []
+
+    def x(self, value):
+        return MARGIN_LEFT + (value - self.x_min) / (self.x_max - self.x_min) * PLOT_WIDTH
+
+    def y(self, value):
+        return MARGIN_TOP + PLOT_HEIGHT - value / self.y_max * PLOT_HEIGHT
+
+    def bar(self, lower, upper, height, fill, stroke):
+        left, right, top = self.x(lower), self.x(upper), self.y(height)
+        self.elements.append(
+            f'<rect x="{_n(left)}" y="{_n(top)}" width="{_n(right - left)}" height="{_n(self.y(0) - top)}" '
+            f'fill="{fill}" fill-opacity="0.85" stroke="{stroke}" stroke-width="0.8"/>'
+        )
+
+    def polyline(self, points, color, width, dashed=False, label=None):
+        coordinates = ' '.join(f'{_n(self.x(x))},{_n(self.y(y))}' for x, y in points)
+        self.elements.append(f'<polyline points="{coordinates}" fill="none" {_stroke(color, width, dashed)}/>')
+        if label:
+            self.legend.append((label, color, width, dashed))
+
+    def vline(self, x, y0, y1, color, width, dashed=False, label=None):
+        self.polyline([(x, y0), (x, y1)], color, width, dashed, label)
+
+    def marker(self, x, y, color):
+        self.elements.append(f'<circle cx="{_n(self.x(x))}" cy="{_n(self.y(y))}" r="3.5" fill="{color}"/>')
+
+    def render(self):
+        bottom, right = MARGIN_TOP + PLOT_HEIGHT, MARGIN_LEFT + PLOT_WIDTH
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}" '
+            f'font-family="DejaVu Sans,Arial,sans-serif" font-size="11">',
+            f'<rect width="{WIDTH}" height="{HEIGHT}" fill="#fff"/>',
+        ]
+        for tick in _ticks(self.x_min, self.x_max):
+            x = _n(self.x(tick))
+            parts.append(f'<line x1="{x}" y1="{MARGIN_TOP}" x2="{x}" y2="{bottom}" stroke="#000" stroke-opacity="0.1"/>')
+            parts.append(f'<text x="{x}" y="{bottom + 16}" text-anchor="middle">{format_number(tick)}</text>')
+        for tick in _ticks(0, self.y_max):
+            y = _n(self.y(tick))
+            parts.append(f'<line x1="{MARGIN_LEFT}" y1="{y}" x2="{right}" y2="{y}" stroke="#000" stroke-opacity="0.1"/>')
+            parts.append(f'<text x="{MARGIN_LEFT - 6}" y="{y}" dy="4" text-anchor="end">{format_number(tick)}</text>')
+        parts.extend(self.elements)
+        parts.append(f'<rect x="{MARGIN_LEFT}" y="{MARGIN_TOP}" width="{PLOT_WIDTH}" height="{PLOT_HEIGHT}" '
+                     f'fill="none" stroke="#000" stroke-width="0.8"/>')
+        parts.append(f'<text x="{_n(MARGIN_LEFT + PLOT_WIDTH / 2)}" y="{HEIGHT - 8}" text-anchor="middle">'
+                     f'{escape(self.xlabel)}</text>')
+        parts.append(f'<text transform="translate(14 {_n(MARGIN_TOP + PLOT_HEIGHT / 2)}) rotate(-90)" '
+                     f'text-anchor="middle">{escape(self.ylabel)}</text>')
+        if self.legend:
+            parts.append(self._render_legend(right))
+        parts.append('</svg>')
+        return ''.join(parts).encode('utf-8')
+
+    def _render_legend(self, right):
+        box_width = 34 + 6.5 * max(len(label) for label, *_ in self.legend)
+        left, top = right - box_width - 8, MARGIN_TOP + 8
+        parts = [f'<rect x="{_n(left)}" y="{top}" width="{_n(box_width)}" height="{8 + 16 * len(self.legend)}" '
+                 f'fill="#fff" fill-opacity="0.8" stroke="#ccc" rx="3"/>']
+        for index, (label, color, width, dashed) in enumerate(self.legend):
+            y = top + 12 + 16 * index
+            parts.append(f'<line x1="{_n(left + 6)}" y1="{y}" x2="{_n(left + 26)}" y2="{y}" {_stroke(color, width, dashed)}/>')
+            parts.append(f'<text x="{_n(left + 30)}" y="{y}" dy="4">{escape(label)}</text>')
+        return ''.join(parts)
+
+
+def _histogram(values, weights, bins):
+    # Equal-width bins over the data range, matching numpy.histogram / Axes.hist
+    low, high = values[0], values[-1]
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    width = (high - low) / bins
+    edges = [low + index * width for index in range(bins)] + [high]
+    counts = [0] * bins
+    for value, weight in zip(values, weights):
+        counts[min(int((value - low) / width), bins - 1)] += weight
+    return edges, counts
+
+
+def _ticks(low, high, target=6):
+    span = high - low
+    if span <= 0:
+        return [low]
+    raw_step = span / target
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+    first = math.ceil(low / step)
+    return [index * step for index in range(first, math.floor(high / step) + 1)]
+
+
+def _stroke(color, width, dashed):
+    dash = ' stroke-dasharray="5 3"' if dashed else ''
+    return f'stroke="{color}" stroke-width="{width}"{dash}'
+
+
+def _n(value):
+    return f'{value:.1f}'.rstrip('0').rstrip('.')
@@ -0,0 +1,71 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ACCEPTS = {
+    'br': _lazy_re_compile(r'\bbr\b'),
+    'gzip': _lazy_re_compile(r'\bgzip\b'),
+}
+
+
+class CompressionMiddleware:
+    # Compresses JSON responses of at least JSON_COMPRESSION_MIN_BYTES (statistics responses with inline
+    # charts run to hundreds of kilobytes) with the first encoding in JSON_COMPRESSION that the client
+    # accepts. 'br' is skipped unless the brotli package is installed.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return _compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return _compress(request, await self.get_response(request))
+
+
+def _compress(request, response):
+    if (response.streaming or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('application/json')
+            or len(response.content) < getattr(settings, 'JSON_COMPRESSION_MIN_BYTES', 16 * 1024)):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = _choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(response.content, quality=getattr(settings, 'JSON_COMPRESSION_BROTLI_QUALITY', 5))
+    else:
+        compressed = compress_string(response.content, max_random_bytes=100)
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response.headers['Content-Length'] = str(len(compressed))
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        # As GZipMiddleware does: the compressed body is no longer byte-for-byte the tagged one
+        response.headers['ETag'] = 'W/' + etag
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _choose_encoding(accept_encoding):
+    for encoding in getattr(settings, 'JSON_COMPRESSION', ('br', 'gzip')):
+        if encoding == 'br' and brotli is None:
+            continue
+        if encoding in ACCEPTS and ACCEPTS[encoding].search(accept_encoding):
+            return encoding
+    return None
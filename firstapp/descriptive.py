@@ -0,0 +1,198 @@
+import math
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from .utils import format_number
+
+QUARTILES = (('q1', 0.25), ('q2', 0.5), ('q3', 0.75))
+MAX_PERCENTILES = 20
+
+
+class WeightedMoments:
+    # Running mean and central moments (Welford, generalised to weights and to merging partial
+    # results). Adding a value with frequency w is a merge with a group of w identical values.
+    __slots__ = ('count', 'mean', 'm2', 'm3')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, m3=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.m3 = m3
+
+    def add(self, value, weight):
+        if weight:
+            self.merge(WeightedMoments(weight, value))
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2, self.m3 = other.count, other.mean, other.m2, other.m3
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        product = self.count * other.count
+        self.m3 += (other.m3 + delta ** 3 * product * (self.count - other.count) / count ** 2
+                    + 3 * delta * (self.count * other.m2 - other.count * self.m2) / count)
+        self.m2 += other.m2 + delta ** 2 * product / count
+        self.mean += delta * other.count / count
+        self.count = count
+        return self
+
+    def variance(self, sample=False):
+        if self.count - sample <= 0:
+            return None
+        return self.m2 / (self.count - sample)
+
+    def skewness(self):
+        if not self.count or self.m2 <= 0:
+            return None
+        return math.sqrt(self.count) * self.m3 / self.m2 ** 1.5
+
+
+class ExactSum:
+    # math.fsum over a stream: Shewchuk's non-overlapping partials, so total() is what fsum would
+    # return for the same terms, in whatever order they arrive
+    __slots__ = ('partials',)
+
+    def __init__(self):
+        self.partials = []
+
+    def add(self, value):
+        partials = []
+        for partial in self.partials:
+            if abs(value) < abs(partial):
+                value, partial = partial, value
+            high = value + partial
+            low = partial - (high - value)
+            if low:
+                partials.append(low)
+            value = high
+        partials.append(value)
+        self.partials = partials
+
+    def total(self):
+        return math.fsum(self.partials)
+
+
+class QuantileSketch:
+    # Log-bucketed quantile sketch (DDSketch): every quantile it returns is within relative_error
+    # of a true value, buckets merge by adding counts, and memory is bounded by max_buckets however
+    # many values are added. When full, the buckets nearest zero are merged first.
+    def __init__(self, relative_error=0.01, max_buckets=2048):
+        self.relative_error = relative_error
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        if weight <= 0:
+            return
+        self.count += weight
+        if value == 0:
+            self.zeros += weight
+            return
+        store = self.positive if value > 0 else self.negative
+        index = math.ceil(math.log(abs(value)) / self.log_gamma)
+        store[index] = store.get(index, 0) + weight
+        if len(store) > self.max_buckets:
+            self._collapse(store)
+
+    def merge(self, other):
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, weight in other_store.items():
+                store[index] = store.get(index, 0) + weight
+            if len(store) > self.max_buckets:
+                self._collapse(store)
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def _collapse(self, store):
+        ordered = sorted(store)
+        spill = ordered[:len(ordered) - self.max_buckets + 1]
+        store[spill[-1]] += sum(store.pop(index) for index in spill[:-1])
+
+
+def parse_percentiles(value):
+    # Accepts a list (JSON) or a comma-separated string (query string); None gives the default set
+    if value is None or value == '':
+        return list(getattr(settings, 'STATISTICS_PERCENTILES', (5, 10, 90, 95)))
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or len(value) > MAX_PERCENTILES:
+        raise ValueError(f'percentiles must be a list of at most {MAX_PERCENTILES} numbers.')
+    percentiles = []
+    for item in value:
+        try:
+            percentile = float(item)
+        except (TypeError, ValueError):
+            raise ValueError(f'"{item}" is not a valid percentile.')
+        if not 0 <= percentile <= 100:
+            raise ValueError('Percentiles must be between 0 and 100.')
+        percentiles.append(format_number(percentile))
+    return sorted(set(percentiles))
+
+
+def ungrouped_quantile(values, cumulative_frequencies, fraction):
+    # Linear interpolation between order statistics ("type 7"), so q2 equals the existing median
+    total_frequency = cumulative_frequencies[-1]
+    position = (total_frequency - 1) * fraction
+    below = math.floor(position)
+    low = values[bisect_right(cumulative_frequencies, below)]
+    if position == below:
+        return low
+    high = values[bisect_right(cumulative_frequencies, below + 1)]
+    return low + (position - below) * (high - low)
+
+
+def grouped_quantile(lowers, uppers, frequencies, cumulative_frequencies, fraction):
+    # The grouped median formula with N/2 replaced by fraction * N
+    total_frequency = cumulative_frequencies[-1]
+    index = bisect_left(cumulative_frequencies, total_frequency * fraction)
+    before = cumulative_frequencies[index - 1] if index else 0
+    return lowers[index] + ((total_frequency * fraction - before) / frequencies[index]) * (uppers[index] - lowers[index])
+
+
+def describe(moments, quantile, percentiles, method='exact'):
+    # quantile(fraction) -> value; everything is formatted for the JSON response
+    variance = moments.variance()
+    sample_variance = moments.variance(sample=True)
+    quartiles = {name: quantile(fraction) for name, fraction in QUARTILES}
+    return {
+        'variance': format_number(variance),
+        'std_dev': format_number(math.sqrt(variance)) if variance is not None else None,
+        'sample_variance': format_number(sample_variance),
+        'sample_std_dev': format_number(math.sqrt(sample_variance)) if sample_variance is not None else None,
+        'skewness': format_number(moments.skewness()),
+        'quartiles': {name: format_number(value) for name, value in quartiles.items()},
+        'iqr': format_number(quartiles['q3'] - quartiles['q1']),
+        'percentiles': {f'p{percentile}': format_number(quantile(percentile / 100)) for percentile in percentiles},
+        'quantile_method': method,
+    }
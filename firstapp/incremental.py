@@ -0,0 +1,381 @@
+import pickle
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from fractions import Fraction
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .descriptive import WeightedMoments, describe, parse_percentiles, ungrouped_quantile
+from .models import StatisticsSession, StatisticsSessionEdit
+from .statistics import grouped_median, grouped_modal_label, grouped_mode, iter_grouped_classes, iter_ungrouped_entries
+from .utils import format_number
+
+DATA_TYPES = ('ungrouped', 'grouped')
+RECORD_FIELDS = ('session_id', 'version', 'snapshot_version', 'logged_rows')
+
+# Recently used sessions in this worker, so an edit does not unpickle the whole table again
+_memo = OrderedDict()
+
+
+class VersionConflict(Exception):
+    pass
+
+
+class IncrementalStatistics:
+    # Keys are kept sorted with their frequencies alongside: distinct values for ungrouped data,
+    # (lower, upper) classes for grouped data. Totals are updated on every change, and the
+    # cumulative frequencies are only rebuilt from the first key that changed, so appending to
+    # the end of a table costs the same however long it already is.
+    def __init__(self, data_type):
+        if data_type not in DATA_TYPES:
+            raise ValueError('Select either ungrouped or grouped data.')
+        self.data_type = data_type
+        self.rows = {}
+        self.next_row_id = 1
+        self.keys = []
+        self.weights = []
+        self.prefix = []
+        self.total = 0
+        # Exact, so removing rows never leaves rounding error behind in the mean
+        self.weighted_sum = Fraction(0)
+        # Sums of squares and cubes give the variance and skewness without another pass
+        self.square_sum = Fraction(0)
+        self.cube_sum = Fraction(0)
+        # frequency -> keys with that frequency, so the modal keys are found without scanning the table
+        self.weight_keys = {}
+        self.version = 0
+        # (version, operation, row id, rows) for each change not yet written to the edit log
+        self.edits = []
+
+    def __getstate__(self):
+        # The cumulative frequencies are rebuilt on demand, so they are not stored
+        return {**self.__dict__, 'prefix': [], 'edits': []}
+
+    def append(self, rows):
+        # Returns one row id per submitted row (None for blank rows); nothing changes if any row is invalid
+        if not isinstance(rows, list):
+            raise ValueError('rows must be a list.')
+        first_id = self.next_row_id
+        parsed = {}
+        for index, row in enumerate(rows, start=first_id):
+            entry = self._parse_row(row, index)
+            if entry is not None:
+                parsed[index] = entry
+        max_rows = getattr(settings, 'STATISTICS_SESSION_MAX_ROWS', 200000)
+        if len(self.rows) + len(parsed) > max_rows:
+            raise ValueError(f'A session can hold at most {max_rows} rows.')
+        if self.data_type == 'grouped':
+            self._check_classes([key for key, _ in parsed.values()])
+
+        for row_id, (key, frequency) in parsed.items():
+            self.rows[row_id] = (key, frequency)
+            self._add(key, frequency)
+        self.next_row_id += len(rows)
+        self.version += 1
+        self.edits.append((self.version, 'append', None, rows))
+        return [index if index in parsed else None for index in range(first_id, self.next_row_id)]
+
+    def update(self, row_id, row):
+        old_key, old_frequency = self._row(row_id)
+        entry = self._parse_row(row, row_id)
+        if entry is None:
+            raise ValueError(f'Row {row_id} must not be blank; remove it instead.')
+        key, frequency = entry
+        self._add(old_key, -old_frequency)
+        try:
+            if self.data_type == 'grouped':
+                self._check_classes([key])
+        except ValueError:
+            self._add(old_key, old_frequency)
+            raise
+        self.rows[row_id] = entry
+        self._add(key, frequency)
+        self.version += 1
+        self.edits.append((self.version, 'update', row_id, row))
+
+    def remove(self, row_id):
+        key, frequency = self._row(row_id)
+        del self.rows[row_id]
+        self._add(key, -frequency)
+        self.version += 1
+        self.edits.append((self.version, 'remove', row_id, None))
+
+    def replay(self, operation, row_id, rows):
+        # Applies a change read back from the edit log without logging it again
+        if operation == 'append':
+            self.append(rows)
+        elif operation == 'update':
+            self.update(row_id, rows)
+        else:
+            self.remove(row_id)
+        self.edits.pop()
+
+    def statistics(self, percentiles=None):
+        if self.data_type == 'ungrouped':
+            stats = self._ungrouped_statistics()
+            quantile = lambda fraction: ungrouped_quantile(self.keys, self._cumulative(), fraction)
+        else:
+            stats = self._grouped_statistics()
+            quantile = self._grouped_quantile
+        stats['descriptive'] = describe(self._moments(), quantile, parse_percentiles(percentiles)) if self.total else None
+        return stats
+
+    def chart_data(self):
+        # Full per-key series for the chart renderers; only built when charts are requested
+        cumulative = self._cumulative()
+        if self.data_type == 'ungrouped':
+            return {
+                'values': list(self.keys),
+                'weights': list(self.weights),
+                'ogive_points': [(self.keys[0], 0), *zip(self.keys, cumulative)] if self.keys else [],
+            }
+        return {
+            'classes': [{'lower': lower, 'upper': upper, 'frequency': frequency}
+                        for (lower, upper), frequency in zip(self.keys, self.weights)],
+            'cumulative_points': ([(self.keys[0][0], 0)] + [(upper, total) for (_, upper), total
+                                                             in zip(self.keys, cumulative)]) if self.keys else [],
+        }
+
+    def _parse_row(self, row, index):
+        if self.data_type == 'ungrouped':
+            entry = next(iter_ungrouped_entries([row], start=index), None)
+            return (entry['value'], entry['frequency']) if entry is not None else None
+        cls = next(iter_grouped_classes([row], False, start=index), None)
+        return ((cls['lower'], cls['upper']), cls['frequency']) if cls is not None else None
+
+    def _row(self, row_id):
+        try:
+            return self.rows[row_id]
+        except KeyError:
+            raise LookupError(f'Row {row_id} does not exist.')
+
+    def _check_classes(self, classes):
+        ordered = sorted(classes)
+        for previous, current in zip(ordered, ordered[1:]):
+            if current[0] < previous[1]:
+                raise ValueError('Class intervals must not overlap.')
+        for lower, upper in ordered:
+            position = bisect_left(self.keys, (lower, upper))
+            if position > 0 and lower < self.keys[position - 1][1]:
+                raise ValueError('Class intervals must not overlap.')
+            if position < len(self.keys) and self.keys[position][0] < upper:
+                raise ValueError('Class intervals must not overlap.')
+
+    def _add(self, key, delta):
+        position = bisect_left(self.keys, key)
+        exists = position < len(self.keys) and self.keys[position] == key
+        old = self.weights[position] if exists else 0
+        new = old + delta
+        if old:
+            self.weight_keys[old].discard(key)
+            if not self.weight_keys[old]:
+                del self.weight_keys[old]
+        if new:
+            self.weight_keys.setdefault(new, set()).add(key)
+        if exists and new:
+            self.weights[position] = new
+        elif exists:
+            del self.keys[position]
+            del self.weights[position]
+        else:
+            self.keys.insert(position, key)
+            self.weights.insert(position, new)
+        del self.prefix[position:]
+        self.total += delta
+        midpoint = self._midpoint(key)
+        self.weighted_sum += midpoint * delta
+        self.square_sum += midpoint * midpoint * delta
+        self.cube_sum += midpoint * midpoint * midpoint * delta
+
+    def _midpoint(self, key):
+        if self.data_type == 'ungrouped':
+            return Fraction(key)
+        return (Fraction(key[0]) + Fraction(key[1])) / 2
+
+    def _cumulative(self):
+        valid = len(self.prefix)
+        if valid < len(self.weights):
+            start = self.prefix[-1] if self.prefix else 0
+            self.prefix.extend(accumulate(self.weights[valid:], initial=start))
+            del self.prefix[valid]
+        return self.prefix
+
+    def _ungrouped_statistics(self):
+        total = self.total
+        if not total:
+            return {'total_frequency': 0, 'mean': None, 'median': None, 'mode_display': 'None', 'mode_values': []}
+        cumulative = self._cumulative()
+        if total % 2 == 1:
+            median_value = self.keys[bisect_right(cumulative, total // 2)]
+        else:
+            median_value = (self.keys[bisect_right(cumulative, total // 2 - 1)] +
+                            self.keys[bisect_right(cumulative, total // 2)]) / 2
+
+        modal_keys = self.weight_keys[max(self.weight_keys)]
+        mode_values = []
+        if len(self.keys) == 1 or len(modal_keys) < len(self.keys):
+            mode_values = sorted(modal_keys)
+        mode_display = ', '.join(str(format_number(value)) for value in mode_values) if mode_values else 'None'
+        return {
+            'total_frequency': total,
+            'mean': float(self.weighted_sum / total),
+            'median': median_value,
+            'mode_display': mode_display,
+            'mode_values': mode_values,
+        }
+
+    def _grouped_statistics(self):
+        total = self.total
+        if not total:
+            return {'total_frequency': 0, 'mean': None, 'median': None, 'mode': None, 'mode_display': '—',
+                    'modal_label': '—', 'modal_index': None}
+        cumulative = self._cumulative()
+        median_index = bisect_left(cumulative, total / 2)
+        cumulative_before = cumulative[median_index - 1] if median_index else 0
+        median_value = grouped_median(self._class(median_index), cumulative_before, total)
+
+        modal_index = bisect_left(self.keys, min(self.weight_keys[max(self.weight_keys)]))
+        modal_class = self._class(modal_index)
+        prev_freq = self.weights[modal_index - 1] if modal_index > 0 else 0
+        next_freq = self.weights[modal_index + 1] if modal_index < len(self.weights) - 1 else 0
+        mode_value = grouped_mode(modal_class, prev_freq, next_freq)
+        return {
+            'total_frequency': total,
+            'mean': float(self.weighted_sum / total),
+            'median': median_value,
+            'mode': mode_value,
+            'mode_display': str(format_number(mode_value)) if mode_value is not None else '—',
+            'modal_label': grouped_modal_label(modal_class),
+            'modal_index': modal_index,
+        }
+
+    def _moments(self):
+        # Central moments from the exact power sums, rounded to floats only at the end
+        mean = self.weighted_sum / self.total
+        m2 = self.square_sum - mean * self.weighted_sum
+        m3 = self.cube_sum - 3 * mean * self.square_sum + 2 * self.total * mean ** 3
+        return WeightedMoments(self.total, float(mean), float(m2), float(m3))
+
+    def _grouped_quantile(self, fraction):
+        # Same interpolation as descriptive.grouped_quantile, reading the sorted classes in place
+        cumulative = self._cumulative()
+        index = bisect_left(cumulative, self.total * fraction)
+        before = cumulative[index - 1] if index else 0
+        (lower, upper), frequency = self.keys[index], self.weights[index]
+        return lower + ((self.total * fraction - before) / frequency) * (upper - lower)
+
+    def _class(self, index):
+        (lower, upper), frequency = self.keys[index], self.weights[index]
+        return {'lower': lower, 'upper': upper, 'frequency': frequency}
+
+
+def create_session(data_type, rows=None):
+    session = IncrementalStatistics(data_type)
+    row_ids = session.append(rows) if rows else []
+    session.edits.clear()
+    _expire_sessions()
+    record = StatisticsSession.objects.create(
+        session_id=uuid.uuid4().hex, data_type=data_type, version=session.version,
+        snapshot_version=session.version, state=_dump(session))
+    _remember(record.session_id, session)
+    return record.session_id, session, row_ids
+
+
+def load_session(session_id):
+    record = _session_records().filter(session_id=session_id).only(*RECORD_FIELDS).first()
+    if record is None:
+        return None
+    return _session_state(record)
+
+
+def delete_session(session_id):
+    StatisticsSession.objects.filter(session_id=session_id).delete()
+    _memo.pop(session_id, None)
+
+
+@contextmanager
+def edit_session(session_id, expected_version=None):
+    # Yields the session (or None) with its row locked, and logs its changes if the block succeeds.
+    # SQLite's IMMEDIATE transactions (see DATABASES) serialise concurrent edits across workers.
+    # With expected_version, raises VersionConflict unless the session is still at that version.
+    with transaction.atomic():
+        record = _session_records().select_for_update().filter(session_id=session_id).only(*RECORD_FIELDS).first()
+        session = _session_state(record) if record is not None else None
+        if session is not None and expected_version is not None and session.version != expected_version:
+            raise VersionConflict(f'The session is at version {session.version}, not {expected_version}.')
+        try:
+            yield session
+            if session is not None and session.edits:
+                _store_edits(record, session)
+        except BaseException:
+            # The in-memory copy may hold an edit that was never stored; reload it next time
+            _memo.pop(session_id, None)
+            raise
+
+
+def _session_records():
+    expires = timezone.now() - timedelta(seconds=getattr(settings, 'STATISTICS_SESSION_TTL', 60 * 60 * 24))
+    return StatisticsSession.objects.filter(updated_at__gte=expires)
+
+
+def _session_state(record):
+    # Reuses this worker's copy when it is current, or brings it up to date from the edit log when it is
+    # no older than the snapshot; only otherwise is the snapshot unpickled
+    session = _memo.get(record.session_id)
+    if session is not None and session.version == record.version:
+        _memo.move_to_end(record.session_id)
+        return session
+    if session is None or not record.snapshot_version <= session.version < record.version:
+        state = StatisticsSession.objects.values_list('state', flat=True).get(pk=record.pk)
+        session = pickle.loads(state)
+    try:
+        edits = StatisticsSessionEdit.objects.filter(session_id=record.pk, version__gt=session.version)
+        for operation, row_id, rows in edits.order_by('version').values_list('operation', 'row_id', 'rows'):
+            session.replay(operation, row_id, rows)
+    except BaseException:
+        _memo.pop(record.session_id, None)
+        raise
+    _remember(record.session_id, session)
+    return session
+
+
+def _store_edits(record, session):
+    # Each change is one row in the edit log, so editing a row writes the same amount whatever the size
+    # of the table. Once the log holds more rows than the table (and at least
+    # STATISTICS_SESSION_COMPACT_MIN_ROWS), the snapshot is rewritten and the log cleared, which keeps
+    # the cost per changed row constant on average and bounds how much a cold load replays.
+    logged_rows = record.logged_rows + sum(len(rows) if operation == 'append' else 1
+                                           for _, operation, _, rows in session.edits)
+    changes = {'version': session.version, 'updated_at': timezone.now()}
+    if logged_rows > max(len(session.rows), getattr(settings, 'STATISTICS_SESSION_COMPACT_MIN_ROWS', 1000)):
+        StatisticsSessionEdit.objects.filter(session_id=record.pk).delete()
+        changes.update(state=_dump(session), snapshot_version=session.version, logged_rows=0)
+    else:
+        StatisticsSessionEdit.objects.bulk_create(
+            StatisticsSessionEdit(session_id=record.pk, version=version, operation=operation, row_id=row_id, rows=rows)
+            for version, operation, row_id, rows in session.edits)
+        changes['logged_rows'] = logged_rows
+    StatisticsSession.objects.filter(pk=record.pk).update(**changes)
+    session.edits.clear()
+
+
+def _remember(session_id, session):
+    _memo[session_id] = session
+    _memo.move_to_end(session_id)
+    while len(_memo) > getattr(settings, 'STATISTICS_SESSION_MEMO_SIZE', 32):
+        _memo.popitem(last=False)
+
+
+def _dump(session):
+    return pickle.dumps(session, pickle.HIGHEST_PROTOCOL)
+
+
+def _expire_sessions():
+    expires = timezone.now() - timedelta(seconds=getattr(settings, 'STATISTICS_SESSION_TTL', 60 * 60 * 24))
+    StatisticsSession.objects.filter(updated_at__lt=expires).delete()
@@ -0,0 +1,197 @@
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request
+
+from .benchmarks import grouped_dataset, ungrouped_dataset
+from .startup import csrf_session
+
+# Scenario -> relative weight in the default mix
+DEFAULT_MIX = {
+    'statistics-ungrouped': 3,
+    'statistics-grouped': 3,
+    'reservation-submit': 2,
+    'reservation-page': 1,
+    'hello-function': 2,
+    'hello-class': 2,
+    'menu': 1,
+}
+SCENARIOS = tuple(DEFAULT_MIX)
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p95', 0.95), ('p99', 0.99))
+# Statistics answered by admission control without their charts; a 200, but not a normal one
+DEGRADED_MARKER = b'"charts_skipped":true'
+
+
+def parse_mix(value):
+    # "statistics-grouped=5,hello-function=1"; scenarios left out are not sent
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario "{name}"; choose from {", ".join(SCENARIOS)}.')
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f'"{weight}" is not a valid weight for {name}.')
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError('At least one scenario needs a positive weight.')
+    return mix
+
+
+class Workload:
+    # Statistics tables are generated once per size; each request adds one random row (or class) after
+    # the generated ones, so stored runs and cached charts cannot answer it unless reuse_payloads is set
+    def __init__(self, mix, sizes, seed, chart_format='png', reuse_payloads=False):
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.sizes = sizes
+        self.chart_format = chart_format
+        self.reuse_payloads = reuse_payloads
+        self.tables = {}
+        for size in sizes:
+            rng = random.Random(f'{seed}:{size}')
+            for data_type, generate in (('ungrouped', ungrouped_dataset), ('grouped', grouped_dataset)):
+                rows = generate(size, rng)
+                self.tables[data_type, size] = (json.dumps(rows)[1:-1], rows[-1])
+
+    def request(self, rng, base_url, csrf_token):
+        name = rng.choices(self.names, self.weights)[0]
+        if name.startswith('statistics-'):
+            size = rng.choice(self.sizes)
+            body = self._statistics_body(name.partition('-')[2], size, rng)
+            return f'{name}-{size}', Request(f'{base_url}/app/statistics', data=body, method='POST', headers={
+                'Content-Type': 'application/json', 'X-CSRFToken': csrf_token})
+        if name == 'reservation-submit':
+            form = {
+                'csrfmiddlewaretoken': csrf_token,
+                'first_name': rng.choice(('Abebe', 'Hana', 'Selam', 'Yonas')),
+                'last_name': rng.choice(('Bekele', 'Tesfaye', 'Girma')),
+                'guest_count': rng.randint(1, 12),
+                'comments': 'load test',
+            }
+            return name, Request(f'{base_url}/app/reservation', data=urlencode(form).encode(), method='POST',
+                                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        path = {'reservation-page': 'reservation', 'hello-function': 'function', 'hello-class': 'class',
+                'menu': 'menu'}[name]
+        return name, Request(f'{base_url}/app/{path}')
+
+    def _statistics_body(self, data_type, size, rng):
+        rows, last = self.tables[data_type, size]
+        extra = ''
+        if not self.reuse_payloads:
+            if data_type == 'ungrouped':
+                extra = json.dumps({'value': str(size + rng.randint(0, 10 ** 6) / 1000),
+                                    'frequency': str(rng.randint(1, 10 ** 6))})
+            else:
+                lower, upper = (float(bound) for bound in last['interval'].split('-'))
+                extra = json.dumps({'interval': f'{upper}-{2 * upper - lower}', 'frequency': str(rng.randint(1, 10 ** 6))})
+            extra = ',' + extra
+        return (f'{{"dataType":"{data_type}","renderMode":"sync","chartFormat":"{self.chart_format}",'
+                f'"rows":[{rows}{extra}]}}').encode()
+
+
+def run_load(base_url, workload, concurrency, duration, max_requests=None, seed='load', timeout=120):
+    # Closed loop: every client sends its next request as soon as the previous one is answered
+    deadline = time.monotonic() + duration
+    issued = itertools.count()
+
+    def client(index):
+        rng = random.Random(f'{seed}:{index}')
+        opener, csrf_token = csrf_session(base_url)
+        records = {}
+        while time.monotonic() < deadline and (max_requests is None or next(issued) < max_requests):
+            name, request = workload.request(rng, base_url, csrf_token)
+            started = time.perf_counter()
+            try:
+                with opener.open(request, timeout=timeout) as response:
+                    degraded = DEGRADED_MARKER in response.read()
+                    status = response.status
+            except HTTPError as exc:
+                exc.read()
+                status, degraded = exc.code, False
+            except (URLError, OSError) as exc:
+                status, degraded = type(exc).__name__, False
+            record = records.setdefault(name, {'latencies': [], 'statuses': Counter(), 'degraded': 0})
+            record['latencies'].append(time.perf_counter() - started)
+            record['statuses'][status] += 1
+            record['degraded'] += degraded
+        return records
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        per_client = list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    merged = {}
+    for records in per_client:
+        for name, record in records.items():
+            target = merged.setdefault(name, {'latencies': [], 'statuses': Counter(), 'degraded': 0})
+            target['latencies'].extend(record['latencies'])
+            target['statuses'].update(record['statuses'])
+            target['degraded'] += record['degraded']
+    return merged, elapsed
+
+
+def summarize(records, elapsed):
+    endpoints = {name: _summary(record['latencies'], record['statuses'], record['degraded'], elapsed)
+                 for name, record in sorted(records.items())}
+    total = _summary([latency for record in records.values() for latency in record['latencies']],
+                     sum((record['statuses'] for record in records.values()), Counter()),
+                     sum(record['degraded'] for record in records.values()), elapsed)
+    return {'elapsed_s': round(elapsed, 3), 'total': total, 'endpoints': endpoints}
+
+
+def compare_reports(report, baseline):
+    # Ratio of new to old for the numbers worth watching between releases
+    changes = {}
+    for name, summary in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        changes[name] = {
+            key: round(summary['latency_ms'][key] / previous['latency_ms'][key] - 1, 4)
+            for key in ('p50', 'p99') if previous['latency_ms'].get(key)
+        }
+        if previous.get('rps'):
+            changes[name]['rps'] = round(summary['rps'] / previous['rps'] - 1, 4)
+        changes[name]['error_rate'] = round(summary['error_rate'] - previous['error_rate'], 4)
+        if 'degraded_rate' in previous:
+            changes[name]['degraded_rate'] = round(summary['degraded_rate'] - previous['degraded_rate'], 4)
+    return changes
+
+
+def _summary(latencies, statuses, degraded, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    errors = sum(total for status, total in statuses.items() if not isinstance(status, int) or status >= 400)
+    latency_ms = {}
+    if count:
+        latency_ms = {name: round(_percentile(latencies, fraction) * 1000, 2) for name, fraction in PERCENTILES}
+        latency_ms['mean'] = round(sum(latencies) / count * 1000, 2)
+        latency_ms['max'] = round(latencies[-1] * 1000, 2)
+    return {
+        'requests': count,
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0,
+        'degraded': degraded,
+        'degraded_rate': round(degraded / count, 4) if count else 0,
+        'rps': round(count / elapsed, 2) if elapsed else 0,
+        'statuses': {str(status): total for status, total in sorted(statuses.items(), key=str)},
+        'latency_ms': latency_ms,
+    }
+
+
+def _percentile(ordered, fraction):
+    # Linear interpolation between the two nearest ranks (numpy's default method)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
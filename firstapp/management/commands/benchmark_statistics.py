@@ -0,0 +1,86 @@
+import json
+import platform
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firstapp.benchmarks import build_datasets, compare, dataset_stages, measure, scratch_chart_caches
+
+
+class Command(BaseCommand):
+    help = ('Time parsing, statistics, chart rendering and the statistics view on synthetic datasets, '
+            'optionally failing when a stage is slower than a stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,10000,100000',
+                            help='Comma-separated row counts for the generated datasets.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per stage; the median is reported.')
+        parser.add_argument('--seed', default='statistics', help='Seed for the synthetic datasets.')
+        parser.add_argument('--only', default='', help='Only run datasets whose name contains this text.')
+        parser.add_argument('--render-max-rows', type=int, default=2000,
+                            help='Skip chart rendering and the view for datasets larger than this.')
+        parser.add_argument('--skip-view', action='store_true', help='Do not time statistics_view end to end.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare against results previously written with --output.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed slowdown against the baseline as a fraction (0.25 = 25%%).')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of whole numbers.')
+        if not sizes or min(sizes) < 1 or options['repeat'] < 1:
+            raise CommandError('--sizes and --repeat must be positive.')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as handle:
+                    baseline = json.load(handle)['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f'Could not read baseline {options["baseline"]}: {exc}')
+
+        results = {}
+        regressions = []
+        with scratch_chart_caches():
+            for name, dataset in build_datasets(sizes, options['seed']).items():
+                if options['only'] not in name:
+                    continue
+                stages = dataset_stages(dataset, options['render_max_rows'], not options['skip_view'])
+                for stage_name, stage in stages.items():
+                    key = f'{name}/{stage_name}'
+                    results[key] = measure(stage, options['repeat'])
+                    if baseline is not None:
+                        # Compared as it is measured, so the printed line carries its change
+                        regressions.extend(compare({key: results[key]}, baseline, options['threshold']))
+                    self.stdout.write(self._line(key, results[key]))
+
+        if options['output']:
+            report = {
+                'meta': {
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'seed': options['seed'],
+                    'repeat': options['repeat'],
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+
+        if baseline is not None:
+            for key in regressions:
+                result = results[key]
+                self.stdout.write(self.style.ERROR(
+                    f'REGRESSION {key}: {result["baseline_median_s"] * 1000:.2f} ms -> '
+                    f'{result["median_s"] * 1000:.2f} ms ({result["change"]:+.0%})'))
+            if regressions:
+                raise CommandError(f'{len(regressions)} stage(s) slower than the baseline by more than '
+                                   f'{options["threshold"]:.0%}.')
+            self.stdout.write(self.style.SUCCESS(f'No stage regressed by more than {options["threshold"]:.0%}.'))
+
+    def _line(self, key, result):
+        change = f'  {result["change"]:+.0%}' if 'change' in result else ''
+        return f'{key:<60} {result["median_s"] * 1000:>10.2f} ms  {result["peak_kib"]:>10.1f} KiB{change}'
@@ -0,0 +1,103 @@
+import json
+import platform
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firstapp.loadtest import SCENARIOS, Workload, compare_reports, parse_mix, run_load, summarize
+from firstapp.startup import local_server
+
+
+class Command(BaseCommand):
+    help = ('Send a mixed workload (statistics posts, reservation submissions, hello pages) to a local '
+            'gunicorn started for the run, or to --target, and report latency percentiles, error rates and '
+            'requests per second per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', help='Base URL of a running instance, e.g. http://127.0.0.1:8000. '
+                                             'Without it a local gunicorn is started for the run.')
+        parser.add_argument('--workers', type=int, default=3, help='Workers for the local gunicorn.')
+        parser.add_argument('--interface', choices=('wsgi', 'asgi'), default='wsgi',
+                            help='asgi runs gunicorn with uvicorn workers.')
+        parser.add_argument('--startup-mode', choices=('cold', 'warm', 'preload'), default='preload',
+                            help='GUNICORN_STARTUP_MODE for the local gunicorn.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Clients sending requests at once.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to send requests for.')
+        parser.add_argument('--requests', type=int, help='Stop after this many requests, if sooner.')
+        parser.add_argument('--mix', default='', help='Scenario weights, e.g. "statistics-grouped=5,hello-function=1". '
+                                                      f'Scenarios: {", ".join(SCENARIOS)}.')
+        parser.add_argument('--sizes', default='100,2000', help='Comma-separated row counts for statistics posts.')
+        parser.add_argument('--chart-format', choices=('png', 'svg'), default='png')
+        parser.add_argument('--reuse-payloads', action='store_true',
+                            help='Send identical statistics tables so stored runs and cached charts answer them.')
+        parser.add_argument('--seed', default='load', help='Seed for the generated tables and the request order.')
+        parser.add_argument('--timeout', type=float, default=120, help='Seconds to wait for a single response.')
+        parser.add_argument('--output', help='Write the report as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare against a report previously written with --output.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of whole numbers.')
+        if not sizes or min(sizes) < 1 or options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('--sizes, --concurrency and --duration must be positive.')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Could not read baseline {options["baseline"]}: {exc}')
+
+        workload = Workload(mix, sizes, options['seed'], options['chart_format'], options['reuse_payloads'])
+        if options['target']:
+            server = nullcontext((None, options['target'].rstrip('/'), None))
+        else:
+            server = local_server(options['startup_mode'], options['workers'], 60, options['interface'])
+        try:
+            with server as (_, base_url, _):
+                self.stdout.write(f'Sending requests to {base_url} from {options["concurrency"]} clients...')
+                records, elapsed = run_load(base_url, workload, options['concurrency'], options['duration'],
+                                            options['requests'], options['seed'], options['timeout'])
+        except (RuntimeError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        report = summarize(records, elapsed)
+        report['meta'] = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'target': options['target'] or f'local gunicorn ({options["interface"]}, {options["workers"]} workers, '
+                                            f'{options["startup_mode"]})',
+            'concurrency': options['concurrency'],
+            'duration_s': options['duration'],
+            'mix': mix,
+            'sizes': sizes,
+            'chart_format': options['chart_format'],
+            'reuse_payloads': options['reuse_payloads'],
+            'seed': options['seed'],
+        }
+        if baseline is not None:
+            report['changes'] = compare_reports(report, baseline)
+
+        for name, summary in [*report['endpoints'].items(), ('total', report['total'])]:
+            self.stdout.write(self._line(name, summary, report.get('changes', {}).get(name)))
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+
+    def _line(self, name, summary, change):
+        latency = summary['latency_ms']
+        line = (f'{name:<28} {summary["requests"]:>7} req {summary["rps"]:>8.1f}/s '
+                f'err {summary["error_rate"]:>6.1%}  degraded {summary["degraded_rate"]:>6.1%}  '
+                f'p50 {latency.get("p50", 0):>8.1f} ms  p99 {latency.get("p99", 0):>8.1f} ms')
+        if change:
+            line += '  ' + ' '.join(f'{key} {value:+.0%}' for key, value in change.items()
+                                    if key not in ('error_rate', 'degraded_rate'))
+        return line
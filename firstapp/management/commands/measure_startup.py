@@ -0,0 +1,59 @@
+import json
+import statistics as pystats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firstapp.startup import measure_imports, measure_server
+
+STARTUP_MODES = ('cold', 'warm', 'preload')
+
+
+class Command(BaseCommand):
+    help = ('Measure import time, time to the first statistics request and memory per worker for each '
+            'gunicorn startup mode (GUNICORN_STARTUP_MODE in docker/gunicorn.conf.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(STARTUP_MODES), help='Comma-separated startup modes to compare.')
+        parser.add_argument('--workers', type=int, default=3, help='gunicorn workers per run.')
+        parser.add_argument('--rounds', type=int, default=2,
+                            help='Rounds of one concurrent statistics request per worker; the first round is cold.')
+        parser.add_argument('--interface', choices=('wsgi', 'asgi'), default='wsgi')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for gunicorn to answer.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        if not modes or any(mode not in STARTUP_MODES for mode in modes):
+            raise CommandError(f'--modes must be a comma-separated list of {", ".join(STARTUP_MODES)}.')
+        if options['workers'] < 1 or options['rounds'] < 1:
+            raise CommandError('--workers and --rounds must be positive.')
+
+        imports = measure_imports()
+        self.stdout.write('Fresh interpreter: ' + ', '.join(
+            f'{name} {value * 1000:.0f} ms' if name.endswith('_s') else f'{name} {value}'
+            for name, value in imports.items()))
+
+        servers = []
+        for mode in modes:
+            try:
+                result = measure_server(mode, options['workers'], options['rounds'], options['timeout'],
+                                        options['interface'])
+            except RuntimeError as exc:
+                raise CommandError(f'{mode}: {exc}')
+            servers.append(result)
+            self.stdout.write(self._summary(result))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump({'imports': imports, 'servers': servers}, handle, indent=2)
+
+    def _summary(self, result):
+        rounds = ', '.join(f'round {index} max {max(latencies):.0f} ms'
+                           for index, latencies in enumerate(result['rounds_ms'], start=1))
+        workers = [memory for memory in result['worker_memory'] if memory.get('rss_kib') is not None]
+        memory = 'memory unavailable'
+        if workers:
+            memory = (f'worker RSS {pystats.median(m["rss_kib"] for m in workers) / 1024:.1f} MiB, '
+                      f'PSS {pystats.median(m["pss_kib"] for m in workers) / 1024:.1f} MiB, '
+                      f'USS {pystats.median(m["uss_kib"] for m in workers) / 1024:.1f} MiB (medians)')
+        return f'{result["mode"]:<8} ready {result["ready_s"] * 1000:.0f} ms; {rounds}; {memory}'
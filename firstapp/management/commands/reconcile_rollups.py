@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from firstapp.rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = ('Recount the per-day reservation rollups from the reservation table and rewrite the days that '
+            'are out of step. Safe to run while the site is serving requests; schedule it to repair drift '
+            'from writes that bypass model signals.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report days that are out of step, and exit with status 1 if there are any.')
+
+    def handle(self, *args, **options):
+        mismatches = reconcile_rollups(fix=not options['check'])
+        for day, stored, counted in mismatches:
+            self.stdout.write(f'{day.isoformat()}: rollup {stored[0]} reservations / {stored[1]} guests, '
+                              f'table {counted[0]} / {counted[1]}')
+        if options['check'] and mismatches:
+            raise CommandError(f'{len(mismatches)} day(s) out of step.')
+        verb = 'out of step' if options['check'] else 'rewritten'
+        self.stdout.write(f'{len(mismatches)} day(s) {verb}.')
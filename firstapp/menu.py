@@ -0,0 +1,88 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .metrics import record_cache_lookup
+from .models import Menuitem
+
+VERSION_KEY = 'menu:version'
+LATEST_KEY = 'menu:latest'
+
+
+def get_menu_cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'menu')]
+
+
+def get_menu():
+    # Returns {'version', 'body', 'etag', 'last_modified'}; only a rebuild after a change reads the database
+    cache = get_menu_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY, version, timeout=None):
+            version = cache.get(VERSION_KEY, version)
+
+    entry = cache.get(_entry_key(version))
+    record_cache_lookup('menu', entry is not None)
+    if entry is not None:
+        return entry
+
+    # Stampede guard: one worker rebuilds a new version, the rest keep serving the previous menu
+    lock_timeout = getattr(settings, 'MENU_REBUILD_LOCK_TIMEOUT', 10)
+    if cache.add(_lock_key(version), True, timeout=lock_timeout):
+        try:
+            return _rebuild(cache, version)
+        finally:
+            cache.delete(_lock_key(version))
+
+    latest = cache.get(LATEST_KEY)
+    if latest is not None:
+        return latest
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(_entry_key(version))
+        if entry is not None:
+            return entry
+    return _rebuild(cache, version)
+
+
+def invalidate_menu():
+    get_menu_cache().set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def _rebuild(cache, version):
+    items = list(Menuitem.objects.order_by('id').values('id', 'name', 'price'))
+    body = json.dumps({'items': items}).encode('utf-8')
+    entry = {
+        'version': version,
+        'body': body,
+        'etag': hashlib.sha256(body).hexdigest(),
+        'last_modified': version / 1e9,
+    }
+    cache.set(_entry_key(version), entry, timeout=None)
+    latest = cache.get(LATEST_KEY)
+    if latest is None or latest['version'] <= version:
+        cache.set(LATEST_KEY, entry, timeout=None)
+    return entry
+
+
+def _entry_key(version):
+    return f'menu:{version}'
+
+
+def _lock_key(version):
+    return f'menu:{version}:rebuild'
+
+
+@receiver(post_save, sender=Menuitem)
+@receiver(post_delete, sender=Menuitem)
+def _menu_changed(sender, **kwargs):
+    # Wait for the commit so a rebuild cannot read the menu from before the change
+    transaction.on_commit(invalidate_menu)
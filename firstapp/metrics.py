@@ -0,0 +1,97 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# With PROMETHEUS_MULTIPROC_DIR set (see docker/entrypoint.sh) every gunicorn worker writes its samples
+# to that shared directory and /metrics adds them up, so any worker can answer the scrape.
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name.', ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size by URL name.', ['view'],
+    buckets=tuple(256 * 4 ** power for power in range(10)),
+)
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being handled.', multiprocess_mode='livesum')
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result.', ['cache', 'result'])
+ADMISSION_REQUESTS = Counter('statistics_admission_total',
+                             'Expensive statistics requests by admission result.', ['result'])
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def record_admission(result):
+    ADMISSION_REQUESTS.labels(result).inc()
+
+
+def cache_lookup_counts(cache):
+    # Read back from the same registry /metrics serves, so the counts cover every worker
+    registry = _registry()
+    return tuple(int(registry.get_sample_value('cache_requests_total', {'cache': cache, 'result': result}) or 0)
+                 for result in ('hit', 'miss'))
+
+
+def render_metrics():
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            IN_FLIGHT.dec()
+        _observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            IN_FLIGHT.dec()
+        _observe(request, response, time.perf_counter() - started)
+        return response
+
+
+def _observe(request, response, seconds):
+    view = _view_label(request)
+    REQUEST_LATENCY.labels(view, request.method, str(response.status_code)).observe(seconds)
+    if not response.streaming:
+        RESPONSE_SIZE.labels(view).observe(len(response.content))
+
+
+def _view_label(request):
+    # URL names (or the route for unnamed patterns) keep label cardinality bounded
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    if match.url_name:
+        return match.url_name
+    return match.route or match.view_name
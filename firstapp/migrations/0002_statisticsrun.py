@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('input_hash', models.CharField(max_length=64, unique=True)),
+                ('data_type', models.CharField(max_length=16)),
+                ('total_frequency', models.BigIntegerField()),
+                ('mean', models.FloatField(null=True)),
+                ('median', models.FloatField(null=True)),
+                ('mode', models.TextField()),
+                ('modal_label', models.CharField(max_length=255)),
+                ('charts', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
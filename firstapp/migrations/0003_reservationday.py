@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:22
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_reservation_days(apps, schema_editor):
+    Reservation = apps.get_model('firstapp', 'Reservation')
+    ReservationDay = apps.get_model('firstapp', 'ReservationDay')
+    days = (Reservation.objects.values('reservation_time')
+            .annotate(reservations=Count('id'), guests=Sum('guest_count')))
+    ReservationDay.objects.bulk_create(
+        [ReservationDay(day=row['reservation_time'], reservations=row['reservations'], guests=row['guests'] or 0)
+         for row in days],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0002_statisticsrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('reservations', models.BigIntegerField(default=0)),
+                ('guests', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='reservation_time',
+            field=models.DateField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(build_reservation_days, migrations.RunPython.noop),
+    ]
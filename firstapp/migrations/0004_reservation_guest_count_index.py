@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0003_reservationday'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='guest_count',
+            field=models.IntegerField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0004_reservation_guest_count_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=32, unique=True)),
+                ('data_type', models.CharField(max_length=16)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('state', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
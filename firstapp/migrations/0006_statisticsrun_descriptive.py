@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0005_statisticssession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statisticsrun',
+            name='descriptive',
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0006_statisticsrun_descriptive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statisticssession',
+            name='logged_rows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='statisticssession',
+            name='snapshot_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StatisticsSessionEdit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('operation', models.CharField(max_length=8)),
+                ('row_id', models.PositiveIntegerField(null=True)),
+                ('rows', models.JSONField(null=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='edits', to='firstapp.statisticssession')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('session', 'version'), name='unique_session_edit_version')],
+            },
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 # Create your models here.
 class Menuitem(models.Model):
@@ -8,6 +8,59 @@ class Menuitem(models.Model):
 class Reservation(models.Model):
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
-    guest_count = models.IntegerField()
-    reservation_time = models.DateField(auto_now=True)
-    comments = models.CharField(max_length=1000)
\ No newline at end of file
+    guest_count = models.IntegerField(db_index=True)
+    reservation_time = models.DateField(auto_now=True, db_index=True)
+    comments = models.CharField(max_length=1000)
+
+    def save(self, *args, **kwargs):
+        # firstapp.rollups updates the per-day totals from post_save, which Django sends after the
+        # insert; one transaction around both keeps them from drifting apart if either fails
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class StatisticsRun(models.Model):
+    input_hash = models.CharField(max_length=64, unique=True)
+    data_type = models.CharField(max_length=16)
+    total_frequency = models.BigIntegerField()
+    mean = models.FloatField(null=True)
+    median = models.FloatField(null=True)
+    mode = models.TextField()
+    modal_label = models.CharField(max_length=255)
+    # Variance, quartiles, requested percentiles, etc. exactly as they appear in the response
+    descriptive = models.JSONField(default=dict)
+    # Chart format -> {chart name: content hash of the image in the chart image cache}
+    charts = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class ReservationDay(models.Model):
+    # Running totals per reservation_time, kept in step with Reservation by firstapp.rollups
+    day = models.DateField(unique=True)
+    reservations = models.BigIntegerField(default=0)
+    guests = models.BigIntegerField(default=0)
+
+
+class StatisticsSession(models.Model):
+    # A table edited row by row through statistics/sessions. state is a pickled IncrementalStatistics as
+    # of snapshot_version; the changes made since are in StatisticsSessionEdit.
+    session_id = models.CharField(max_length=32, unique=True)
+    data_type = models.CharField(max_length=16)
+    version = models.PositiveIntegerField(default=0)
+    state = models.BinaryField()
+    snapshot_version = models.PositiveIntegerField(default=0)
+    # Rows appended, updated or removed since the snapshot, to decide when to write a new one
+    logged_rows = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class StatisticsSessionEdit(models.Model):
+    # One append, update or removal, replayed in version order on top of the session's snapshot
+    session = models.ForeignKey(StatisticsSession, on_delete=models.CASCADE, related_name='edits')
+    version = models.PositiveIntegerField()
+    operation = models.CharField(max_length=8)
+    row_id = models.PositiveIntegerField(null=True)
+    # The rows as submitted: a list for appends, one row for updates
+    rows = models.JSONField(null=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['session', 'version'], name='unique_session_edit_version')]
@@ -0,0 +1,144 @@
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+
+from .chart_cache import set_cached_chart, store_chart_image
+from .runs import add_run_charts
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_queue_slots = None
+
+
+def get_render_executor():
+    global _executor, _queue_slots
+    with _executor_lock:
+        if _executor is None:
+            # Not fork: the web worker has threads (and their locks) that a forked child would inherit
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'STATISTICS_RENDER_WORKERS', 2),
+                mp_context=multiprocessing.get_context(getattr(settings, 'STATISTICS_RENDER_START_METHOD', 'forkserver')),
+                initializer=django.setup,
+            )
+        if _queue_slots is None:
+            _queue_slots = threading.BoundedSemaphore(getattr(settings, 'STATISTICS_RENDER_QUEUE_LIMIT', 16))
+        return _executor
+
+
+def discard_render_executor(executor):
+    # A pool whose worker died refuses all further work; the next caller starts a fresh one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def get_job_cache():
+    return caches[getattr(settings, 'RENDER_JOB_CACHE_ALIAS', 'render_jobs')]
+
+
+def submit_chart_job(chart_specs, ready, image_mode, chart_format, run_id=None):
+    # Returns None when the render queue is full so the caller can render inline instead
+    executor = get_render_executor()
+    if not _queue_slots.acquire(blocking=False):
+        return None
+
+    job_id = uuid.uuid4().hex
+    get_job_cache().set(_job_key(job_id), {'status': 'pending', 'image_mode': image_mode, 'chart_format': chart_format,
+                                           'started': time.time()})
+    tasks = {name: (spec['render'], spec['args']) for name, spec in chart_specs.items()}
+    try:
+        future = executor.submit(render_charts, tasks)
+    except Exception as exc:
+        _queue_slots.release()
+        get_job_cache().delete(_job_key(job_id))
+        if isinstance(exc, BrokenProcessPool):
+            discard_render_executor(executor)
+        raise
+    future.add_done_callback(
+        lambda done: _finish_job(job_id, executor, chart_specs, ready, image_mode, chart_format, run_id, done))
+    return job_id
+
+
+def submit_render(render, args):
+    # One chart for a request waiting on it; takes a render queue slot like a job, None when there is none
+    executor = get_render_executor()
+    if not _queue_slots.acquire(blocking=False):
+        return None
+    try:
+        future = executor.submit(render, *args)
+    except Exception as exc:
+        _queue_slots.release()
+        if isinstance(exc, BrokenProcessPool):
+            discard_render_executor(executor)
+        raise
+    future.add_done_callback(lambda done: _finish_render(executor, done))
+    return future
+
+
+def render_queue_has_room():
+    # Whether submit_chart_job would take a job now; another request may still fill the queue first
+    if _queue_slots is None:
+        return True
+    if not _queue_slots.acquire(blocking=False):
+        return False
+    _queue_slots.release()
+    return True
+
+
+def get_chart_job(job_id):
+    job = get_job_cache().get(_job_key(job_id))
+    if (job is not None and job['status'] == 'pending'
+            and time.time() - job['started'] > getattr(settings, 'STATISTICS_RENDER_JOB_TIMEOUT', 120)):
+        # The process that would have recorded the outcome is gone (a restarted web worker, say)
+        job = {**job, 'status': 'failed', 'error': 'Chart rendering did not finish in time.'}
+        get_job_cache().set(_job_key(job_id), job)
+    return job
+
+
+def render_charts(tasks):
+    return {name: render(*args) for name, (render, args) in tasks.items()}
+
+
+def _finish_job(job_id, executor, chart_specs, ready, image_mode, chart_format, run_id, future):
+    try:
+        rendered = future.result()
+        for name, image in rendered.items():
+            spec = chart_specs[name]
+            if image is not None:
+                set_cached_chart(spec['kind'], spec['data'], spec['params'], image)
+        images = {name: store_chart_image(image) if image is not None else None
+                  for name, image in {**ready, **rendered}.items()}
+        if run_id is not None:
+            add_run_charts(run_id, chart_format, images)
+        job = {'status': 'done', 'image_mode': image_mode, 'chart_format': chart_format, 'images': images}
+    except Exception as exc:
+        logger.exception('Chart job %s failed', job_id)
+        if isinstance(exc, BrokenProcessPool):
+            discard_render_executor(executor)
+        job = {'status': 'failed', 'image_mode': image_mode, 'chart_format': chart_format,
+               'error': 'Chart rendering failed.'}
+    finally:
+        _queue_slots.release()
+    get_job_cache().set(_job_key(job_id), job)
+
+
+def _finish_render(executor, future):
+    _queue_slots.release()
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        discard_render_executor(executor)
+
+
+def _job_key(job_id):
+    return 'chart-job:' + job_id
@@ -0,0 +1,90 @@
+import base64
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .forms import ReservationForm
+from .models import Reservation, ReservationDay
+from .rollups import record_reservations
+from .write_behind import enqueue_reservation, write_behind_enabled
+
+
+def save_reservation(form):
+    # Returns 'saved', 'queued', 'committed' or 'pending' (see write_behind.enqueue_reservation)
+    reservation = form.save(commit=False)
+    if write_behind_enabled():
+        status = enqueue_reservation(reservation)
+        if status is not None:
+            return status
+    reservation.save()
+    return 'saved'
+
+
+def validate_reservations(rows):
+    valid = []
+    errors = []
+    for index, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': index, 'errors': {'__all__': ['Each reservation must be an object.']}})
+            continue
+        form = ReservationForm(data=row)
+        if form.is_valid():
+            valid.append(form.save(commit=False))
+        else:
+            errors.append({'row': index, 'errors': {field: list(messages) for field, messages in form.errors.items()}})
+    return valid, errors
+
+
+def bulk_create_reservations(reservations):
+    batch_size = getattr(settings, 'RESERVATION_BULK_BATCH_SIZE', 500)
+    for start in range(0, len(reservations), batch_size):
+        # One transaction per batch keeps each SQLite write lock short
+        with transaction.atomic():
+            batch = Reservation.objects.bulk_create(reservations[start:start + batch_size])
+            record_reservations(batch)
+    return len(reservations)
+
+
+def reservation_report(start, end, period):
+    # Reads at most one rollup row per day in the range, however many reservations exist
+    totals = {day: (count, guests) for day, count, guests in
+              ReservationDay.objects.filter(day__range=(start, end)).values_list('day', 'reservations', 'guests')}
+    buckets = {}
+    day = start
+    while day <= end:
+        bucket = day - timedelta(days=day.weekday()) if period == 'week' else day
+        count, guests = totals.get(day, (0, 0))
+        entry = buckets.setdefault(bucket, {'start': bucket.isoformat(), 'reservations': 0, 'guests': 0})
+        entry['reservations'] += count
+        entry['guests'] += guests
+        day += timedelta(days=1)
+    return list(buckets.values())
+
+
+def list_reservations(cursor, limit):
+    # Keyset pagination on (reservation_time, id): every page is an index range scan, however deep
+    queryset = Reservation.objects.order_by('reservation_time', 'id')
+    if cursor:
+        after_time, after_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(reservation_time__gt=after_time) | Q(reservation_time=after_time, id__gt=after_id))
+    rows = list(queryset.values(
+        'id', 'first_name', 'last_name', 'guest_count', 'reservation_time', 'comments')[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def encode_cursor(row):
+    key = f"{row['reservation_time'].isoformat()}:{row['id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        after_time, after_id = key.split(':')
+        return date.fromisoformat(after_time), int(after_id)
+    except ValueError:
+        raise ValueError('Invalid cursor.')
@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Reservation, ReservationDay
+
+
+def record_reservations(reservations, sign=1):
+    # bulk_create and the write-behind writer skip model signals, so they call this directly
+    totals = defaultdict(lambda: [0, 0])
+    for reservation in reservations:
+        day = totals[reservation.reservation_time]
+        day[0] += sign
+        day[1] += sign * reservation.guest_count
+    for day, (count, guests) in totals.items():
+        _add_to_day(day, count, guests)
+
+
+def _add_to_day(day, count, guests):
+    if not count and not guests:
+        return
+    updated = ReservationDay.objects.filter(day=day).update(
+        reservations=F('reservations') + count, guests=F('guests') + guests)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            ReservationDay.objects.create(day=day, reservations=count, guests=guests)
+    except IntegrityError:
+        # Another writer created the row first
+        ReservationDay.objects.filter(day=day).update(
+            reservations=F('reservations') + count, guests=F('guests') + guests)
+
+
+@receiver(pre_save, sender=Reservation)
+def _remember_previous_totals(sender, instance, raw=False, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk is not None and not raw:
+        instance._rollup_previous = (
+            Reservation.objects.filter(pk=instance.pk).values_list('reservation_time', 'guest_count').first())
+
+
+@receiver(post_save, sender=Reservation)
+def _reservation_saved(sender, instance, created, raw=False, **kwargs):
+    # Reservation.save() runs the insert and this handler in one transaction
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        _add_to_day(previous[0], -1, -previous[1])
+    _add_to_day(instance.reservation_time, 1, instance.guest_count)
+
+
+@receiver(post_delete, sender=Reservation)
+def _reservation_deleted(sender, instance, **kwargs):
+    # Sent inside the deletion's own transaction
+    _add_to_day(instance.reservation_time, -1, -instance.guest_count)
+
+
+def reconcile_rollups(fix=True):
+    # Recounts every day from the reservation table, for changes that skip the signals (QuerySet.update,
+    # raw SQL, restores). Returns [(day, (stored reservations, guests), (counted reservations, guests))]
+    # for each day that was out of step, rewriting those days unless fix is False. One transaction, so
+    # (with SQLite's IMMEDIATE mode) no reservation is written between the count and the fix.
+    with transaction.atomic():
+        counted = {day: (count, guests or 0) for day, count, guests in Reservation.objects.order_by()
+                   .values('reservation_time').annotate(count=Count('id'), guests=Sum('guest_count'))
+                   .values_list('reservation_time', 'count', 'guests')}
+        stored = {day: (count, guests) for day, count, guests in
+                  ReservationDay.objects.values_list('day', 'reservations', 'guests')}
+        mismatches = [(day, stored.get(day, (0, 0)), counted.get(day, (0, 0)))
+                      for day in sorted(counted.keys() | stored.keys())
+                      if stored.get(day, (0, 0)) != counted.get(day, (0, 0))]
+        if fix:
+            for day, _, (count, guests) in mismatches:
+                ReservationDay.objects.update_or_create(day=day, defaults={'reservations': count, 'guests': guests})
+    return mismatches
@@ -0,0 +1,83 @@
+import hashlib
+import json
+
+from django.db import IntegrityError, connection, transaction
+
+from .models import StatisticsRun
+from .utils import format_number
+
+
+DESCRIPTIVE_FIELDS = ('variance', 'std_dev', 'sample_variance', 'sample_std_dev', 'skewness',
+                     'quartiles', 'iqr', 'percentiles', 'quantile_method')
+
+
+def statistics_input_hash(data_type, parsed, percentiles=()):
+    # Keyed on the parsed input rather than the submitted text, so number formatting, whitespace,
+    # blank rows, cumulative versus plain frequencies and the order of ungrouped rows share a run.
+    # The requested percentiles are part of the stored answer, so they are part of the key
+    if data_type == 'ungrouped':
+        frequencies = {}
+        for value, frequency in parsed:
+            frequencies[value] = frequencies.get(value, 0) + frequency
+        data = sorted(frequencies.items())
+    elif isinstance(parsed, dict):
+        data = list(zip(parsed['lower'].tolist(), parsed['upper'].tolist(), parsed['frequency'].tolist()))
+    else:
+        data = [(cls['lower'], cls['upper'], cls['frequency']) for cls in parsed]
+    canonical = json.dumps(
+        {'dataType': data_type, 'data': data, 'percentiles': list(percentiles)},
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def find_statistics_run(input_hash):
+    try:
+        return StatisticsRun.objects.get(input_hash=input_hash)
+    except StatisticsRun.DoesNotExist:
+        return None
+
+
+def save_statistics_run(input_hash, data_type, summary, chart_format=None, digests=None):
+    defaults = {
+        'data_type': data_type,
+        'total_frequency': summary['total_frequency'],
+        'mean': summary['mean'],
+        'median': summary['median'],
+        'mode': summary['mode'],
+        'modal_label': summary['modal_label'],
+        'descriptive': {field: summary[field] for field in DESCRIPTIVE_FIELDS if field in summary},
+    }
+    try:
+        run, _ = StatisticsRun.objects.get_or_create(input_hash=input_hash, defaults=defaults)
+    except IntegrityError:
+        # Another worker stored the same submission between our lookup and insert
+        run = StatisticsRun.objects.get(input_hash=input_hash)
+
+    if digests and run.charts.get(chart_format) != digests:
+        run.charts[chart_format] = digests
+        run.save(update_fields=['charts'])
+    return run
+
+
+def add_run_charts(run_id, chart_format, digests):
+    # Called when a queued render job finishes, on the pool's callback thread rather than in a request
+    connection.close_if_unusable_or_obsolete()
+    with transaction.atomic():
+        run = StatisticsRun.objects.select_for_update().filter(pk=run_id).first()
+        if run is not None and run.charts.get(chart_format) != digests:
+            run.charts[chart_format] = digests
+            run.save(update_fields=['charts'])
+
+
+def run_summary(run):
+    summary = {
+        'type': 'Ungrouped data' if run.data_type == 'ungrouped' else 'Grouped data',
+        'total_frequency': run.total_frequency,
+        'mean': format_number(run.mean),
+        'median': format_number(run.median),
+        'mode': run.mode,
+        'modal_label': run.modal_label,
+    }
+    summary.update(run.descriptive)
+    return summary
@@ -0,0 +1,91 @@
+import json
+import re
+import secrets
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Datetimes go through DjangoJSONEncoder so both backends format them the same way
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+_encoder = DjangoJSONEncoder()
+# Maps digits to b'0' and everything else to b' ', so a run of 19 digits is a plain substring search
+DIGIT_MASK = bytes(ord('0') if code in b'0123456789' else ord(' ') for code in range(256))
+
+
+class EncodedText(bytes):
+    # ASCII that is already safe inside a JSON string (base64 images), written out as-is instead of
+    # being scanned and escaped again by the encoder
+    __slots__ = ()
+
+
+def json_backend():
+    # JSON_BACKEND = 'auto' (orjson when installed), 'orjson' or 'json'
+    backend = getattr(settings, 'JSON_BACKEND', 'auto')
+    if backend == 'json' or orjson is None:
+        return 'json'
+    return 'orjson'
+
+
+def loads(data):
+    # Anything orjson refuses (NaN, invalid UTF-8, ...) is decoded by the standard library, so both backends
+    # accept the same input and raise the same errors. orjson reads integers over 64 bits as floats, so a
+    # body holding a run of 19 or more digits goes to the standard library as well.
+    if json_backend() == 'orjson' and not _long_digit_run(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def _long_digit_run(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8', 'surrogatepass')
+    return b'0' * 19 in data.translate(DIGIT_MASK)
+
+
+def dumps(data):
+    # Returns UTF-8 bytes. EncodedText values become placeholders during encoding and are spliced into
+    # the output afterwards, each in a single copy.
+    pieces = []
+    marker = secrets.token_hex(8)
+
+    def default(value):
+        if isinstance(value, EncodedText):
+            pieces.append(value)
+            return f'{marker}:{len(pieces) - 1}'
+        return _encoder.default(value)
+
+    body = None
+    if json_backend() == 'orjson':
+        try:
+            body = orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits; the standard library writes them exactly
+            pieces.clear()
+    if body is None:
+        body = json.dumps(data, cls=DjangoJSONEncoder, default=default, separators=(',', ':')).encode('utf-8')
+    if not pieces:
+        return body
+    placeholder = re.compile(b'"' + marker.encode('ascii') + rb':(\d+)"')
+    parts = placeholder.split(body)
+    # split() alternates literal output and placeholder indexes
+    for index in range(1, len(parts), 2):
+        parts[index] = b'"' + pieces[int(parts[index])] + b'"'
+    return b''.join(parts)
+
+
+class JsonResponse(HttpResponse):
+    # Drop-in for django.http.JsonResponse that encodes through dumps()
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
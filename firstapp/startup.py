@@ -0,0 +1,193 @@
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookiejar import CookieJar
+from urllib.error import URLError
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.conf import settings
+
+# Run in a fresh interpreter so nothing is imported yet; prints one JSON object
+IMPORT_PROBE = '''
+import json, resource, time
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls = time.perf_counter()
+from matplotlib.figure import Figure
+matplotlib = time.perf_counter()
+from firstapp.warmup import warm_up
+warm_up()
+warmed = time.perf_counter()
+print(json.dumps({
+    'django_setup_s': setup - started,
+    'urls_and_views_s': urls - setup,
+    'matplotlib_s': matplotlib - urls,
+    'first_charts_s': warmed - matplotlib,
+    'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+'''
+
+
+def measure_imports():
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=settings.BASE_DIR, env=os.environ.copy(),
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@contextmanager
+def local_server(mode, workers, timeout, interface='wsgi'):
+    # Runs gunicorn with docker/gunicorn.conf.py in the given GUNICORN_STARTUP_MODE on a free local port,
+    # yields (server process, base URL, seconds until it first answered) and stops it afterwards
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory(prefix='local-server-') as directory:
+        metrics_dir = os.path.join(directory, 'prometheus')
+        os.mkdir(metrics_dir)
+        env = {**os.environ, 'GUNICORN_STARTUP_MODE': mode, 'PROMETHEUS_MULTIPROC_DIR': metrics_dir,
+               **_database_copy(directory)}
+        command = [sys.executable, '-m', 'gunicorn', f'firstproject.{interface}:application',
+                   '--config', os.path.join(settings.BASE_DIR, 'docker', 'gunicorn.conf.py'),
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning']
+        if interface == 'asgi':
+            command += ['--worker-class', 'uvicorn.workers.UvicornWorker']
+        started = time.perf_counter()
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        try:
+            wait_until_ready(base_url, server, started + timeout)
+            yield server, base_url, time.perf_counter() - started
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+
+def _database_copy(directory):
+    # The server writes reservations and stored runs; give it a migrated copy of the SQLite database
+    # (through the DJANGO_DB_NAME override) so the one in BASE_DIR is left as it was
+    database = settings.DATABASES['default']
+    if database['ENGINE'] != 'django.db.backends.sqlite3':
+        return {}
+    env = {**os.environ, 'DJANGO_DB_NAME': os.path.join(directory, 'db.sqlite3')}
+    source, target = sqlite3.connect(database['NAME']), sqlite3.connect(env['DJANGO_DB_NAME'])
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput', '-v', '0'], cwd=settings.BASE_DIR, env=env,
+                   check=True)
+    return {'DJANGO_DB_NAME': env['DJANGO_DB_NAME']}
+
+
+def measure_server(mode, workers, rounds, timeout, interface='wsgi'):
+    # Reports how long gunicorn takes to answer, the latency of each round of `workers` concurrent
+    # statistics requests (the first round is the one each worker answers cold), and the memory of the
+    # master and every worker
+    with local_server(mode, workers, timeout, interface) as (server, base_url, ready):
+        opener, csrf_token = csrf_session(base_url)
+        latencies = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in range(rounds):
+                latencies.append(list(pool.map(
+                    lambda _: _timed_statistics_request(opener, base_url, csrf_token), range(workers))))
+        return {
+            'mode': mode,
+            'interface': interface,
+            'workers': workers,
+            'ready_s': ready,
+            'rounds_ms': [[round(seconds * 1000, 1) for seconds in latency] for latency in latencies],
+            'master': process_memory(server.pid),
+            'worker_memory': [process_memory(pid) for pid in child_pids(server.pid)],
+        }
+
+
+def csrf_session(base_url):
+    # An opener that keeps cookies, and the CSRF token the statistics page sets for the POSTs that follow
+    jar = CookieJar()
+    opener = build_opener(HTTPCookieProcessor(jar))
+    opener.open(f'{base_url}/app/statistics', timeout=30).read()
+    csrf_token = next((cookie.value for cookie in jar if cookie.name == settings.CSRF_COOKIE_NAME), '')
+    return opener, csrf_token
+
+
+def wait_until_ready(base_url, server, deadline):
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode} before answering.')
+        try:
+            build_opener().open(f'{base_url}/app/function', timeout=5).read()
+            return
+        except (URLError, ConnectionError):
+            if time.perf_counter() > deadline:
+                raise RuntimeError('gunicorn did not answer before the timeout.')
+            time.sleep(0.05)
+
+
+def process_memory(pid):
+    # RSS counts pages shared with the master; PSS splits them between sharers and USS leaves them out
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as handle:
+            for line in handle:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[name] = int(value.split()[0])
+    except OSError:
+        return {'pid': pid}
+    return {
+        'pid': pid,
+        'rss_kib': fields.get('Rss'),
+        'pss_kib': fields.get('Pss'),
+        'uss_kib': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as handle:
+                # The command name may contain spaces, so fields are counted from its closing parenthesis
+                parent = int(handle.read().rpartition(')')[2].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if parent == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def _timed_statistics_request(opener, base_url, csrf_token):
+    # New rows every time, so neither stored runs nor the chart cache can answer it
+    rng = random.Random()
+    rows = [{'value': str(rng.randint(0, 500) / 10), 'frequency': str(rng.randint(1, 20))} for _ in range(30)]
+    body = json.dumps({'dataType': 'ungrouped', 'rows': rows, 'renderMode': 'sync', 'chartFormat': 'png'})
+    request = Request(f'{base_url}/app/statistics', data=body.encode(), method='POST',
+                      headers={'Content-Type': 'application/json', 'X-CSRFToken': csrf_token})
+    started = time.perf_counter()
+    with opener.open(request, timeout=120) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
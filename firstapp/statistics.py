@@ -0,0 +1,301 @@
+import math
+import re
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from .descriptive import WeightedMoments, describe, grouped_quantile, parse_percentiles, ungrouped_quantile
+from .timing import timed_phase
+from .utils import format_number
+
+INTERVAL_PATTERN = re.compile(r'^(-?\d+(?:\.\d+)?)\s*[-–—]\s*(-?\d+(?:\.\d+)?)$')
+
+
+def _parse_decimal(value, label):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f'"{value}" is not a valid number for {label}.')
+
+
+def _parse_frequency(value, label, default=None):
+    if value is None or str(value).strip() == '':
+        if default is None:
+            raise ValueError(f'{label} is required.')
+        return default
+
+    freq = _parse_decimal(value, label)
+    if freq <= 0:
+        raise ValueError(f'{label} must be greater than zero.')
+    if freq != freq.to_integral_value():
+        raise ValueError(f'{label} must be a whole number.')
+    return int(freq)
+
+
+def parse_ungrouped_rows(rows, using_cumulative=False):
+    entries = list(iter_ungrouped_entries(rows, using_cumulative))
+    if not entries:
+        raise ValueError('Enter at least one value with a valid frequency.')
+
+    if using_cumulative:
+        processed = []
+        previous_cumulative = 0
+        for entry in sorted(entries, key=lambda item: (item['value'], item['index'])):
+            cumulative = entry['cumulative']
+            if cumulative <= previous_cumulative:
+                raise ValueError('Cumulative frequencies must strictly increase when using cumulative input.')
+            frequency = cumulative - previous_cumulative
+            processed.append((entry['value'], frequency))
+            previous_cumulative = cumulative
+        total_frequency = previous_cumulative
+    else:
+        processed = [(entry['value'], entry['frequency']) for entry in entries]
+        total_frequency = sum(freq for _, freq in processed)
+
+    if total_frequency <= 0:
+        raise ValueError('Total frequency must be greater than zero.')
+
+    return processed
+
+
+def iter_ungrouped_entries(rows, using_cumulative=False, start=1):
+    for index, row in enumerate(rows, start=start):
+        value_text = (row or {}).get('value', '').strip()
+        if not value_text:
+            continue
+
+        value = _parse_decimal(value_text, f'value (row {index})')
+        entry = {'value': float(value), 'index': index}
+
+        if using_cumulative:
+            cumulative_text = (row or {}).get('cumulative', '')
+            cumulative = _parse_frequency(cumulative_text, f'cumulative frequency (row {index})')
+            entry['cumulative'] = cumulative
+        else:
+            frequency_text = (row or {}).get('frequency', '')
+            frequency = _parse_frequency(frequency_text, f'frequency (row {index})', default=1)
+            entry['frequency'] = frequency
+
+        yield entry
+
+
+def _parse_interval(interval_text, index):
+    cleaned = interval_text.strip().lower().replace(' to ', '-')
+    match = INTERVAL_PATTERN.match(cleaned)
+    if not match:
+        raise ValueError(f'"{interval_text}" is not a valid interval on row {index}. Use formats like 50-60.')
+    lower = _parse_decimal(match.group(1), f'interval lower bound (row {index})')
+    upper = _parse_decimal(match.group(2), f'interval upper bound (row {index})')
+    if lower >= upper:
+        raise ValueError(f'Lower bound must be less than upper bound on row {index}.')
+    return float(lower), float(upper)
+
+
+def analyse_grouped_rows(rows, using_cumulative, percentiles=None):
+    with timed_phase('parse'):
+        parsed = parse_grouped_input(rows, using_cumulative)
+    with timed_phase('compute'):
+        return compute_grouped_input(parsed, percentiles)
+
+
+def parse_grouped_input(rows, using_cumulative):
+    # Returns a list of classes, or column arrays for tables large enough to vectorise
+    if isinstance(rows, list) and len(rows) >= getattr(settings, 'STATISTICS_VECTORIZE_THRESHOLD', 2000):
+        # numpy is only imported once a table is large enough to benefit from it
+        from .vectorized import parse_grouped_arrays
+
+        return parse_grouped_arrays(rows, using_cumulative)
+    return parse_grouped_rows(rows, using_cumulative)
+
+
+def compute_grouped_input(parsed, percentiles=None):
+    if isinstance(parsed, dict):
+        from .vectorized import classes_from_arrays, compute_grouped_arrays
+
+        return classes_from_arrays(parsed), compute_grouped_arrays(parsed, percentiles)
+    return parsed, compute_grouped_statistics(parsed, percentiles)
+
+
+def parse_grouped_rows(rows, using_cumulative):
+    classes = list(iter_grouped_classes(rows, using_cumulative))
+    if not classes:
+        raise ValueError('Enter at least one class interval with a valid frequency.')
+
+    total_frequency = sum(cls['frequency'] for cls in classes)
+    if total_frequency <= 0:
+        raise ValueError('Total frequency must be greater than zero.')
+
+    return classes
+
+
+def iter_grouped_classes(rows, using_cumulative, start=1):
+    previous_upper = None
+    previous_cumulative = 0
+
+    for index, row in enumerate(rows, start=start):
+        interval_text = (row or {}).get('interval', '').strip()
+        if not interval_text:
+            continue
+
+        lower, upper = _parse_interval(interval_text, index)
+        if previous_upper is not None and lower < previous_upper:
+            raise ValueError('Class intervals must be in ascending order and not overlap.')
+
+        if using_cumulative:
+            cumulative_value = _parse_frequency((row or {}).get('cumulative', ''), f'cumulative frequency (row {index})')
+            if cumulative_value <= previous_cumulative:
+                raise ValueError('Cumulative frequencies must strictly increase.')
+            frequency = cumulative_value - previous_cumulative
+            previous_cumulative = cumulative_value
+        else:
+            frequency = _parse_frequency((row or {}).get('frequency', ''), f'frequency (row {index})')
+            previous_cumulative += frequency
+
+        yield {'lower': lower, 'upper': upper, 'frequency': frequency}
+        previous_upper = upper
+
+
+def compute_ungrouped_statistics(pairs, percentiles=None):
+    frequencies = {}
+    for value, freq in pairs:
+        frequencies.setdefault(value, 0)
+        frequencies[value] += freq
+
+    sorted_items = sorted(frequencies.items())
+    values = [value for value, _ in sorted_items]
+    weights = [freq for _, freq in sorted_items]
+
+    cumulative_frequencies = []
+    running_total = 0
+    moments = WeightedMoments()
+    for value, freq in sorted_items:
+        running_total += freq
+        cumulative_frequencies.append(running_total)
+        moments.add(value, freq)
+
+    total_frequency = running_total
+    # Correctly rounded like the grouped mean, so a sketched upload that streams the same terms agrees
+    mean_value = math.fsum(value * freq for value, freq in sorted_items) / total_frequency if total_frequency else None
+
+    if total_frequency == 0:
+        median_value = None
+    elif total_frequency % 2 == 1:
+        median_value = _value_at_position(values, cumulative_frequencies, total_frequency // 2)
+    else:
+        median_value = (_value_at_position(values, cumulative_frequencies, total_frequency // 2 - 1) +
+                        _value_at_position(values, cumulative_frequencies, total_frequency // 2)) / 2
+
+    max_frequency = max(weights, default=0)
+    mode_values = [val for val, freq in sorted_items if freq == max_frequency] if max_frequency else []
+    if len(sorted_items) > 1 and len(mode_values) == len(sorted_items):
+        mode_values = []
+    mode_display = ', '.join(str(format_number(val)) for val in mode_values) if mode_values else 'None'
+
+    ogive_points = []
+    if sorted_items:
+        ogive_points.append((values[0], 0))
+        ogive_points.extend(zip(values, cumulative_frequencies))
+
+    descriptive = None
+    if total_frequency:
+        descriptive = describe(moments, lambda fraction: ungrouped_quantile(values, cumulative_frequencies, fraction),
+                               parse_percentiles(percentiles))
+
+    return {
+        'total_frequency': total_frequency,
+        'mean': mean_value,
+        'median': median_value,
+        'mode_display': mode_display,
+        'mode_values': mode_values,
+        'values': values,
+        'weights': weights,
+        'ogive_points': ogive_points,
+        'descriptive': descriptive,
+    }
+
+
+def _value_at_position(values, cumulative_frequencies, position):
+    # position is a 0-based index into the (virtual) expanded, sorted observations
+    return values[bisect_right(cumulative_frequencies, position)]
+
+
+def compute_grouped_statistics(classes, percentiles=None):
+    total_frequency = sum(cls['frequency'] for cls in classes)
+    if total_frequency <= 0:
+        raise ValueError('Total frequency must be greater than zero.')
+
+    # fsum is correctly rounded, so vectorized.compute_grouped_arrays gets the same mean whatever the summation order
+    mean_value = math.fsum(((cls['lower'] + cls['upper']) / 2) * cls['frequency'] for cls in classes) / total_frequency
+
+    cumulative = 0
+    cumulative_before = 0
+    median_value = None
+    median_class = None
+    cumulative_points = []
+    cumulative_frequencies = []
+    moments = WeightedMoments()
+    if classes:
+        cumulative_points.append((classes[0]['lower'], 0))
+
+    for cls in classes:
+        cumulative += cls['frequency']
+        cumulative_points.append((cls['upper'], cumulative))
+        cumulative_frequencies.append(cumulative)
+        moments.add((cls['lower'] + cls['upper']) / 2, cls['frequency'])
+        if median_class is None and cumulative >= total_frequency / 2:
+            median_class = cls
+            cumulative_before = cumulative - cls['frequency']
+
+    if median_class:
+        median_value = grouped_median(median_class, cumulative_before, total_frequency)
+
+    max_freq = max(classes, key=lambda cls: cls['frequency'])['frequency']
+    mode_candidates = [idx for idx, cls in enumerate(classes) if cls['frequency'] == max_freq]
+    modal_index = mode_candidates[0]
+    modal_class = classes[modal_index]
+    modal_label = grouped_modal_label(modal_class)
+
+    prev_freq = classes[modal_index - 1]['frequency'] if modal_index > 0 else 0
+    next_freq = classes[modal_index + 1]['frequency'] if modal_index < len(classes) - 1 else 0
+    mode_value = grouped_mode(modal_class, prev_freq, next_freq)
+
+    mode_display = str(format_number(mode_value)) if mode_value is not None else '—'
+
+    lowers = [cls['lower'] for cls in classes]
+    uppers = [cls['upper'] for cls in classes]
+    frequencies = [cls['frequency'] for cls in classes]
+    descriptive = describe(
+        moments, lambda fraction: grouped_quantile(lowers, uppers, frequencies, cumulative_frequencies, fraction),
+        parse_percentiles(percentiles))
+
+    return {
+        'total_frequency': total_frequency,
+        'mean': mean_value,
+        'median': median_value,
+        'mode': mode_value,
+        'mode_display': mode_display,
+        'modal_label': modal_label,
+        'cumulative_points': cumulative_points,
+        'modal_index': modal_index,
+        'descriptive': descriptive,
+    }
+
+
+def grouped_median(median_class, cumulative_before, total_frequency):
+    h = median_class['upper'] - median_class['lower']
+    if h > 0 and median_class['frequency'] > 0:
+        return median_class['lower'] + ((total_frequency / 2 - cumulative_before) / median_class['frequency']) * h
+    return None
+
+
+def grouped_mode(modal_class, prev_freq, next_freq):
+    h = modal_class['upper'] - modal_class['lower']
+    denominator = (modal_class['frequency'] - prev_freq) + (modal_class['frequency'] - next_freq)
+    if h > 0 and denominator != 0:
+        return modal_class['lower'] + ((modal_class['frequency'] - prev_freq) / denominator) * h
+    return (modal_class['lower'] + modal_class['upper']) / 2
+
+
+def grouped_modal_label(modal_class):
+    return f"{format_number(modal_class['lower'])} – {format_number(modal_class['upper'])}"
@@ -0,0 +1,184 @@
+import csv
+import json
+import struct
+import tempfile
+
+from django.conf import settings
+
+from .serialization import loads
+from .descriptive import QUARTILES, ExactSum, QuantileSketch, WeightedMoments, describe, parse_percentiles
+from .statistics import (
+    compute_ungrouped_statistics,
+    grouped_modal_label,
+    grouped_mode,
+    iter_grouped_classes,
+    iter_ungrouped_entries,
+)
+from .utils import format_number
+
+UPLOAD_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+# Grouped classes are spilled to disk once they outgrow this many bytes, for the median pass
+SPOOL_MAX_SIZE = 1024 * 1024
+CLASS_RECORD = struct.Struct('<ddq')
+
+
+def iter_upload_rows(stream, upload_format):
+    lines = _decode_lines(stream)
+    if upload_format == 'csv':
+        # Not DictReader, which drops blank lines: each record after the header counts as a row,
+        # blank or not, so "row N" in an error is the Nth record as it is for NDJSON lines
+        reader = csv.reader(lines)
+        try:
+            fields = [name.strip().lower() for name in next(reader, [])]
+            for values in reader:
+                yield {key: value for key, value in zip(fields, values) if key}
+        except csv.Error as exc:
+            raise ValueError(f'Invalid CSV upload: {exc}.')
+        return
+
+    for index, line in enumerate(lines, start=1):
+        if not line.strip():
+            yield {}
+            continue
+        try:
+            row = loads(line)
+        except json.JSONDecodeError:
+            raise ValueError(f'Invalid JSON on row {index}.')
+        if not isinstance(row, dict):
+            raise ValueError(f'Row {index} must be a JSON object.')
+        yield {key: '' if value is None else str(value) for key, value in row.items()}
+
+
+def summarize_ungrouped_upload(rows, using_cumulative, percentiles=None):
+    # Memory grows with the number of distinct values, never with the row count or total frequency.
+    # Past STATISTICS_SKETCH_THRESHOLD distinct values (plain frequencies only) the values go into a
+    # bounded quantile sketch instead, so memory stops growing at all.
+    sketch_threshold = getattr(settings, 'STATISTICS_SKETCH_THRESHOLD', 1000000)
+    by_value = {}
+    entries = iter_ungrouped_entries(rows, using_cumulative)
+    for entry in entries:
+        if using_cumulative:
+            by_value.setdefault(entry['value'], []).append(entry['cumulative'])
+        else:
+            by_value[entry['value']] = by_value.get(entry['value'], 0) + entry['frequency']
+            if len(by_value) > sketch_threshold:
+                return _sketch_ungrouped_upload(by_value, entries, percentiles)
+
+    if not by_value:
+        raise ValueError('Enter at least one value with a valid frequency.')
+
+    if not using_cumulative:
+        return compute_ungrouped_statistics(by_value.items(), percentiles)
+
+    pairs = []
+    previous_cumulative = 0
+    for value in sorted(by_value):
+        for cumulative in by_value[value]:
+            if cumulative <= previous_cumulative:
+                raise ValueError('Cumulative frequencies must strictly increase when using cumulative input.')
+            pairs.append((value, cumulative - previous_cumulative))
+            previous_cumulative = cumulative
+    return compute_ungrouped_statistics(pairs, percentiles)
+
+
+def summarize_grouped_upload(rows, using_cumulative, percentiles=None):
+    percentiles = parse_percentiles(percentiles)
+    total_frequency = 0
+    # Summed exactly, as compute_grouped_statistics does with fsum, so an upload gets the same mean as JSON
+    weighted_sum = ExactSum()
+    moments = WeightedMoments()
+    previous_class = None
+    modal_class = None
+    modal_prev_freq = 0
+    modal_next_freq = None
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spill:
+        for cls in iter_grouped_classes(rows, using_cumulative):
+            spill.write(CLASS_RECORD.pack(cls['lower'], cls['upper'], cls['frequency']))
+            total_frequency += cls['frequency']
+            weighted_sum.add(((cls['lower'] + cls['upper']) / 2) * cls['frequency'])
+            moments.add((cls['lower'] + cls['upper']) / 2, cls['frequency'])
+
+            if modal_class is not None and modal_next_freq is None:
+                modal_next_freq = cls['frequency']
+            if modal_class is None or cls['frequency'] > modal_class['frequency']:
+                modal_class = cls
+                modal_prev_freq = previous_class['frequency'] if previous_class else 0
+                modal_next_freq = None
+            previous_class = cls
+
+        if modal_class is None:
+            raise ValueError('Enter at least one class interval with a valid frequency.')
+
+        # One more pass over the spilled classes finds the median and every requested quantile
+        fractions = {0.5, *(fraction for _, fraction in QUARTILES), *(percentile / 100 for percentile in percentiles)}
+        spill.seek(0)
+        quantiles = _spilled_quantiles(spill, total_frequency, fractions)
+
+    mode_value = grouped_mode(modal_class, modal_prev_freq, modal_next_freq or 0)
+    return {
+        'total_frequency': total_frequency,
+        'mean': weighted_sum.total() / total_frequency,
+        'median': quantiles[0.5],
+        'mode': mode_value,
+        'mode_display': str(format_number(mode_value)),
+        'modal_label': grouped_modal_label(modal_class),
+        'descriptive': describe(moments, quantiles.__getitem__, percentiles),
+    }
+
+
+def _spilled_quantiles(spill, total_frequency, fractions):
+    # Same formula as grouped_median, with N/2 replaced by fraction * N
+    pending = sorted(fractions)
+    quantiles = {}
+    cumulative = 0
+    for chunk in iter(lambda: spill.read(CLASS_RECORD.size * 4096), b''):
+        for lower, upper, frequency in CLASS_RECORD.iter_unpack(chunk):
+            cumulative += frequency
+            while pending and cumulative >= total_frequency * pending[0]:
+                before = cumulative - frequency
+                quantiles[pending[0]] = lower + ((total_frequency * pending[0] - before) / frequency) * (upper - lower)
+                pending.pop(0)
+            if not pending:
+                return quantiles
+    return quantiles
+
+
+def _sketch_ungrouped_upload(by_value, entries, percentiles):
+    # Mean, variance and skewness stay exact; quantiles come from the sketch and the mode is not tracked
+    relative_error = getattr(settings, 'STATISTICS_SKETCH_RELATIVE_ERROR', 0.01)
+    sketch = QuantileSketch(relative_error)
+    moments = WeightedMoments()
+    weighted_sum = ExactSum()
+    for value, frequency in by_value.items():
+        sketch.add(value, frequency)
+        moments.add(value, frequency)
+        weighted_sum.add(value * frequency)
+    by_value.clear()
+    for entry in entries:
+        sketch.add(entry['value'], entry['frequency'])
+        moments.add(entry['value'], entry['frequency'])
+        weighted_sum.add(entry['value'] * entry['frequency'])
+
+    descriptive = describe(moments, sketch.quantile, parse_percentiles(percentiles), method='sketch')
+    descriptive['quantile_relative_error'] = relative_error
+    return {
+        'total_frequency': moments.count,
+        'mean': weighted_sum.total() / moments.count,
+        'median': sketch.quantile(0.5),
+        'mode_display': 'Not available for sketched uploads',
+        'mode_values': [],
+        'descriptive': descriptive,
+    }
+
+
+def _decode_lines(stream):
+    for line in stream:
+        try:
+            yield line.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError('Uploads must be UTF-8 encoded.')
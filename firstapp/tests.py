@@ -1,3 +1,1195 @@
-from django.test import TestCase
+import json
+import math
+import os
+import pstats
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+
+from . import admission, batch, charts, incremental, menu, render_jobs, rollups, serialization, write_behind
+from .chart_cache import chart_cache_stats, store_chart_image
+from .descriptive import ExactSum, QuantileSketch, WeightedMoments, grouped_quantile, ungrouped_quantile
+from .incremental import load_session
+from .models import Menuitem, Reservation, ReservationDay, StatisticsRun, StatisticsSession
+from .statistics import (
+    analyse_grouped_rows, compute_grouped_statistics, compute_ungrouped_statistics, parse_grouped_rows, parse_ungrouped_rows,
+)
+from .streaming import summarize_grouped_upload, summarize_ungrouped_upload
+from .timing import timed_phase
+from .utils import format_number
+from .vectorized import _parse_grouped_bulk, analyse_grouped_arrays
+
+SESSIONS_URL = '/app/statistics/sessions'
+SVG = '{http://www.w3.org/2000/svg}'
+# Chart images, render jobs and the menu are kept on disk outside tests
+SCRATCH_CACHES = {
+    **settings.CACHES,
+    'menu': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-menu'},
+    'chart_images': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-chart-images'},
+    'render_jobs': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-render-jobs'},
+}
+
+
+def ungrouped_row(rng, taken):
+    return {'value': str(rng.randint(0, 40) / 4), 'frequency': str(rng.randint(1, 5))}
+
+
+def grouped_row(rng, taken):
+    # Classes are 10 wide on a fixed grid, so any class not already in the table can be added
+    used = {row['interval'] for row in taken}
+    start = rng.choice([start for start in range(0, 500, 10) if f'{start}-{start + 10}' not in used])
+    return {'interval': f'{start}-{start + 10}', 'frequency': str(rng.randint(1, 9))}
+
+
+def random_grouped_rows(rng, count, using_cumulative):
+    # Bounds in tenths, so midpoints are inexact in binary and summation order shows in the mean
+    rows = []
+    lower = rng.randint(-500, 500)
+    cumulative = 0
+    for _ in range(count):
+        upper = lower + rng.choice((1, 3, 25, 117))
+        frequency = rng.randint(1, 10 ** rng.randint(1, 6))
+        cumulative += frequency
+        count_key, count_value = ('cumulative', cumulative) if using_cumulative else ('frequency', frequency)
+        rows.append({'interval': f'{lower / 10}-{upper / 10}', count_key: str(count_value)})
+        # Leave a gap now and then; classes only have to be ascending and not overlap
+        lower = upper + rng.choice((0, 0, 0, 15))
+    return rows
+
+
+def random_ungrouped_rows(rng, count, using_cumulative):
+    values = [str(rng.randint(-2000, 2000) / rng.choice((1, 4, 100))) for _ in range(count)]
+    if not using_cumulative:
+        return [{'value': value, 'frequency': str(rng.randint(1, 500))} for value in values]
+    # Cumulative input lists each value once, its running total growing with the value
+    ordered = sorted(set(values), key=float)
+    cumulative = sorted(rng.sample(range(1, count * 50), len(ordered)))
+    rows = [{'value': value, 'cumulative': str(total)} for value, total in zip(ordered, cumulative)]
+    rng.shuffle(rows)
+    return rows
+
+
+class StatisticsPathParityTests(SimpleTestCase):
+    def assertDescriptiveClose(self, actual, expected):
+        # Welford merges and two-pass sums may differ in the last bits before rounding to 4 places
+        self.assertEqual(actual.keys(), expected.keys())
+        for key in ('variance', 'std_dev', 'sample_variance', 'sample_std_dev', 'skewness'):
+            self.assertTrue(math.isclose(actual[key], expected[key], rel_tol=1e-9, abs_tol=1e-4),
+                            (key, actual[key], expected[key]))
+        for key in ('quartiles', 'iqr', 'percentiles', 'quantile_method'):
+            self.assertEqual(actual[key], expected[key], key)
+
+    def test_grouped_arrays_match_scalar_path(self):
+        rng = random.Random(9)
+        for trial in range(40):
+            using_cumulative = trial % 2 == 1
+            rows = random_grouped_rows(rng, rng.randint(1, 3000), using_cumulative)
+            # Blank rows are skipped by both parsers
+            rows.insert(rng.randint(0, len(rows)), {'interval': '  '})
+            self.assertIsNotNone(_parse_grouped_bulk(rows, using_cumulative))
+
+            classes, stats = analyse_grouped_arrays(rows, using_cumulative, [10, 90])
+            expected_classes = parse_grouped_rows(rows, using_cumulative)
+            expected = compute_grouped_statistics(expected_classes, [10, 90])
+            self.assertEqual(classes, expected_classes)
+            self.assertDescriptiveClose(stats.pop('descriptive'), expected.pop('descriptive'))
+            self.assertEqual(stats, expected)
+
+    def test_grouped_total_past_int64_is_computed_exactly(self):
+        rows = [{'interval': f'{start}-{start + 1}', 'frequency': '999999999999999'} for start in range(10000)]
+        for threshold in (1, 10 ** 6):
+            with self.subTest(threshold=threshold), override_settings(STATISTICS_VECTORIZE_THRESHOLD=threshold):
+                classes, stats = analyse_grouped_rows(rows, False, [50])
+            self.assertEqual(stats['total_frequency'], 9999999999999990000)
+            self.assertEqual(stats['mean'], 5000.0)
+            self.assertEqual(stats['descriptive']['skewness'], 0)
+        self.assertEqual(classes, parse_grouped_rows(rows, False))
+
+    def test_grouped_arrays_report_the_scalar_errors(self):
+        rows = random_grouped_rows(random.Random(4), 100, False)
+        rows[40]['frequency'] = '2.5'
+        with self.assertRaisesMessage(ValueError, 'frequency (row 41) must be a whole number.'):
+            analyse_grouped_arrays(rows, False)
+        rows = random_grouped_rows(random.Random(4), 100, True)
+        rows[60]['cumulative'] = rows[59]['cumulative']
+        with self.assertRaisesMessage(ValueError, 'Cumulative frequencies must strictly increase.'):
+            analyse_grouped_arrays(rows, True)
+
+    def test_streamed_ungrouped_upload_matches_scalar_path(self):
+        rng = random.Random(5)
+        for trial in range(40):
+            using_cumulative = trial % 2 == 1
+            rows = random_ungrouped_rows(rng, rng.randint(1, 2000), using_cumulative)
+            expected = compute_ungrouped_statistics(parse_ungrouped_rows(rows, using_cumulative), [25, 99])
+            self.assertEqual(summarize_ungrouped_upload(iter(rows), using_cumulative, [25, 99]), expected)
+
+    def test_streamed_uploads_match_the_scalar_mean_exactly(self):
+        rng = random.Random(6)
+        for trial in range(20):
+            using_cumulative = trial % 2 == 1
+            rows = random_grouped_rows(rng, rng.randint(1, 3000), using_cumulative)
+            expected = compute_grouped_statistics(parse_grouped_rows(rows, using_cumulative))
+            streamed = summarize_grouped_upload(iter(rows), using_cumulative)
+            self.assertEqual(streamed['mean'], expected['mean'])
+            self.assertEqual(streamed['total_frequency'], expected['total_frequency'])
+
+            # Distinct values, so the sketch adds the same terms the scalar path sums
+            rows = [{'value': str(value / 7), 'frequency': str(rng.randint(1, 10 ** 6))}
+                    for value in rng.sample(range(-10 ** 6, 10 ** 6), 500)]
+            expected = compute_ungrouped_statistics(parse_ungrouped_rows(rows))
+            with override_settings(STATISTICS_SKETCH_THRESHOLD=50):
+                sketched = summarize_ungrouped_upload(iter(rows), False)
+            self.assertEqual(sketched['descriptive']['quantile_method'], 'sketch')
+            self.assertEqual(sketched['mean'], expected['mean'])
+
+    def test_exact_sum_matches_fsum_in_any_order(self):
+        rng = random.Random(8)
+        terms = [rng.uniform(-1, 1) * 10 ** rng.randint(-20, 20) for _ in range(2000)]
+        for _ in range(5):
+            rng.shuffle(terms)
+            total = ExactSum()
+            for term in terms:
+                total.add(term)
+            self.assertEqual(total.total(), math.fsum(terms))
+
+class UngroupedStatisticsTests(SimpleTestCase):
+    def expanded(self, pairs):
+        # The statistics as they were computed before, from every observation written out
+        values = sorted(value for value, frequency in pairs for _ in range(frequency))
+        count = len(values)
+        middle = count // 2
+        counts = {}
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+        modes = [value for value, total in sorted(counts.items()) if total == max(counts.values())]
+        cumulative = [sum(1 for observed in values if observed <= value) for value in sorted(counts)]
+        return {
+            'total_frequency': count,
+            'mean': math.fsum(values) / count,
+            'median': values[middle] if count % 2 else (values[middle - 1] + values[middle]) / 2,
+            'mode_values': [] if len(counts) > 1 and len(modes) == len(counts) else modes,
+            'ogive_points': [(min(values), 0), *zip(sorted(counts), cumulative)],
+        }
+
+    def assertMatchesExpanded(self, pairs):
+        stats = compute_ungrouped_statistics(pairs)
+        expected = self.expanded(pairs)
+        self.assertTrue(math.isclose(stats.pop('mean'), expected.pop('mean'), rel_tol=1e-12), pairs)
+        self.assertEqual({key: stats[key] for key in expected}, expected, pairs)
+
+    def test_cases_match_the_expanded_list(self):
+        cases = {
+            'odd total': [(3.0, 1), (1.0, 1), (2.0, 1)],
+            'even total inside one value': [(1.0, 1), (2.0, 4), (9.0, 1)],
+            'even total across a boundary': [(1.0, 2), (5.0, 2)],
+            'median at the end of a value': [(1.0, 3), (2.0, 3), (4.0, 1)],
+            'tied modes': [(1.0, 3), (4.0, 3), (2.0, 1)],
+            'every value tied': [(1.0, 2), (2.0, 2), (3.0, 2)],
+            'single value': [(7.5, 4)],
+            'repeated value': [(2.0, 1), (1.0, 2), (2.0, 2)],
+        }
+        for name, pairs in cases.items():
+            with self.subTest(name):
+                self.assertMatchesExpanded(pairs)
+        self.assertEqual(compute_ungrouped_statistics(cases['tied modes'])['mode_display'], '1, 4')
+        self.assertEqual(compute_ungrouped_statistics(cases['every value tied'])['mode_display'], 'None')
+
+    def test_random_tables_match_the_expanded_list(self):
+        rng = random.Random(11)
+        for _ in range(200):
+            pairs = [(rng.randint(-20, 20) / 4, rng.randint(1, 6)) for _ in range(rng.randint(1, 12))]
+            self.assertMatchesExpanded(pairs)
+
+    def test_cumulative_input_matches_plain_frequencies(self):
+        plain = [{'value': '4', 'frequency': '2'}, {'value': '1', 'frequency': '3'}, {'value': '2.5', 'frequency': '1'}]
+        cumulative = [{'value': '2.5', 'cumulative': '4'}, {'value': '4', 'cumulative': '6'},
+                      {'value': '1', 'cumulative': '3'}]
+        pairs = parse_ungrouped_rows(cumulative, using_cumulative=True)
+        self.assertEqual(sorted(pairs), sorted(parse_ungrouped_rows(plain)))
+        self.assertMatchesExpanded(pairs)
+        self.assertEqual(compute_ungrouped_statistics(pairs)['median'], 1.75)
+
+
+class DescriptiveStatisticsTests(SimpleTestCase):
+    def reference_moments(self, values, weights):
+        values, weights = np.array(values, dtype=np.float64), np.array(weights, dtype=np.float64)
+        mean = np.average(values, weights=weights)
+        variance = np.average((values - mean) ** 2, weights=weights)
+        third = np.average((values - mean) ** 3, weights=weights)
+        return mean, variance, variance * weights.sum() / (weights.sum() - 1), third / variance ** 1.5
+
+    def assertMomentsClose(self, moments, values, weights):
+        mean, variance, sample_variance, skewness = self.reference_moments(values, weights)
+        self.assertEqual(moments.count, sum(weights))
+        self.assertTrue(math.isclose(moments.mean, mean, rel_tol=1e-9, abs_tol=1e-9))
+        self.assertTrue(math.isclose(moments.variance(), variance, rel_tol=1e-9))
+        self.assertTrue(math.isclose(moments.variance(sample=True), sample_variance, rel_tol=1e-9))
+        self.assertTrue(math.isclose(moments.skewness(), skewness, rel_tol=1e-7, abs_tol=1e-9))
+
+    def test_moments_match_numpy(self):
+        rng = random.Random(11)
+        for _ in range(30):
+            count = rng.randint(2, 500)
+            # A large offset is where naive sums of squares lose their precision
+            offset = rng.choice((0, 1e6))
+            values = [offset + rng.gauss(0, 1) * rng.choice((1, 50)) ** rng.random() for _ in range(count)]
+            weights = [rng.randint(1, 1000) for _ in range(count)]
+            moments = WeightedMoments()
+            for value, weight in zip(values, weights):
+                moments.add(value, weight)
+            self.assertMomentsClose(moments, values, weights)
+
+    def test_merged_partial_moments_match_a_single_pass(self):
+        rng = random.Random(12)
+        values = [rng.expovariate(0.1) for _ in range(2000)]
+        weights = [rng.randint(1, 20) for _ in range(2000)]
+        parts = []
+        start = 0
+        while start < len(values):
+            end = start + rng.randint(1, 300)
+            part = WeightedMoments()
+            for value, weight in zip(values[start:end], weights[start:end]):
+                part.add(value, weight)
+            parts.append(part)
+            start = end
+        rng.shuffle(parts)
+        merged = WeightedMoments()
+        for part in [WeightedMoments(), *parts]:
+            merged.merge(part)
+        self.assertMomentsClose(merged, values, weights)
+
+    def test_degenerate_moments(self):
+        single = WeightedMoments()
+        single.add(4.0, 1)
+        self.assertEqual(single.variance(), 0)
+        self.assertIsNone(single.variance(sample=True))
+        self.assertIsNone(single.skewness())
+        self.assertIsNone(WeightedMoments().variance())
+
+    def test_ungrouped_quantiles_match_numpy(self):
+        rng = random.Random(13)
+        for _ in range(30):
+            values = sorted(rng.sample(range(-1000, 1000), rng.randint(1, 60)))
+            weights = [rng.randint(1, 8) for _ in values]
+            cumulative = list(np.cumsum(weights))
+            expanded = np.repeat(values, weights)
+            for fraction in (0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1):
+                self.assertAlmostEqual(ungrouped_quantile(values, cumulative, fraction),
+                                       np.quantile(expanded, fraction), places=9)
+
+    def test_second_quartile_is_the_median(self):
+        rng = random.Random(14)
+        for _ in range(30):
+            pairs = [(rng.randint(0, 50) / 4, rng.randint(1, 6)) for _ in range(rng.randint(1, 40))]
+            stats = compute_ungrouped_statistics(pairs)
+            self.assertEqual(stats['descriptive']['quartiles']['q2'], format_number(stats['median']))
+            self.assertEqual(ungrouped_quantile(stats['values'], list(np.cumsum(stats['weights'])), 0.5),
+                             stats['median'])
+
+            classes = parse_grouped_rows(random_grouped_rows(rng, rng.randint(1, 40), False), False)
+            stats = compute_grouped_statistics(classes)
+            lowers, uppers, frequencies = ([cls[key] for cls in classes] for key in ('lower', 'upper', 'frequency'))
+            cumulative = list(np.cumsum(frequencies))
+            self.assertEqual(grouped_quantile(lowers, uppers, frequencies, cumulative, 0.5), stats['median'])
+            self.assertEqual(stats['descriptive']['quartiles']['q2'], format_number(stats['median']))
+            self.assertEqual(grouped_quantile(lowers, uppers, frequencies, cumulative, 1), uppers[-1])
+
+    def assertWithinSketchError(self, sketch, ordered):
+        for fraction in [index / 100 for index in range(101)]:
+            true = ordered[math.floor(fraction * (len(ordered) - 1))]
+            estimate = sketch.quantile(fraction)
+            self.assertLessEqual(abs(estimate - true), sketch.relative_error * abs(true) + 1e-12,
+                                 (fraction, estimate, true))
+
+    def test_sketch_quantiles_are_within_the_relative_error(self):
+        rng = random.Random(15)
+        values = [rng.choice((-1, 1)) * rng.lognormvariate(0, 4) for _ in range(20000)] + [0.0] * 300
+        sketch = QuantileSketch(relative_error=0.01)
+        for value in values:
+            sketch.add(value)
+        self.assertWithinSketchError(sketch, sorted(values))
+
+        # Sketches built on parts of the data merge into the same sketch
+        halves = QuantileSketch(relative_error=0.01), QuantileSketch(relative_error=0.01)
+        for index, value in enumerate(values):
+            halves[index % 2].add(value)
+        merged = halves[0].merge(halves[1])
+        self.assertEqual((merged.positive, merged.negative, merged.zeros, merged.count),
+                         (sketch.positive, sketch.negative, sketch.zeros, sketch.count))
+
+    def test_sketch_collapses_the_buckets_nearest_zero(self):
+        rng = random.Random(16)
+        values = sorted(10 ** rng.uniform(-3, 6) for _ in range(20000))
+        sketch = QuantileSketch(relative_error=0.01, max_buckets=100)
+        for value in values:
+            sketch.add(value)
+        self.assertLessEqual(len(sketch.positive), 100)
+        self.assertEqual(sketch.count, len(values))
+
+        # Values in the buckets that were kept are still within 1%; smaller ones were folded into the
+        # lowest kept bucket and are reported as its value
+        lowest = min(sketch.positive)
+        for fraction in [index / 100 for index in range(101)]:
+            true = values[math.floor(fraction * (len(values) - 1))]
+            estimate = sketch.quantile(fraction)
+            if math.ceil(math.log(true) / sketch.log_gamma) > lowest:
+                self.assertLessEqual(abs(estimate - true), 0.01 * true, (fraction, estimate, true))
+            else:
+                self.assertEqual(estimate, sketch._value(lowest))
+                self.assertGreaterEqual(estimate, true)
+
+
+class ChartBackendTests(SimpleTestCase):
+    def parse_svg(self, image):
+        root = ElementTree.fromstring(image)
+        self.assertEqual(root.tag, SVG + 'svg')
+        return root
+
+    def test_svg_charts_are_well_formed(self):
+        svg = charts.get_chart_backend('svg')
+        stats = compute_ungrouped_statistics([(1.0, 2), (2.5, 1), (4.0, 3)])
+        histogram = self.parse_svg(svg.render_ungrouped_histogram(
+            stats['values'], stats['weights'], stats['median'], stats['mode_values']))
+        labels = [text.text for text in histogram.iter(SVG + 'text')]
+        self.assertIn('Median 3.25', labels)
+        self.assertIn('Mode', labels)
+
+        ogive = self.parse_svg(svg.render_ogive(stats['ogive_points'], stats['total_frequency'], stats['median'],
+                                                'Values < & >'))
+        self.assertIn('Values < & >', [text.text for text in ogive.iter(SVG + 'text')])
+        # One marker per ogive point and one for the median
+        self.assertEqual(len(list(ogive.iter(SVG + 'circle'))), len(stats['ogive_points']) + 1)
+
+        classes = parse_grouped_rows([{'interval': '0-10', 'frequency': '4'}, {'interval': '10-20', 'frequency': '7'},
+                                      {'interval': '20-30', 'frequency': '2'}], False)
+        grouped = compute_grouped_statistics(classes)
+        histogram = self.parse_svg(svg.render_grouped_histogram(
+            classes, grouped['median'], grouped['mode'], grouped['modal_index']))
+        bars = [rect for rect in histogram.iter(SVG + 'rect') if rect.get('fill') == '#38bdf8']
+        self.assertEqual(len(bars), 3)
+        self.assertIn('Mode construction', [text.text for text in histogram.iter(SVG + 'text')])
+
+    def test_svg_charts_do_not_import_matplotlib(self):
+        script = (
+            'import sys, django; django.setup()\n'
+            'from firstapp import views\n'
+            'from firstapp.charts import get_chart_backend\n'
+            'get_chart_backend("svg").render_ogive([(1, 0), (1, 2), (3, 5)], 5, 2, "Values")\n'
+            'print("matplotlib" in sys.modules)\n'
+            'get_chart_backend("png").render_ogive([(1, 0), (1, 2), (3, 5)], 5, 2, "Values")\n'
+            'print("matplotlib" in sys.modules)\n'
+        )
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=settings.BASE_DIR, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'firstproject.settings'})
+        self.assertEqual(result.stdout.split(), ['False', 'True'])
+
+    def test_chart_format_is_validated(self):
+        self.assertEqual(charts.chart_image_format(charts.get_chart_backend('png').render_ogive(
+            [(1, 0), (3, 5)], 5, 2, 'Values')), 'png')
+        with self.assertRaises(ValueError):
+            charts.get_chart_backend('gif')
+
+
+class ChartReductionTests(SimpleTestCase):
+    def test_downsampled_points_stay_within_the_limit(self):
+        rng = random.Random(3)
+        for count, limit in ((10, 3), (1000, 50), (1001, 1000), (5000, 7), (20000, 1000)):
+            with self.subTest(count=count, limit=limit):
+                points, total = [], 0
+                for index in range(count):
+                    total += rng.randint(0, 50) if rng.random() < 0.9 else rng.randint(500, 5000)
+                    points.append((index / 4, total))
+                line = charts.downsample_points(points, limit)
+                self.assertEqual(len(line), limit)
+                self.assertEqual((line[0], line[-1]), (points[0], points[-1]))
+                # Only real points, in their original order, so the ogive stays monotonic
+                self.assertTrue(set(line) <= set(points))
+                self.assertEqual(line, sorted(line))
+
+    def test_short_lines_are_returned_as_they_are(self):
+        points = [(float(index), float(index)) for index in range(10)]
+        self.assertIs(charts.downsample_points(points, 10), points)
+        self.assertIs(charts.downsample_points(points, 2), points)
+
+    def test_isolated_spike_is_kept(self):
+        points = [(float(index), 0.0) for index in range(1000)]
+        points[613] = (613.0, 100.0)
+        self.assertIn((613.0, 100.0), charts.downsample_points(points, 20))
+
+    def test_reduced_classes_keep_the_outline(self):
+        rng = random.Random(8)
+        classes = [{'lower': start, 'upper': start + 1, 'frequency': rng.randint(1, 100)} for start in range(1234)]
+        for limit in (1, 7, 600, 1233):
+            with self.subTest(limit=limit):
+                bars = charts.reduce_classes(classes, limit)
+                self.assertLessEqual(len(bars), limit)
+                self.assertEqual((bars[0]['lower'], bars[-1]['upper']), (0, 1234))
+                self.assertTrue(all(left['upper'] == right['lower'] for left, right in zip(bars, bars[1:])))
+                self.assertEqual(max(bar['frequency'] for bar in bars), max(cls['frequency'] for cls in classes))
+        self.assertIs(charts.reduce_classes(classes, 1234), classes)
+
+    @override_settings(STATISTICS_CHART_MAX_POINTS=25, STATISTICS_CHART_MAX_BARS=40)
+    def test_svg_charts_draw_at_most_the_configured_detail(self):
+        svg = charts.get_chart_backend('svg')
+        points = [(float(index), float(index * index)) for index in range(500)]
+        ogive = ElementTree.fromstring(svg.render_ogive(points, points[-1][1], None, 'Values'))
+        line = next(polyline for polyline in ogive.iter(SVG + 'polyline') if polyline.get('stroke') == '#22c55e')
+        self.assertEqual(len(line.get('points').split()), 25)
+
+        classes = [{'lower': start, 'upper': start + 1, 'frequency': 1 + start % 9} for start in range(500)]
+        stats = compute_grouped_statistics(classes)
+        histogram = ElementTree.fromstring(svg.render_grouped_histogram(
+            classes, stats['median'], stats['mode'], stats['modal_index']))
+        bars = [rect for rect in histogram.iter(SVG + 'rect') if rect.get('fill') == '#38bdf8']
+        self.assertEqual(len(bars), len(charts.reduce_classes(classes, 40)))
+        self.assertLessEqual(len(bars), 40)
+
+
+class SerializationTests(SimpleTestCase):
+    def with_each_backend(self, function, *args):
+        results = []
+        for backend in ('orjson', 'json'):
+            with self.settings(JSON_BACKEND=backend):
+                self.assertEqual(serialization.json_backend(), backend)
+                results.append(function(*args))
+        return results
+
+    def test_loads_gives_the_same_values_on_both_backends(self):
+        bodies = [
+            '{"rows": [{"value": "1.5", "frequency": 2}], "percentiles": [10, 90.5]}',
+            '[12345678901234567890123, -98765432109876543210, 1234567890123456789]',
+            '[NaN, Infinity, -Infinity, 1e400]',
+            '{"name": "\\u00e9\\ud83d\\ude00", "lone": "\\ud800"}',
+            b'{"text": "\xc3\xa9"}',
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                fast, standard = self.with_each_backend(serialization.loads, body)
+                # repr() compares NaN and keeps int and float apart
+                self.assertEqual(repr(fast), repr(standard))
+        self.assertEqual(serialization.loads('[12345678901234567890123]'), [12345678901234567890123])
+
+    def test_loads_raises_the_same_errors_on_both_backends(self):
+        for body in ('{', '[1,]', b'"\xff"', ''):
+            with self.subTest(body=body):
+                errors = []
+                for backend in ('orjson', 'json'):
+                    with self.settings(JSON_BACKEND=backend), self.assertRaises(ValueError) as caught:
+                        serialization.loads(body)
+                    errors.append(type(caught.exception))
+                self.assertEqual(errors[0], errors[1])
+
+    def test_dumps_gives_the_same_document_on_both_backends(self):
+        moment = timezone.make_aware(datetime(2026, 3, 1, 12, 30, 15, 123456))
+        documents = [
+            {'mean': 0.1, 'total': 2 ** 62, 'date': date(2026, 3, 1), 'time': moment, 'none': None, 'text': 'é'},
+            {'total': 2 ** 70, 'values': [-(2 ** 65), 1.5], 'nested': {'key': [True, False]}},
+            {'image': serialization.EncodedText(b'iVBORw0KGgo='), 'total': 2 ** 70, 'also': 'x'},
+            {'images': [serialization.EncodedText(b'AAAA'), serialization.EncodedText(b'BBBB')], 'n': 3},
+        ]
+        for document in documents:
+            with self.subTest(document=document):
+                fast, standard = self.with_each_backend(serialization.dumps, document)
+                self.assertEqual(json.loads(fast), json.loads(standard))
+        self.assertEqual(json.loads(serialization.dumps(documents[2])),
+                         {'image': 'iVBORw0KGgo=', 'total': 2 ** 70, 'also': 'x'})
+        self.assertEqual(json.loads(serialization.dumps(documents[0]))['time'], '2026-03-01T12:30:15.123Z')
+
+    def test_standard_library_is_used_without_orjson(self):
+        with mock.patch.object(serialization, 'orjson', None):
+            self.assertEqual(serialization.json_backend(), 'json')
+            self.assertTrue(math.isnan(serialization.loads('[NaN]')[0]))
+            self.assertEqual(serialization.dumps({'a': [1, 2 ** 70]}), b'{"a":[1,1180591620717411303424]}')
+        with self.assertRaises(TypeError):
+            serialization.JsonResponse([1, 2])
+        self.assertEqual(serialization.JsonResponse([1, 2], safe=False).content, b'[1,2]')
+
+
+class StatisticsSessionTests(TestCase):
+    def create(self, data_type, rows):
+        response = self.client.post(SESSIONS_URL, json.dumps({'dataType': data_type, 'rows': rows}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def append(self, session_id, rows, **headers):
+        return self.client.post(f'{SESSIONS_URL}/{session_id}/rows', json.dumps({'rows': rows}),
+                                content_type='application/json', headers=headers)
+
+    def edit(self, method, session_id, row_id, row=None, **headers):
+        send = getattr(self.client, method)
+        if row is None:
+            return send(f'{SESSIONS_URL}/{session_id}/rows/{row_id}', headers=headers)
+        return send(f'{SESSIONS_URL}/{session_id}/rows/{row_id}', json.dumps(row),
+                    content_type='application/json', headers=headers)
+
+    def assertMatchesRecompute(self, data_type, response, rows):
+        # rows: row id -> submitted row, for every row the session should hold
+        if data_type == 'ungrouped':
+            stats = compute_ungrouped_statistics(parse_ungrouped_rows(list(rows.values())))
+            points = stats['ogive_points']
+            modal_label = 'Not applicable'
+        else:
+            ordered = sorted(rows.values(), key=lambda row: int(row['interval'].split('-')[0]))
+            stats = compute_grouped_statistics(parse_grouped_rows(ordered, False))
+            points = stats['cumulative_points']
+            modal_label = stats['modal_label']
+        self.assertEqual(response['row_count'], len(rows))
+        self.assertEqual(response['total_frequency'], stats['total_frequency'])
+        self.assertEqual(response['mean'], format_number(stats['mean']))
+        self.assertEqual(response['median'], format_number(stats['median']))
+        self.assertEqual(response['mode'], stats['mode_display'])
+        self.assertEqual(response['modal_label'], modal_label)
+
+        # A worker without the session in memory rebuilds it from the snapshot and the edit log
+        incremental._memo.clear()
+        session = load_session(response['session_id'])
+        self.assertEqual(session.version, response['version'])
+        chart_data = session.chart_data()
+        self.assertEqual(chart_data['ogive_points' if data_type == 'ungrouped' else 'cumulative_points'], points)
+
+    def run_random_edits(self, data_type, new_row, seed):
+        rng = random.Random(seed)
+        initial = []
+        for _ in range(5):
+            initial.append(new_row(rng, initial))
+        created = self.create(data_type, initial)
+        session_id = created['session_id']
+        rows = dict(zip(created['row_ids'], initial))
+        self.assertMatchesRecompute(data_type, created, rows)
+
+        for _ in range(60):
+            action = rng.choice(('append', 'put', 'patch', 'delete'))
+            if action == 'append' or len(rows) < 2:
+                added = []
+                for _ in range(rng.randint(1, 3)):
+                    added.append(new_row(rng, [*rows.values(), *added]))
+                response = self.append(session_id, added)
+                self.assertEqual(response.status_code, 200, response.content)
+                rows.update(zip(response.json()['row_ids'], added))
+            elif action in ('put', 'patch'):
+                row_id = rng.choice(list(rows))
+                row = new_row(rng, [row for other, row in rows.items() if other != row_id])
+                response = self.edit(action, session_id, row_id, row)
+                self.assertEqual(response.status_code, 200, response.content)
+                rows[row_id] = row
+            else:
+                row_id = rng.choice(list(rows))
+                response = self.edit('delete', session_id, row_id)
+                self.assertEqual(response.status_code, 200, response.content)
+                del rows[row_id]
+            self.assertMatchesRecompute(data_type, response.json(), rows)
+        return session_id
+
+    def test_ungrouped_edits_match_recompute(self):
+        self.run_random_edits('ungrouped', ungrouped_row, 1)
+
+    def test_grouped_edits_match_recompute(self):
+        self.run_random_edits('grouped', grouped_row, 2)
+
+    @override_settings(STATISTICS_SESSION_COMPACT_MIN_ROWS=4)
+    def test_edits_match_recompute_across_snapshots(self):
+        session_id = self.run_random_edits('grouped', grouped_row, 3)
+        self.assertGreater(StatisticsSession.objects.get(session_id=session_id).snapshot_version, 1)
+
+    def test_errors_name_the_session_row_id(self):
+        created = self.create('ungrouped', [{'value': '1'}, {'value': ''}, {'value': '2'}])
+        self.assertEqual(created['row_ids'], [1, None, 3])
+        session_id = created['session_id']
+
+        response = self.append(session_id, [{'value': '4'}, {'value': '5', 'frequency': 'x'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': '"x" is not a valid number for frequency (row 5).'})
+        # Nothing from the rejected batch was kept
+        self.assertEqual(load_session(session_id).version, created['version'])
+
+        response = self.edit('put', session_id, 3, {'value': 'abc'})
+        self.assertEqual(response.json(), {'error': '"abc" is not a valid number for value (row 3).'})
+        self.assertEqual(self.edit('put', session_id, 2, {'value': '1'}).status_code, 404)
+
+        grouped = self.create('grouped', [{'interval': '0-10', 'frequency': '2'}])
+        response = self.append(grouped['session_id'], [{'interval': '10-20', 'frequency': '1'},
+                                                       {'interval': '30-20', 'frequency': '1'}])
+        self.assertEqual(response.json(), {'error': 'Lower bound must be less than upper bound on row 3.'})
+        response = self.append(grouped['session_id'], [{'interval': '5-15', 'frequency': '1'}])
+        self.assertEqual(response.json(), {'error': 'Class intervals must not overlap.'})
+
+    def test_stale_version_is_rejected(self):
+        created = self.create('ungrouped', [{'value': '1'}, {'value': '2'}])
+        session_id, version = created['session_id'], created['version']
+
+        response = self.append(session_id, [{'value': '3'}], If_Match=f'"{version}"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], version + 1)
+
+        response = self.edit('put', session_id, 1, {'value': '9'}, If_Match=f'"{version}"')
+        self.assertEqual(response.status_code, 409)
+        response = self.edit('delete', session_id, 1, If_Match=str(version))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.edit('delete', session_id, 1, If_Match='latest').status_code, 400)
+        session = load_session(session_id)
+        self.assertEqual((session.version, session.total), (version + 1, 3))
+
+    @override_settings(STATISTICS_SESSION_TTL=60)
+    def test_expired_sessions_are_gone(self):
+        session_id = self.create('ungrouped', [{'value': '1'}])['session_id']
+        StatisticsSession.objects.filter(session_id=session_id).update(
+            updated_at=timezone.now() - timedelta(seconds=61))
+
+        self.assertEqual(self.client.get(f'{SESSIONS_URL}/{session_id}').status_code, 404)
+        self.assertEqual(self.append(session_id, [{'value': '2'}]).status_code, 404)
+        self.assertEqual(self.edit('delete', session_id, 1).status_code, 404)
+        # Creating a session clears out expired ones
+        self.create('ungrouped', [{'value': '1'}])
+        self.assertFalse(StatisticsSession.objects.filter(session_id=session_id).exists())
+
+
+RESERVATION = {'first_name': 'Abebe', 'last_name': 'Bekele', 'guest_count': 3, 'comments': 'window seat'}
+
+
+@override_settings(CACHES=SCRATCH_CACHES)
+class StatisticsRunTests(TestCase):
+    def submit(self, payload):
+        response = self.client.post('/app/statistics', json.dumps({'chartFormat': 'svg', **payload}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_equivalent_ungrouped_submissions_share_a_run(self):
+        first = self.submit({'dataType': 'ungrouped', 'rows': [
+            {'value': '1', 'frequency': '2'}, {'value': '2.5', 'frequency': '1'}, {'value': '4', 'frequency': '3'}]})
+        second = self.submit({'dataType': 'ungrouped', 'rows': [
+            {'value': ' 4.0 ', 'frequency': '3'}, {'value': '', 'frequency': ''},
+            {'value': '1.00', 'frequency': ' 2'}, {'value': '2.50', 'frequency': '1'}]})
+        cumulative = self.submit({'dataType': 'ungrouped', 'usingCumulative': True, 'rows': [
+            {'value': '2.5', 'cumulative': '3'}, {'value': '1', 'cumulative': '2'}, {'value': '4', 'cumulative': '6'}]})
+        self.assertEqual(first['run_id'], second['run_id'])
+        self.assertEqual(first['run_id'], cumulative['run_id'])
+        self.assertEqual(StatisticsRun.objects.count(), 1)
+
+    def test_equivalent_grouped_submissions_share_a_run(self):
+        rows = [{'interval': '0-10', 'frequency': '4'}, {'interval': '10-20', 'frequency': '7'}]
+        first = self.submit({'dataType': 'grouped', 'rows': rows})
+        second = self.submit({'dataType': 'grouped', 'rows': [
+            {'interval': ' 0.0 - 10 ', 'frequency': '4'}, {}, {'interval': '10-20.0', 'frequency': '07'}]})
+        self.assertEqual(first['run_id'], second['run_id'])
+        # The vectorised parser keys the table exactly as the scalar one does
+        with override_settings(STATISTICS_VECTORIZE_THRESHOLD=1):
+            self.assertEqual(self.submit({'dataType': 'grouped', 'rows': rows})['run_id'], first['run_id'])
+
+        different = self.submit({'dataType': 'grouped', 'rows': rows, 'percentiles': [90]})
+        self.assertNotEqual(different['run_id'], first['run_id'])
+
+    def test_chart_cache_counts_come_from_the_shared_metrics(self):
+        before = self.client.get('/app/statistics/cache').json()
+        payload = {'dataType': 'ungrouped', 'rows': [{'value': '7', 'frequency': '1'}]}
+        self.submit(payload)
+        self.submit({**payload, 'percentiles': [10]})
+        after = self.client.get('/app/statistics/cache').json()
+        # A histogram and an ogive per submission; the second finds both already rendered
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (2, 2))
+        self.assertEqual(self.client.post('/app/statistics/cache').status_code, 405)
+
+    def test_chart_urls_are_cached_immutably_and_revalidate(self):
+        run = self.submit({'dataType': 'ungrouped', 'imageMode': 'url', 'rows': [{'value': '1', 'frequency': '2'}]})
+        response = self.client.get(run['histogram_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response['ETag'], '"%s"' % run['histogram_url'].rsplit('/', 1)[1].split('.')[0])
+        self.assertEqual(set(response['Cache-Control'].split(', ')),
+                         {'public', 'max-age=31536000', 'immutable'})
+
+        revalidated = self.client.get(run['histogram_url'], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+        self.assertEqual(self.client.head(run['histogram_url']).status_code, 200)
+        self.assertEqual(self.client.post(run['histogram_url']).status_code, 405)
+
+    def test_chart_is_only_served_under_its_own_format(self):
+        svg_url = self.submit({'dataType': 'ungrouped', 'imageMode': 'url',
+                               'rows': [{'value': '3', 'frequency': '1'}]})['ogive_url']
+        png_digest = store_chart_image(b'\x89PNG\r\n\x1a\n' + b'\0' * 16)
+        self.assertEqual(self.client.get(svg_url.replace('.svg', '.png')).status_code, 404)
+        self.assertEqual(self.client.get(f'/app/statistics/charts/{png_digest}.svg').status_code, 404)
+        response = self.client.get(f'/app/statistics/charts/{png_digest}.png')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/png'))
+        self.assertEqual(self.client.get(f'/app/statistics/charts/{"0" * 64}.png').status_code, 404)
+
+    @override_settings(STATISTICS_RENDER_JOB_TIMEOUT=60)
+    def test_job_left_pending_past_the_deadline_is_reported_failed(self):
+        # Neither job has a worker behind it, as after the web worker that submitted it restarted
+        for job_id, age, status_code in (('a' * 32, 30, 202), ('b' * 32, 90, 500)):
+            render_jobs.get_job_cache().set(f'chart-job:{job_id}', {
+                'status': 'pending', 'image_mode': 'url', 'chart_format': 'svg', 'started': time.time() - age})
+            response = self.client.get(f'/app/statistics/jobs/{job_id}')
+            self.assertEqual(response.status_code, status_code)
+        self.assertEqual(response.json()['status'], 'failed')
+
+    def test_upload_errors_count_blank_lines_as_rows(self):
+        uploads = {
+            'text/csv': 'value,frequency\n1,2\n\n3,x\n',
+            'application/x-ndjson': '{"value": "1", "frequency": "2"}\n\n{"value": "3", "frequency": "x"}\n',
+        }
+        for content_type, body in uploads.items():
+            response = self.client.post('/app/statistics/upload?dataType=ungrouped', body, content_type=content_type)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('row 3', response.json()['error'])
+
+
+@override_settings(CACHES=SCRATCH_CACHES)
+class RenderJobTests(TransactionTestCase):
+    # The job finishes on the render pool's callback thread, which cannot see a test transaction
+    def test_queued_charts_are_added_to_the_stored_run(self):
+        payload = json.dumps({'dataType': 'ungrouped', 'renderMode': 'async', 'chartFormat': 'svg',
+                              'rows': [{'value': '3', 'frequency': '2'}, {'value': '5', 'frequency': '1'}]})
+        queued = self.client.post('/app/statistics', payload, content_type='application/json')
+        self.assertEqual(queued.status_code, 202, queued.content)
+        job_url, run_id = queued.json()['chart_job_url'], queued.json()['run_id']
+        for _ in range(200):
+            job = self.client.get(job_url)
+            if job.status_code != 202:
+                break
+            time.sleep(0.05)
+        self.assertEqual(job.status_code, 200, job.content)
+
+        charts = self.client.get(f'/app/statistics/runs/{run_id}').json()['charts']
+        self.assertTrue(charts['svg']['histogram_url'] and charts['svg']['ogive_url'])
+        repeat = self.client.post('/app/statistics', payload, content_type='application/json')
+        self.assertEqual(repeat.status_code, 200)
+        self.assertEqual(repeat.json()['run_id'], run_id)
+        self.assertEqual(repeat.json()['histogram_image'], job.json()['histogram_image'])
+
+    def test_async_view_renders_within_the_render_queue_limit(self):
+        queue_slots = mock.Mock(wraps=threading.BoundedSemaphore(2))
+        payloads = [json.dumps({'dataType': 'ungrouped', 'chartFormat': 'svg',
+                                'rows': [{'value': str(value), 'frequency': '2'}, {'value': '9', 'frequency': '1'}]})
+                    for value in (1, 2)]
+        with mock.patch.object(render_jobs, '_queue_slots', queue_slots):
+            response = self.client.post('/app/statistics/async', payloads[0], content_type='application/json')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertTrue(response.json()['histogram_image'])
+            # Each chart took a slot and gave it back
+            self.assertEqual(queue_slots.acquire.call_count, 2)
+            self.assertEqual(queue_slots.release.call_count, 2)
+
+            # With the queue full the charts are drawn in the request instead
+            queue_slots.acquire()
+            queue_slots.acquire()
+            with mock.patch.object(render_jobs.ProcessPoolExecutor, 'submit') as submit:
+                response = self.client.post('/app/statistics/async', payloads[1], content_type='application/json')
+            submit.assert_not_called()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['histogram_image'] and response.json()['ogive_image'])
+
+
+@override_settings(CACHES=SCRATCH_CACHES)
+class BatchStatisticsTests(TestCase):
+    def batch(self, datasets, **options):
+        return self.client.post('/app/statistics/batch', json.dumps({'datasets': datasets, **options}),
+                                content_type='application/json')
+
+    def datasets(self):
+        rng = random.Random(7)
+        return [
+            {'dataType': 'ungrouped', 'rows': random_ungrouped_rows(rng, 50, False), 'chartFormat': 'svg'},
+            {'dataType': 'grouped', 'usingCumulative': True, 'rows': random_grouped_rows(rng, 30, True),
+             'chartFormat': 'svg'},
+            {'dataType': 'neither'},
+            'not an object',
+        ]
+
+    def test_pooled_results_match_inline_and_the_statistics_view(self):
+        datasets = self.datasets()
+        inline = self.batch(datasets).json()
+        with override_settings(STATISTICS_BATCH_PARALLEL_THRESHOLD=1, STATISTICS_BATCH_WORKERS=2):
+            self.assertEqual(self.batch(datasets).json(), inline)
+
+        self.assertEqual((inline['count'], inline['errors']), (4, 2))
+        self.assertEqual([result.get('error') for result in inline['results'][2:]],
+                         ['Select either ungrouped or grouped data.', 'Each dataset must be an object.'])
+        for dataset, result in zip(datasets[:2], inline['results']):
+            single = self.client.post('/app/statistics', json.dumps(dataset), content_type='application/json').json()
+            self.assertEqual(result, {key: single[key] for key in result})
+
+    def test_charts_drawn_in_the_pool_are_cached_for_every_worker(self):
+        datasets = self.datasets()[:2]
+        before = chart_cache_stats()
+        with override_settings(STATISTICS_BATCH_PARALLEL_THRESHOLD=1, STATISTICS_BATCH_WORKERS=2):
+            pooled = self.batch(datasets, includeCharts=True).json()
+        inline = self.batch(datasets, includeCharts=True).json()
+        after = chart_cache_stats()
+        # Two charts per dataset: drawn by pool workers the first time, found by this process the second
+        self.assertEqual((after['misses'] - before['misses'], after['hits'] - before['hits']), (4, 4))
+        self.assertEqual(inline, pooled)
+        self.assertIsNotNone(batch._executor)
+        self.assertTrue(all(result['histogram_image'] and result['ogive_image'] for result in inline['results']))
+
+    @override_settings(STATISTICS_BATCH_PARALLEL_THRESHOLD=1)
+    def test_broken_pool_is_replaced(self):
+        broken = mock.Mock(**{'map.side_effect': BrokenProcessPool('worker died')})
+        with mock.patch.object(batch, '_executor', broken):
+            response = self.batch(self.datasets())
+            self.assertEqual(response.status_code, 503)
+            self.assertIsNone(batch._executor)
+        broken.shutdown.assert_called_once_with(wait=False)
+
+
+@override_settings(CACHES=SCRATCH_CACHES, STATISTICS_TIMING=True)
+class TimingTests(TestCase):
+    payload = json.dumps({'dataType': 'ungrouped', 'chartFormat': 'svg', 'rows': [{'value': '2', 'frequency': '3'}]})
+
+    def post(self, path):
+        with self.assertLogs('firstapp.timing', 'INFO') as logs:
+            response = self.client.post(path, self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, logs.records[-1].timing
+
+    def server_timing(self, response):
+        entries = [entry.split(';dur=') for entry in response['Server-Timing'].split(', ')]
+        return {name: float(duration) for name, duration in entries}
+
+    def test_phases_are_reported_in_the_header_and_the_log(self):
+        for path, view in (('/app/statistics', 'statistics_view'), ('/app/statistics/async', 'statistics_async_view')):
+            with self.subTest(path):
+                response, record = self.post(path)
+                phases = self.server_timing(response)
+                self.assertEqual(list(phases)[-1], 'total')
+                self.assertIn('parse', phases)
+                self.assertTrue(all(0 <= duration <= phases['total'] for duration in phases.values()))
+                self.assertEqual((record['view'], record['status'], record['path']), (view, 200, path))
+                self.assertEqual(set(record['phases_ms']), set(phases) - {'total'})
+
+    @override_settings(STATISTICS_TIMING=False)
+    def test_nothing_is_added_when_timing_is_off(self):
+        response = self.client.post('/app/statistics', self.payload, content_type='application/json')
+        self.assertNotIn('Server-Timing', response)
+        with timed_phase('parse'):
+            pass
+
+    def test_slow_sampled_request_is_profiled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(STATISTICS_PROFILE_THRESHOLD_MS=0, STATISTICS_PROFILE_SAMPLE_RATE=1,
+                               STATISTICS_PROFILE_DIR=directory):
+                _, record = self.post('/app/statistics')
+            self.assertEqual(os.path.dirname(record['profile']), directory)
+            self.assertTrue(pstats.Stats(record['profile']).total_calls)
+
+
+class MetricsTests(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_counted_by_url_name(self):
+        paths = {'/app/reservation/list': ('reservation-list', '200'), '/app/function': ('app/function', '200'),
+                 '/app/no-such-page': ('unmatched', '404')}
+        before = {path: self.sample('http_request_duration_seconds_count', view=view, method='GET', status=status)
+                  for path, (view, status) in paths.items()}
+        size_before = self.sample('http_response_size_bytes_sum', view='reservation-list')
+        responses = {path: self.client.get(path) for path in paths}
+
+        for path, (view, status) in paths.items():
+            self.assertEqual(str(responses[path].status_code), status)
+            after = self.sample('http_request_duration_seconds_count', view=view, method='GET', status=status)
+            self.assertEqual(after - before[path], 1, path)
+        self.assertEqual(self.sample('http_response_size_bytes_sum', view='reservation-list') - size_before,
+                         len(responses['/app/reservation/list'].content))
+        self.assertEqual(self.sample('http_requests_in_flight'), 0)
+
+    def test_metrics_endpoint_serves_the_registry(self):
+        self.client.get('/app/reservation/list')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE_LATEST)
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{', body)
+        self.assertIn('view="reservation-list"', body)
+        self.assertIn('# TYPE cache_requests_total counter', body)
+        self.assertEqual(self.client.post('/metrics').status_code, 405)
+
+
+@override_settings(CACHES=SCRATCH_CACHES)
+class AdmissionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        scratch = override_settings(STATISTICS_ADMISSION_DIR=directory.name, STATISTICS_ADMISSION_WAIT=0.05)
+        scratch.enable()
+        self.addCleanup(scratch.disable)
+
+    def hold_slots(self):
+        # flock() conflicts between descriptors even within one process, so these lock out the view
+        slots = [admission._try_lock('slot', settings.STATISTICS_ADMISSION_SLOTS)
+                 for _ in range(settings.STATISTICS_ADMISSION_SLOTS)]
+        self.assertNotIn(None, slots)
+        self.addCleanup(lambda: [admission._unlock(fd) for fd in slots])
+        return slots
+
+    def post_chart_request(self):
+        # An ordinary request: a small table with the default PNG charts
+        rows = [{'value': str(value), 'frequency': '2'} for value in range(20)]
+        before = {result: self.admissions(result) for result in ('admitted', 'queued', 'degraded', 'rejected')}
+        response = self.client.post('/app/statistics', json.dumps({'dataType': 'ungrouped', 'rows': rows}),
+                                    content_type='application/json')
+        after = {result: self.admissions(result) - count for result, count in before.items()}
+        return response, {result: count for result, count in after.items() if count}
+
+    def admissions(self, result):
+        return REGISTRY.get_sample_value('statistics_admission_total', {'result': result}) or 0
+
+    @override_settings(STATISTICS_ADMISSION_WAIT=5)
+    def test_chart_request_waits_in_the_queue_for_a_slot(self):
+        slots = self.hold_slots()
+        threading.Timer(0.2, lambda: admission._unlock(slots.pop())).start()
+        response, admitted = self.post_chart_request()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['histogram_image'])
+        self.assertEqual(admitted, {'queued': 1})
+
+    def test_chart_request_is_answered_without_charts_when_no_slot_frees_up(self):
+        self.hold_slots()
+        response, admitted = self.post_chart_request()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['charts_skipped'])
+        self.assertIsNone(response.json()['histogram_image'])
+        self.assertEqual(admitted, {'degraded': 1})
+
+    @override_settings(STATISTICS_ADMISSION_OVERLOAD='reject')
+    def test_chart_request_is_rejected_with_retry_after(self):
+        self.hold_slots()
+        response, admitted = self.post_chart_request()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.STATISTICS_ADMISSION_RETRY_AFTER))
+        self.assertEqual(admitted, {'rejected': 1})
+
+    def test_async_charts_are_costed_as_inline_when_the_render_queue_is_full(self):
+        rows = [{'value': str(value), 'frequency': '1'} for value in range(10)]
+        request = RequestFactory().post('/app/statistics', json.dumps({
+            'dataType': 'ungrouped', 'rows': rows, 'renderMode': 'async', 'chartFormat': 'png'}),
+            content_type='application/json')
+        queue_slots = threading.BoundedSemaphore(1)
+        with mock.patch.object(render_jobs, '_queue_slots', queue_slots):
+            self.assertEqual(admission.estimate_cost('statistics', request)['cost'], 10 * admission.ROW_COST_MS)
+            queue_slots.acquire()
+            estimate = admission.estimate_cost('statistics', request)
+        self.assertEqual(estimate['cost'], 10 * admission.ROW_COST_MS + 2 * admission.CHART_COST_MS['png'])
+        self.assertTrue(estimate['degradable'])
+
+
+@override_settings(RESERVATION_WRITE_BEHIND=True, RESERVATION_WRITE_BEHIND_INTERVAL=0.01)
+class WriteBehindTests(TransactionTestCase):
+    # The writer thread commits on its own connection, so these cannot run inside a test transaction
+    def tearDown(self):
+        write_behind.stop_writer()
+
+    def reserve(self, **changes):
+        return self.client.post('/app/reservation', {**RESERVATION, **changes})
+
+    def assertReservations(self, count, guests):
+        self.assertEqual(Reservation.objects.count(), count)
+        day = ReservationDay.objects.get()
+        self.assertEqual((day.reservations, day.guests), (count, guests))
+
+    def test_commit_mode_answers_after_the_insert(self):
+        response = self.reserve()
+        self.assertEqual((response.status_code, response.content), (200, b'success'))
+        self.assertReservations(1, 3)
+
+    @override_settings(RESERVATION_WRITE_BEHIND_DURABILITY='queue', RESERVATION_WRITE_BEHIND_INTERVAL=5)
+    def test_queue_mode_flushes_on_stop(self):
+        for guests in (1, 2, 4):
+            self.assertEqual(self.reserve(guest_count=guests).content, b'success')
+        # The writer is still collecting its first batch
+        self.assertEqual(Reservation.objects.count(), 0)
+        write_behind.stop_writer()
+        self.assertReservations(3, 7)
+
+    @override_settings(RESERVATION_WRITE_BEHIND_COMMIT_TIMEOUT=0.05)
+    def test_timed_out_row_is_withdrawn_and_written_directly(self):
+        # No writer drains this queue, so the row is still waiting when the request gives up
+        stalled = write_behind.queue.Queue()
+        with mock.patch.object(write_behind, '_get_queue', return_value=stalled):
+            response = self.reserve()
+        self.assertEqual((response.status_code, response.content), (200, b'success'))
+        self.assertReservations(1, 3)
+
+        # The writer reaching the withdrawn row later does not insert it a second time
+        write_behind._write_batch([stalled.get_nowait()])
+        self.assertReservations(1, 3)
+
+    @override_settings(RESERVATION_WRITE_BEHIND_COMMIT_TIMEOUT=0.05)
+    def test_row_the_writer_is_inserting_is_reported_pending(self):
+        release = threading.Event()
+        record = write_behind.record_reservations
+
+        def slow_record(reservations):
+            release.wait(5)
+            record(reservations)
+
+        with mock.patch.object(write_behind, 'record_reservations', slow_record):
+            response = self.reserve()
+            self.assertEqual((response.status_code, response.content), (202, b'pending'))
+            release.set()
+            write_behind.stop_writer()
+        self.assertReservations(1, 3)
+
+    def test_full_queue_falls_back_to_a_direct_write(self):
+        full = write_behind.queue.Queue(maxsize=1)
+        full.put_nowait(None)
+        with mock.patch.object(write_behind, '_get_queue', return_value=full):
+            self.assertEqual(self.reserve().content, b'success')
+        self.assertReservations(1, 3)
+
+
+@override_settings(CACHES=SCRATCH_CACHES)
+class MenuTests(TestCase):
+    def setUp(self):
+        menu.get_menu_cache().clear()
+        Menuitem.objects.create(name='Injera', price=40)
+
+    def test_unchanged_menu_is_served_from_cache_and_revalidated(self):
+        response = self.client.get('/app/menu')
+        self.assertEqual(response.json(), {'items': [{'id': Menuitem.objects.get().id, 'name': 'Injera', 'price': 40}]})
+        self.assertEqual(set(response['Cache-Control'].split(', ')), {'public', 'no-cache'})
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/app/menu')
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(self.client.get('/app/menu', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/app/menu', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get('/app/menu', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_menu_changes_invalidate_after_commit(self):
+        before = self.client.get('/app/menu')
+        with self.captureOnCommitCallbacks(execute=True):
+            Menuitem.objects.create(name='Tibs', price=120)
+            # Until the change commits the cached menu is still the one served
+            self.assertEqual(self.client.get('/app/menu')['ETag'], before['ETag'])
+        added = self.client.get('/app/menu', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(added.status_code, 200)
+        self.assertEqual([item['name'] for item in added.json()['items']], ['Injera', 'Tibs'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Menuitem.objects.get(name='Injera').delete()
+        removed = self.client.get('/app/menu', HTTP_IF_NONE_MATCH=added['ETag'])
+        self.assertEqual([item['name'] for item in removed.json()['items']], ['Tibs'])
+        self.assertEqual(self.client.get('/app/menu', HTTP_IF_NONE_MATCH=removed['ETag']).status_code, 304)
+
+
+class ReservationListTests(TestCase):
+    def page_through(self, limit):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get('/app/reservation/list', {'limit': limit, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), limit)
+            ids.extend(row['id'] for row in page['results'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_pages_follow_time_then_id_without_gaps_or_repeats(self):
+        today = date.today()
+        for guests in range(1, 8):
+            Reservation.objects.create(**{**RESERVATION, 'guest_count': guests})
+        # Several reservations share a day, so the id has to break the ties across page boundaries
+        for guests, days_ago in ((2, 3), (5, 3), (6, 3), (7, 1)):
+            Reservation.objects.filter(guest_count=guests).update(reservation_time=today - timedelta(days=days_ago))
+        expected = list(Reservation.objects.order_by('reservation_time', 'id').values_list('id', flat=True))
+        for limit in (1, 2, 3, 7, 8):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.page_through(limit), expected)
+
+    def test_rows_added_before_the_cursor_do_not_shift_later_pages(self):
+        for guests in range(1, 6):
+            Reservation.objects.create(**{**RESERVATION, 'guest_count': guests})
+        first = self.client.get('/app/reservation/list', {'limit': 2}).json()
+        earlier = Reservation.objects.create(**RESERVATION)
+        Reservation.objects.filter(pk=earlier.pk).update(reservation_time=date.today() - timedelta(days=1))
+
+        rest = self.client.get('/app/reservation/list', {'limit': 10, 'cursor': first['next_cursor']}).json()
+        seen = [row['id'] for row in first['results'] + rest['results']]
+        self.assertEqual(sorted(seen), sorted(Reservation.objects.exclude(pk=earlier.pk).values_list('id', flat=True)))
+        self.assertIsNone(rest['next_cursor'])
+
+    @override_settings(RESERVATION_LIST_MAX_LIMIT=3)
+    def test_limit_is_clamped_and_bad_input_rejected(self):
+        for guests in range(1, 6):
+            Reservation.objects.create(**{**RESERVATION, 'guest_count': guests})
+        self.assertEqual(len(self.client.get('/app/reservation/list', {'limit': 100}).json()['results']), 3)
+        self.assertEqual(len(self.client.get('/app/reservation/list', {'limit': 0}).json()['results']), 1)
+        for params in ({'limit': 'ten'}, {'cursor': 'not-a-cursor'}, {'cursor': 'MjAyNi0wMS0wMTp4'}):
+            response = self.client.get('/app/reservation/list', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class ReservationRollupTests(TestCase):
+    def assertReportMatchesTable(self, start, end):
+        response = self.client.get('/app/reservation/report', {'start': start.isoformat(), 'end': end.isoformat()})
+        report = {row['start']: (row['reservations'], row['guests']) for row in response.json()['rows']}
+        counted = Reservation.objects.filter(reservation_time__range=(start, end)).order_by().values(
+            'reservation_time').annotate(count=Count('id'), guests=Sum('guest_count'))
+        expected = {row['reservation_time'].isoformat(): (row['count'], row['guests']) for row in counted}
+        self.assertEqual({day: totals for day, totals in report.items() if totals != (0, 0)}, expected)
+
+    def test_report_matches_the_table_after_every_kind_of_write(self):
+        today = date.today()
+        self.client.post('/app/reservation', {**RESERVATION, 'guest_count': 2})
+        self.client.post('/app/reservation/bulk', json.dumps([{**RESERVATION, 'guest_count': guests}
+                                                              for guests in (1, 5, 7)]),
+                         content_type='application/json')
+        reservation = Reservation.objects.create(**{**RESERVATION, 'guest_count': 4})
+        self.assertReportMatchesTable(today - timedelta(days=1), today)
+
+        reservation.guest_count = 10
+        reservation.save()
+        Reservation.objects.filter(guest_count=5).get().delete()
+        self.assertReportMatchesTable(today - timedelta(days=1), today)
+        self.assertEqual(rollups.reconcile_rollups(fix=False), [])
+
+    def test_failed_rollup_update_rolls_back_the_reservation(self):
+        with mock.patch.object(rollups, '_add_to_day', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                Reservation.objects.create(**RESERVATION)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertFalse(ReservationDay.objects.exists())
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Reservation.objects.create(**RESERVATION)
+                raise RuntimeError('request failed after the insert')
+        self.assertFalse(ReservationDay.objects.exists())
+
+    def test_reconcile_repairs_writes_that_skip_signals(self):
+        today = date.today()
+        for guests in (1, 2, 3):
+            Reservation.objects.create(**{**RESERVATION, 'guest_count': guests})
+        # QuerySet.update() sends no signals, so the rollups still count all three on today
+        Reservation.objects.filter(guest_count=3).update(reservation_time=today - timedelta(days=3))
+        Reservation.objects.filter(guest_count=1).update(guest_count=6)
+
+        output = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_rollups', '--check', stdout=output)
+        self.assertIn(f'{today.isoformat()}: rollup 3 reservations / 6 guests, table 2 / 8', output.getvalue())
+
+        call_command('reconcile_rollups', stdout=StringIO())
+        self.assertEqual(rollups.reconcile_rollups(fix=False), [])
+        self.assertReportMatchesTable(today - timedelta(days=5), today)
@@ -0,0 +1,127 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current_timer = ContextVar('phase_timer', default=None)
+_null_phase = nullcontext()
+# cProfile can only follow one profiler per thread, so at most one request per process is sampled at a time
+_profiler_lock = threading.Lock()
+
+
+class PhaseTimer:
+    def __init__(self, name):
+        self.name = name
+        self.phases = {}
+        self.started = time.perf_counter()
+        self.total = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def stop(self):
+        self.total = time.perf_counter() - self.started
+
+    def server_timing(self):
+        entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.phases.items()]
+        entries.append(f'total;dur={self.total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def timed_phase(name):
+    # Costs one context variable lookup when no request is being timed
+    timer = _current_timer.get()
+    if timer is None:
+        return _null_phase
+    return timer.phase(name)
+
+
+def timed_view(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not getattr(settings, 'STATISTICS_TIMING', False):
+                return await view(request, *args, **kwargs)
+            timer = PhaseTimer(view.__name__)
+            token = _current_timer.set(timer)
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _current_timer.reset(token)
+                timer.stop()
+            # Other requests share the event loop, so async views are timed but never profiled
+            _report(request, response, timer)
+            return response
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not getattr(settings, 'STATISTICS_TIMING', False):
+            return view(request, *args, **kwargs)
+        timer = PhaseTimer(view.__name__)
+        token = _current_timer.set(timer)
+        profiler = _start_profiler()
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _current_timer.reset(token)
+            timer.stop()
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+        _report(request, response, timer, profiler)
+        return response
+
+    return wrapper
+
+
+def _start_profiler():
+    if getattr(settings, 'STATISTICS_PROFILE_THRESHOLD_MS', None) is None:
+        return None
+    if random.random() >= getattr(settings, 'STATISTICS_PROFILE_SAMPLE_RATE', 0.1):
+        return None
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _report(request, response, timer, profiler=None):
+    response['Server-Timing'] = timer.server_timing()
+    record = {
+        'view': timer.name,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': round(timer.total * 1000, 2),
+        'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in timer.phases.items()},
+    }
+    if profiler is not None and timer.total * 1000 >= settings.STATISTICS_PROFILE_THRESHOLD_MS:
+        record['profile'] = _dump_profile(profiler, timer)
+    logger.info(json.dumps(record), extra={'timing': record})
+
+
+def _dump_profile(profiler, timer):
+    directory = getattr(settings, 'STATISTICS_PROFILE_DIR', None) or os.path.join(settings.BASE_DIR, 'cache', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{timer.name}-{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-{id(timer):x}.prof')
+    profiler.dump_stats(path)
+    return path
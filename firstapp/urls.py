@@ -1,9 +1,26 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     path('function', views.hello_world),
     path('class', views.HelloEthiopia.as_view()),
+    path('menu', views.menu_view, name='menu'),
     path('reservation', views.home),
+    path('reservation/bulk', views.reservation_bulk_view, name='reservation-bulk'),
+    path('reservation/list', views.reservation_list_view, name='reservation-list'),
+    path('reservation/report', views.reservation_report_view, name='reservation-report'),
     path('statistics', views.statistics_view, name='statistics'),
+    path('statistics/async', views.statistics_async_view, name='statistics-async'),
+    path('statistics/batch', views.statistics_batch_view, name='statistics-batch'),
+    path('statistics/upload', views.statistics_upload_view, name='statistics-upload'),
+    path('statistics/sessions', views.statistics_sessions_view, name='statistics-sessions'),
+    path('statistics/sessions/<str:session_id>', views.statistics_session_view, name='statistics-session'),
+    path('statistics/sessions/<str:session_id>/rows', views.statistics_session_rows_view,
+         name='statistics-session-rows'),
+    path('statistics/sessions/<str:session_id>/rows/<int:row_id>', views.statistics_session_row_view,
+         name='statistics-session-row'),
+    path('statistics/runs/<int:run_id>', views.statistics_run_view, name='statistics-run'),
+    path('statistics/cache', views.chart_cache_view, name='statistics-cache'),
+    re_path(r'^statistics/charts/(?P<digest>[0-9a-f]{64})\.(?P<chart_format>png|svg)$', views.chart_image_view, name='statistics-chart'),
+    re_path(r'^statistics/jobs/(?P<job_id>[0-9a-f]{32})$', views.chart_job_view, name='statistics-job'),
 ]
\ No newline at end of file
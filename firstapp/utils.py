@@ -0,0 +1,5 @@
+def format_number(value):
+    if value is None:
+        return None
+    rounded = round(float(value), 4)
+    return int(rounded) if rounded.is_integer() else rounded
@@ -0,0 +1,142 @@
+import math
+import re
+
+import numpy as np
+
+from .descriptive import WeightedMoments, describe, grouped_quantile, parse_percentiles
+from .statistics import (
+    INTERVAL_PATTERN,
+    compute_grouped_input,
+    grouped_median,
+    grouped_modal_label,
+    grouped_mode,
+    parse_grouped_rows,
+)
+from .timing import timed_phase
+from .utils import format_number
+
+# Longer frequencies, or a total that could pass int64, are left to the exact parser
+MAX_FREQUENCY_DIGITS = 15
+MAX_TOTAL_FREQUENCY = int(np.iinfo(np.int64).max)
+BULK_INTERVAL_PATTERN = re.compile(INTERVAL_PATTERN.pattern, re.MULTILINE)
+
+
+def analyse_grouped_arrays(rows, using_cumulative, percentiles=None):
+    with timed_phase('parse'):
+        parsed = parse_grouped_arrays(rows, using_cumulative)
+    with timed_phase('compute'):
+        return compute_grouped_input(parsed, percentiles)
+
+
+def parse_grouped_arrays(rows, using_cumulative):
+    # Column arrays, or the scalar parser's class list when the total frequency would overflow int64
+    arrays = _parse_grouped_bulk(rows, using_cumulative)
+    if arrays is None:
+        # Anything the bulk pass cannot vouch for is re-parsed row by row, so the result
+        # (or the first validation error, with its row number) is exactly the scalar parser's
+        classes = parse_grouped_rows(rows, using_cumulative)
+        if sum(cls['frequency'] for cls in classes) > MAX_TOTAL_FREQUENCY:
+            return classes
+        arrays = {
+            'lower': np.array([cls['lower'] for cls in classes], dtype=np.float64),
+            'upper': np.array([cls['upper'] for cls in classes], dtype=np.float64),
+            'frequency': np.array([cls['frequency'] for cls in classes], dtype=np.int64),
+        }
+    return arrays
+
+
+def compute_grouped_arrays(arrays, percentiles=None):
+    lower, upper, frequency = arrays['lower'], arrays['upper'], arrays['frequency']
+    cumulative = np.cumsum(frequency)
+    total_frequency = int(cumulative[-1])
+
+    # Correctly rounded like the scalar path's fsum, so both give the same mean
+    mean_value = math.fsum(((lower + upper) / 2 * frequency).tolist()) / total_frequency
+
+    median_index = int(np.searchsorted(cumulative, total_frequency / 2, side='left'))
+    median_value = grouped_median(_class_at(arrays, median_index),
+                                  int(cumulative[median_index] - frequency[median_index]), total_frequency)
+
+    modal_index = int(np.argmax(frequency))
+    modal_class = _class_at(arrays, modal_index)
+    prev_freq = int(frequency[modal_index - 1]) if modal_index > 0 else 0
+    next_freq = int(frequency[modal_index + 1]) if modal_index < len(frequency) - 1 else 0
+    mode_value = grouped_mode(modal_class, prev_freq, next_freq)
+
+    cumulative_points = [(float(lower[0]), 0)]
+    cumulative_points.extend(zip(upper.tolist(), cumulative.tolist()))
+
+    # Central moments about the mean in two vectorised passes, which is as stable as Welford
+    weights = frequency.astype(np.float64)
+    deviations = (lower + upper) / 2 - mean_value
+    squared = deviations * deviations
+    moments = WeightedMoments(total_frequency, mean_value, float(np.dot(weights, squared)),
+                              float(np.dot(weights, squared * deviations)))
+    descriptive = describe(
+        moments, lambda fraction: float(grouped_quantile(lower, upper, frequency, cumulative, fraction)),
+        parse_percentiles(percentiles))
+
+    return {
+        'total_frequency': total_frequency,
+        'mean': mean_value,
+        'median': median_value,
+        'mode': mode_value,
+        'mode_display': str(format_number(mode_value)),
+        'modal_label': grouped_modal_label(modal_class),
+        'cumulative_points': cumulative_points,
+        'modal_index': modal_index,
+        'descriptive': descriptive,
+    }
+
+
+def classes_from_arrays(arrays):
+    return [
+        {'lower': lower, 'upper': upper, 'frequency': frequency}
+        for lower, upper, frequency in zip(arrays['lower'].tolist(), arrays['upper'].tolist(),
+                                           arrays['frequency'].tolist())
+    ]
+
+
+def _parse_grouped_bulk(rows, using_cumulative):
+    key = 'cumulative' if using_cumulative else 'frequency'
+    rows = [row or {} for row in rows]
+    texts = [row.get('interval', '').strip() for row in rows]
+    kept = [index for index, text in enumerate(texts) if text]
+    if not kept:
+        return None
+
+    # One regex pass over all intervals; a line that does not match makes the counts disagree
+    joined = '\n'.join(texts[index] for index in kept)
+    if joined.count('\n') != len(kept) - 1:
+        return None
+    bounds = BULK_INTERVAL_PATTERN.findall(joined.lower().replace(' to ', '-'))
+    if len(bounds) != len(kept):
+        return None
+
+    counts = [str(rows[index].get(key, '')).strip() for index in kept]
+    if not all(counts) or not ''.join(counts).isdigit():
+        return None
+    digits = max(map(len, counts))
+    # Cumulative counts end at the total; plain frequencies are bounded by how many there are
+    if digits > MAX_FREQUENCY_DIGITS or (not using_cumulative and len(counts) * 10 ** digits > MAX_TOTAL_FREQUENCY):
+        return None
+    try:
+        counts = np.array(counts).astype(np.int64)
+    except ValueError:
+        return None
+
+    bounds = np.array(bounds, dtype=np.float64)
+    lower, upper = bounds[:, 0], bounds[:, 1]
+    frequency = np.diff(counts, prepend=0) if using_cumulative else counts
+
+    if np.any(lower >= upper) or np.any(lower[1:] < upper[:-1]) or np.any(frequency <= 0):
+        return None
+    return {'lower': lower, 'upper': upper, 'frequency': frequency}
+
+
+def _class_at(arrays, index):
+    return {
+        'lower': float(arrays['lower'][index]),
+        'upper': float(arrays['upper'][index]),
+        'frequency': int(arrays['frequency'][index]),
+    }
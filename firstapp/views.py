@@ -1,22 +1,47 @@
+import asyncio
 import base64
 import json
-import re
-from decimal import Decimal, InvalidOperation
-from io import BytesIO
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
 
-import matplotlib
-from django.http import HttpResponse, JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views import View
 from django.views.decorators.csrf import ensure_csrf_cookie
-
-import matplotlib.pyplot as plt
-
+from django.views.decorators.http import require_http_methods, require_POST, require_safe
+
+from .batch import map_datasets
+from .charts import (
+    CHART_CONTENT_TYPES, FIGURE_DPI, FIGURE_SIZE, chart_image_format, default_chart_format, get_chart_backend,
+)
+from .chart_cache import chart_cache_stats, get_cached_chart, get_chart_image, set_cached_chart, store_chart_image
+from .descriptive import parse_percentiles
 from .forms import ReservationForm
-
-matplotlib.use('Agg')
-
-INTERVAL_PATTERN = re.compile(r'^(-?\d+(?:\.\d+)?)\s*[-–—]\s*(-?\d+(?:\.\d+)?)$')
+from .incremental import VersionConflict, create_session, delete_session, edit_session, load_session
+from .menu import get_menu
+from .metrics import render_metrics
+from .models import StatisticsRun
+from .render_jobs import get_chart_job, submit_chart_job, submit_render
+from .reservations import (
+    bulk_create_reservations, list_reservations, reservation_report, save_reservation, validate_reservations,
+)
+from .runs import find_statistics_run, run_summary, save_statistics_run, statistics_input_hash
+from .serialization import EncodedText, JsonResponse, loads
+from .statistics import compute_grouped_input, compute_ungrouped_statistics, parse_grouped_input, parse_ungrouped_rows
+from .streaming import UPLOAD_FORMATS, iter_upload_rows, summarize_grouped_upload, summarize_ungrouped_upload
+from .timing import timed_phase, timed_view
+from .utils import format_number
+
+IMAGE_MODES = ('inline', 'url')
+RENDER_MODES = ('sync', 'async')
+REPORT_PERIODS = ('day', 'week')
+# Chart URLs are content addressed, so the bytes behind them never change
+CHART_IMAGE_MAX_AGE = 60 * 60 * 24 * 365
 
 def hello_world(request):
     return HttpResponse("Again Hello World")
@@ -33,388 +58,611 @@ def home(request):
     if request.method == 'POST':
         form = ReservationForm(request.POST)
         if form.is_valid():
-            form.save()
+            if save_reservation(form) == 'pending':
+                # Still being committed by the write-behind queue; resubmitting would book it twice
+                return HttpResponse("pending", status=202)
             return HttpResponse("success")
 
     return render(request, 'index.html', {'form' : form})
 
+@require_safe
+def metrics_view(request):
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+@require_safe
+def menu_view(request):
+    menu = get_menu()
+    response = HttpResponse(menu['body'], content_type='application/json')
+    response['ETag'] = quote_etag(menu['etag'])
+    response['Last-Modified'] = http_date(menu['last_modified'])
+    patch_cache_control(response, public=True, no_cache=True)
+    return get_conditional_response(
+        request, etag=response['ETag'], last_modified=int(menu['last_modified']), response=response)
+
+@require_POST
+def reservation_bulk_view(request):
+    try:
+        if request.content_type in UPLOAD_FORMATS:
+            rows = list(iter_upload_rows(request, UPLOAD_FORMATS[request.content_type]))
+        else:
+            rows = loads(request.body or '[]')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON payload.'}, status=400)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    if isinstance(rows, dict):
+        rows = rows.get('reservations')
+    if not isinstance(rows, list) or not rows:
+        return JsonResponse({'error': 'Provide a non-empty list of reservations.'}, status=400)
+    max_rows = getattr(settings, 'RESERVATION_BULK_MAX_ROWS', 10000)
+    if len(rows) > max_rows:
+        return JsonResponse({'error': f'A bulk upload can contain at most {max_rows} reservations.'}, status=400)
+
+    reservations, errors = validate_reservations(rows)
+    created = bulk_create_reservations(reservations)
+    return JsonResponse({'created': created, 'failed': len(errors), 'errors': errors})
+
+@require_safe
+def reservation_list_view(request):
+    max_limit = getattr(settings, 'RESERVATION_LIST_MAX_LIMIT', 200)
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), max_limit)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a whole number.'}, status=400)
+    try:
+        rows, next_cursor = list_reservations(request.GET.get('cursor'), limit)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    results = [{**row, 'reservation_time': row['reservation_time'].isoformat()} for row in rows]
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
+@require_safe
+def reservation_report_view(request):
+    period = request.GET.get('period', 'day')
+    if period not in REPORT_PERIODS:
+        return JsonResponse({'error': 'period must be either day or week.'}, status=400)
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else date.today()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be dates in YYYY-MM-DD format.'}, status=400)
+    if start > end:
+        return JsonResponse({'error': 'start must not be after end.'}, status=400)
+    max_days = getattr(settings, 'RESERVATION_REPORT_MAX_DAYS', 731)
+    if (end - start).days >= max_days:
+        return JsonResponse({'error': f'A report can cover at most {max_days} days.'}, status=400)
+
+    rows = reservation_report(start, end, period)
+    return JsonResponse({
+        'period': period,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'reservations': sum(row['reservations'] for row in rows),
+        'guests': sum(row['guests'] for row in rows),
+        'rows': rows,
+    })
+
 @ensure_csrf_cookie
+@timed_view
 def statistics_view(request):
     if request.method == 'POST':
         try:
-            payload = json.loads(request.body or '{}')
+            with timed_phase('decode'):
+                payload = _json_payload(request)
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON payload.'}, status=400)
 
-        data_type = payload.get('dataType')
-        rows = payload.get('rows') or []
-        using_cumulative = bool(payload.get('usingCumulative'))
-
         try:
-            if data_type == 'ungrouped':
-                parsed_rows = _parse_ungrouped_rows(rows, using_cumulative)
-                stats = _compute_ungrouped_statistics(parsed_rows)
-                histogram = _render_ungrouped_histogram(stats['values'], stats['median'], stats['mode_values'])
-                ogive = _render_ogive(stats['ogive_points'], stats['total_frequency'], stats['median'], xlabel='Values')
-                mode_display = stats['mode_display']
-                modal_label = 'Not applicable'
-            elif data_type == 'grouped':
-                classes = _parse_grouped_rows(rows, using_cumulative)
-                stats = _compute_grouped_statistics(classes)
-                histogram = _render_grouped_histogram(classes, stats['median'], stats['mode'], stats['modal_index'])
-                ogive = _render_ogive(stats['cumulative_points'], stats['total_frequency'], stats['median'], xlabel='Upper class boundary')
-                mode_display = stats['mode_display']
-                modal_label = stats['modal_label']
-            else:
-                raise ValueError('Select either ungrouped or grouped data.')
+            options = _statistics_options(payload)
+            data_type, parsed = _parse_statistics(payload)
+            with timed_phase('lookup'):
+                input_hash = statistics_input_hash(data_type, parsed, options['percentiles'])
+                stored = _stored_run_response(find_statistics_run(input_hash), options)
+            if stored is not None:
+                return JsonResponse(stored)
+            response, chart_specs = _prepare_statistics(data_type, parsed, options)
         except ValueError as exc:
             return JsonResponse({'error': str(exc)}, status=400)
 
-        response = {
-            'type': 'Ungrouped data' if data_type == 'ungrouped' else 'Grouped data',
-            'total_frequency': stats['total_frequency'],
-            'mean': _format_number(stats['mean']),
-            'median': _format_number(stats['median']),
-            'mode': mode_display,
-            'modal_label': modal_label,
-            'histogram_image': histogram,
-            'ogive_image': ogive,
-        }
+        if getattr(request, 'statistics_degraded', False):
+            _save_run(input_hash, payload, response, options)
+            return JsonResponse(_without_charts(response, chart_specs, options))
+
+        with timed_phase('chart-cache'):
+            charts, missing = _cached_charts(chart_specs)
+        if missing and options['render_mode'] == 'async' and _queue_chart_job(input_hash, payload, response, charts,
+                                                                               missing, options):
+            return JsonResponse(response, status=202)
+
+        for name, spec in missing.items():
+            charts[name] = _render_chart(spec)
+
+        with timed_phase('store'):
+            digests = _save_run(input_hash, payload, response, options, charts)
+        _attach_charts(response, charts, options['image_mode'], options['chart_format'], digests)
         return JsonResponse(response)
 
     return render(request, 'statistics.html')
 
-def _parse_decimal(value, label):
+@require_POST
+@timed_view
+async def statistics_async_view(request):
     try:
-        return Decimal(str(value))
-    except (InvalidOperation, TypeError, ValueError):
-        raise ValueError(f'"{value}" is not a valid number for {label}.')
-
-def _parse_frequency(value, label, default=None):
-    if value is None or str(value).strip() == '':
-        if default is None:
-            raise ValueError(f'{label} is required.')
-        return default
-
-    freq = _parse_decimal(value, label)
-    if freq <= 0:
-        raise ValueError(f'{label} must be greater than zero.')
-    if freq != freq.to_integral_value():
-        raise ValueError(f'{label} must be a whole number.')
-    return int(freq)
-
-def _parse_ungrouped_rows(rows, using_cumulative=False):
-    entries = []
-    for index, row in enumerate(rows, start=1):
-        value_text = (row or {}).get('value', '').strip()
-        if not value_text:
-            continue
-
-        value = _parse_decimal(value_text, f'value (row {index})')
-        entry = {'value': float(value), 'index': index}
-
-        if using_cumulative:
-            cumulative_text = (row or {}).get('cumulative', '')
-            cumulative = _parse_frequency(cumulative_text, f'cumulative frequency (row {index})')
-            entry['cumulative'] = cumulative
-        else:
-            frequency_text = (row or {}).get('frequency', '')
-            frequency = _parse_frequency(frequency_text, f'frequency (row {index})', default=1)
-            entry['frequency'] = frequency
-
-        entries.append(entry)
-
-    if not entries:
-        raise ValueError('Enter at least one value with a valid frequency.')
-
-    if using_cumulative:
-        processed = []
-        previous_cumulative = 0
-        for entry in sorted(entries, key=lambda item: (item['value'], item['index'])):
-            cumulative = entry['cumulative']
-            if cumulative <= previous_cumulative:
-                raise ValueError('Cumulative frequencies must strictly increase when using cumulative input.')
-            frequency = cumulative - previous_cumulative
-            processed.append((entry['value'], frequency))
-            previous_cumulative = cumulative
-        total_frequency = previous_cumulative
-    else:
-        processed = [(entry['value'], entry['frequency']) for entry in entries]
-        total_frequency = sum(freq for _, freq in processed)
-
-    if total_frequency <= 0:
-        raise ValueError('Total frequency must be greater than zero.')
-
-    return processed
-
-def _parse_interval(interval_text, index):
-    cleaned = interval_text.strip().lower().replace(' to ', '-')
-    match = INTERVAL_PATTERN.match(cleaned)
-    if not match:
-        raise ValueError(f'"{interval_text}" is not a valid interval on row {index}. Use formats like 50-60.')
-    lower = _parse_decimal(match.group(1), f'interval lower bound (row {index})')
-    upper = _parse_decimal(match.group(2), f'interval upper bound (row {index})')
-    if lower >= upper:
-        raise ValueError(f'Lower bound must be less than upper bound on row {index}.')
-    return float(lower), float(upper)
-
-def _parse_grouped_rows(rows, using_cumulative):
-    classes = []
-    previous_upper = None
-    previous_cumulative = 0
-
-    for index, row in enumerate(rows, start=1):
-        interval_text = (row or {}).get('interval', '').strip()
-        if not interval_text:
-            continue
-
-        lower, upper = _parse_interval(interval_text, index)
-        if previous_upper is not None and lower < previous_upper:
-            raise ValueError('Class intervals must be in ascending order and not overlap.')
-
-        if using_cumulative:
-            cumulative_value = _parse_frequency((row or {}).get('cumulative', ''), f'cumulative frequency (row {index})')
-            if cumulative_value <= previous_cumulative:
-                raise ValueError('Cumulative frequencies must strictly increase.')
-            frequency = cumulative_value - previous_cumulative
-            previous_cumulative = cumulative_value
-        else:
-            frequency = _parse_frequency((row or {}).get('frequency', ''), f'frequency (row {index})')
-            previous_cumulative += frequency
+        with timed_phase('decode'):
+            payload = _json_payload(request)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON payload.'}, status=400)
 
-        classes.append({'lower': lower, 'upper': upper, 'frequency': frequency})
-        previous_upper = upper
+    try:
+        options = _statistics_options(payload)
+        data_type, parsed = _parse_statistics(payload)
+        with timed_phase('lookup'):
+            input_hash = statistics_input_hash(data_type, parsed, options['percentiles'])
+            run = await sync_to_async(find_statistics_run)(input_hash)
+            stored = await sync_to_async(_stored_run_response)(run, options)
+        if stored is not None:
+            return JsonResponse(stored)
+        response, chart_specs = _prepare_statistics(data_type, parsed, options)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    if getattr(request, 'statistics_degraded', False):
+        await sync_to_async(_save_run)(input_hash, payload, response, options)
+        return JsonResponse(_without_charts(response, chart_specs, options))
+
+    with timed_phase('chart-cache'):
+        charts, missing = await sync_to_async(_cached_charts)(chart_specs)
+    if missing and options['render_mode'] == 'async':
+        if await sync_to_async(_queue_chart_job)(input_hash, payload, response, charts, missing, options):
+            return JsonResponse(response, status=202)
+
+    # Both charts are drawn at the same time in the render pool, so the slower one sets the latency
+    with timed_phase('render'):
+        rendered = await asyncio.gather(*(_render_chart_async(spec) for spec in missing.values()))
+    charts.update(zip(missing, rendered))
+
+    with timed_phase('store'):
+        digests = await sync_to_async(_save_run)(input_hash, payload, response, options, charts)
+    _attach_charts(response, charts, options['image_mode'], options['chart_format'], digests)
+    return JsonResponse(response)
+
+@require_POST
+@timed_view
+def statistics_batch_view(request):
+    try:
+        with timed_phase('decode'):
+            payload = _json_payload(request)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON payload.'}, status=400)
+
+    if isinstance(payload, list):
+        payload = {'datasets': payload}
+    datasets = payload.get('datasets') if isinstance(payload, dict) else None
+    if not isinstance(datasets, list) or not datasets:
+        return JsonResponse({'error': 'Provide a non-empty list of datasets.'}, status=400)
+    max_datasets = getattr(settings, 'STATISTICS_BATCH_MAX_DATASETS', 1000)
+    if len(datasets) > max_datasets:
+        return JsonResponse({'error': f'A batch can contain at most {max_datasets} datasets.'}, status=400)
+
+    include_charts = bool(payload.get('includeCharts'))
+    try:
+        with timed_phase('datasets'):
+            prepared = map_datasets(_run_batch_dataset, [(dataset, include_charts) for dataset in datasets])
+        results = [response for response, _, _ in prepared]
+        if include_charts:
+            _attach_batch_charts(prepared)
+    except BrokenProcessPool:
+        return JsonResponse({'error': 'A batch worker stopped unexpectedly; retry the request.'}, status=503)
+    return JsonResponse({
+        'count': len(results),
+        'errors': sum(1 for result in results if 'error' in result),
+        'results': results,
+    })
+
+@require_POST
+@timed_view
+def statistics_upload_view(request):
+    upload_format = UPLOAD_FORMATS.get(request.content_type)
+    if upload_format is None:
+        return JsonResponse({'error': 'Upload CSV (text/csv) or newline-delimited JSON (application/x-ndjson).'},
+                            status=415)
+
+    data_type = request.GET.get('dataType')
+    using_cumulative = request.GET.get('usingCumulative', '').lower() in ('1', 'true', 'yes', 'on')
+    try:
+        percentiles = parse_percentiles(request.GET.get('percentiles'))
+        # Rows are read straight off the request stream; request.body is never loaded
+        rows = iter_upload_rows(request, upload_format)
+        with timed_phase('summarize'):
+            if data_type == 'ungrouped':
+                stats = summarize_ungrouped_upload(rows, using_cumulative, percentiles)
+            elif data_type == 'grouped':
+                stats = summarize_grouped_upload(rows, using_cumulative, percentiles)
+            else:
+                raise ValueError('Select either ungrouped or grouped data.')
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
 
-    if not classes:
-        raise ValueError('Enter at least one class interval with a valid frequency.')
+    return JsonResponse(_statistics_summary(data_type, stats))
 
-    total_frequency = sum(cls['frequency'] for cls in classes)
-    if total_frequency <= 0:
-        raise ValueError('Total frequency must be greater than zero.')
+@require_POST
+def statistics_sessions_view(request):
+    try:
+        payload = loads(request.body or '{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON payload.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Send a JSON object.'}, status=400)
+    if payload.get('usingCumulative'):
+        return JsonResponse({'error': 'Sessions take plain frequencies, not cumulative ones.'}, status=400)
 
-    return classes
+    try:
+        session_id, session, row_ids = create_session(payload.get('dataType'), payload.get('rows'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    response = _session_response(session_id, session)
+    response['row_ids'] = row_ids
+    return JsonResponse(response, status=201)
+
+@require_http_methods(['GET', 'HEAD', 'DELETE'])
+def statistics_session_view(request, session_id):
+    if request.method == 'DELETE':
+        delete_session(session_id)
+        return HttpResponse(status=204)
+
+    session = load_session(session_id)
+    if session is None:
+        raise Http404('Statistics session not found or expired.')
+    try:
+        response = _session_response(session_id, session, request.GET.get('percentiles'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if request.GET.get('charts', '').lower() in ('1', 'true', 'yes', 'on'):
+        # Charts are only drawn when asked for, never on every edit
+        try:
+            options = _statistics_options({'imageMode': request.GET.get('imageMode'),
+                                           'chartFormat': request.GET.get('chartFormat')})
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        if session.total:
+            _attach_session_charts(response, session, options)
+    return JsonResponse(response)
 
-def _compute_ungrouped_statistics(pairs):
-    values = []
-    for value, frequency in sorted(pairs, key=lambda item: item[0]):
-        values.extend([value] * frequency)
+@require_POST
+def statistics_session_rows_view(request, session_id):
+    try:
+        payload = loads(request.body or '{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON payload.'}, status=400)
+    rows = payload.get('rows') if isinstance(payload, dict) else payload
 
-    total_frequency = len(values)
-    mean_value = sum(values) / total_frequency if total_frequency else None
+    try:
+        with edit_session(session_id, _expected_version(request)) as session:
+            if session is None:
+                raise Http404('Statistics session not found or expired.')
+            row_ids = session.append(rows)
+    except VersionConflict as exc:
+        return JsonResponse({'error': str(exc)}, status=409)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    response = _session_response(session_id, session)
+    response['row_ids'] = row_ids
+    return JsonResponse(response)
+
+@require_http_methods(['PUT', 'PATCH', 'DELETE'])
+def statistics_session_row_view(request, session_id, row_id):
+    row = None
+    if request.method != 'DELETE':
+        try:
+            row = loads(request.body or '{}')
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON payload.'}, status=400)
+        if not isinstance(row, dict):
+            return JsonResponse({'error': 'Send the row as a JSON object.'}, status=400)
 
-    if total_frequency == 0:
-        median_value = None
-    elif total_frequency % 2 == 1:
-        median_value = values[total_frequency // 2]
+    try:
+        with edit_session(session_id, _expected_version(request)) as session:
+            if session is None:
+                raise Http404('Statistics session not found or expired.')
+            if row is None:
+                session.remove(row_id)
+            else:
+                session.update(row_id, row)
+    except VersionConflict as exc:
+        return JsonResponse({'error': str(exc)}, status=409)
+    except LookupError as exc:
+        raise Http404(str(exc))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(_session_response(session_id, session))
+
+@require_safe
+def statistics_run_view(request, run_id):
+    try:
+        run = StatisticsRun.objects.get(pk=run_id)
+    except StatisticsRun.DoesNotExist:
+        raise Http404('Statistics run not found.')
+
+    response = run_summary(run)
+    response['run_id'] = run.pk
+    response['created_at'] = run.created_at.isoformat()
+    response['charts'] = {
+        chart_format: {f'{name}_url': _chart_url(digest, chart_format) if digest else None
+                       for name, digest in digests.items()}
+        for chart_format, digests in run.charts.items()
+    }
+    return JsonResponse(response)
+
+@require_safe
+def chart_cache_view(request):
+    return JsonResponse(chart_cache_stats())
+
+@require_safe
+def chart_image_view(request, digest, chart_format):
+    image = get_chart_image(digest)
+    # Images are stored by digest alone, so a PNG must not be served under an .svg URL or the reverse
+    if image is None or chart_image_format(image) != chart_format:
+        raise Http404('Chart image not found or expired.')
+
+    response = HttpResponse(image, content_type=CHART_CONTENT_TYPES[chart_format])
+    response['ETag'] = quote_etag(digest)
+    patch_cache_control(response, public=True, max_age=CHART_IMAGE_MAX_AGE, immutable=True)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+@require_safe
+def chart_job_view(request, job_id):
+    job = get_chart_job(job_id)
+    if job is None:
+        raise Http404('Chart job not found or expired.')
+
+    response = {'chart_job': job_id, 'status': job['status'], 'chart_format': job['chart_format']}
+    if job['status'] == 'pending':
+        return JsonResponse(response, status=202)
+    if job['status'] == 'failed':
+        response['error'] = job['error']
+        return JsonResponse(response, status=500)
+
+    if job['image_mode'] == 'url':
+        for name, digest in job['images'].items():
+            response[f'{name}_url'] = _chart_url(digest, job['chart_format']) if digest else None
     else:
-        median_value = (values[total_frequency // 2 - 1] + values[total_frequency // 2]) / 2
-
-    frequencies = {}
-    for value, freq in pairs:
-        frequencies.setdefault(value, 0)
-        frequencies[value] += freq
-
-    sorted_items = sorted(frequencies.items())
-    max_frequency = max((freq for _, freq in sorted_items), default=0)
-    mode_values = [val for val, freq in sorted_items if freq == max_frequency] if max_frequency else []
-    if len(sorted_items) > 1 and len(mode_values) == len(sorted_items):
-        mode_values = []
-    mode_display = ', '.join(str(_format_number(val)) for val in mode_values) if mode_values else 'None'
-
-    ogive_points = []
-    running_total = 0
-    if sorted_items:
-        first_value = sorted_items[0][0]
-        ogive_points.append((first_value, 0))
-        for value, freq in sorted_items:
-            running_total += freq
-            ogive_points.append((value, running_total))
-
-    return {
-        'total_frequency': total_frequency,
-        'mean': mean_value,
-        'median': median_value,
-    'mode_display': mode_display,
-        'mode_values': mode_values,
-        'values': values,
-        'ogive_points': ogive_points,
+        _attach_charts(response, {name: get_chart_image(digest) if digest else None
+                                  for name, digest in job['images'].items()}, 'inline', job['chart_format'])
+    return JsonResponse(response)
+
+def _json_payload(request):
+    # AdmissionMiddleware has usually decoded the body already while estimating the request's cost
+    payload = getattr(request, 'statistics_payload', None)
+    if payload is None:
+        payload = loads(request.body or '{}')
+    return payload
+
+def _statistics_options(payload):
+    options = {
+        'image_mode': payload.get('imageMode') or 'inline',
+        'render_mode': payload.get('renderMode') or getattr(settings, 'STATISTICS_RENDER_MODE', 'sync'),
+        'chart_format': payload.get('chartFormat') or default_chart_format(),
+        'percentiles': parse_percentiles(payload.get('percentiles')),
     }
-
-def _compute_grouped_statistics(classes):
-    total_frequency = sum(cls['frequency'] for cls in classes)
-    if total_frequency <= 0:
-        raise ValueError('Total frequency must be greater than zero.')
-
-    mean_value = sum(((cls['lower'] + cls['upper']) / 2) * cls['frequency'] for cls in classes) / total_frequency
-
-    cumulative = 0
-    cumulative_before = 0
-    median_value = None
-    median_class = None
-    cumulative_points = []
-    if classes:
-        cumulative_points.append((classes[0]['lower'], 0))
-
-    for cls in classes:
-        cumulative += cls['frequency']
-        cumulative_points.append((cls['upper'], cumulative))
-        if median_class is None and cumulative >= total_frequency / 2:
-            median_class = cls
-            cumulative_before = cumulative - cls['frequency']
-
-    if median_class:
-        h = median_class['upper'] - median_class['lower']
-        if h > 0 and median_class['frequency'] > 0:
-            median_value = median_class['lower'] + ((total_frequency / 2 - cumulative_before) / median_class['frequency']) * h
-
-    max_freq = max(classes, key=lambda cls: cls['frequency'])['frequency']
-    mode_candidates = [idx for idx, cls in enumerate(classes) if cls['frequency'] == max_freq]
-    modal_index = mode_candidates[0]
-    modal_class = classes[modal_index]
-    modal_label = f"{_format_number(modal_class['lower'])} – {_format_number(modal_class['upper'])}"
-
-    prev_freq = classes[modal_index - 1]['frequency'] if modal_index > 0 else 0
-    next_freq = classes[modal_index + 1]['frequency'] if modal_index < len(classes) - 1 else 0
-    h = modal_class['upper'] - modal_class['lower']
-    denominator = (modal_class['frequency'] - prev_freq) + (modal_class['frequency'] - next_freq)
-    if h > 0 and denominator != 0:
-        mode_value = modal_class['lower'] + ((modal_class['frequency'] - prev_freq) / denominator) * h
+    if options['image_mode'] not in IMAGE_MODES:
+        raise ValueError('Image mode must be either inline or url.')
+    if options['render_mode'] not in RENDER_MODES:
+        raise ValueError('Render mode must be either sync or async.')
+    get_chart_backend(options['chart_format'])
+    return options
+
+def _parse_statistics(payload):
+    data_type = payload.get('dataType')
+    rows = payload.get('rows') or []
+    using_cumulative = bool(payload.get('usingCumulative'))
+    with timed_phase('parse'):
+        if data_type == 'ungrouped':
+            return data_type, parse_ungrouped_rows(rows, using_cumulative)
+        if data_type == 'grouped':
+            return data_type, parse_grouped_input(rows, using_cumulative)
+    raise ValueError('Select either ungrouped or grouped data.')
+
+def _prepare_statistics(data_type, parsed, options):
+    chart_backend = get_chart_backend(options['chart_format'])
+    if data_type == 'ungrouped':
+        with timed_phase('compute'):
+            stats = compute_ungrouped_statistics(parsed, options['percentiles'])
+        chart_specs = _ungrouped_chart_specs(stats, chart_backend, options['chart_format'])
     else:
-        mode_value = (modal_class['lower'] + modal_class['upper']) / 2
+        with timed_phase('compute'):
+            classes, stats = compute_grouped_input(parsed, options['percentiles'])
+        chart_specs = _grouped_chart_specs(classes, stats, chart_backend, options['chart_format'])
 
-    mode_display = str(_format_number(mode_value)) if mode_value is not None else '—'
+    response = _statistics_summary(data_type, stats)
+    response['chart_format'] = options['chart_format']
+    return response, chart_specs
 
+def _stored_run_response(run, options):
+    # A stored run answers the request only if its charts in this format are still available
+    if run is None:
+        return None
+    digests = run.charts.get(options['chart_format'])
+    if not digests:
+        return None
+    charts = {name: get_chart_image(digest) if digest else None for name, digest in digests.items()}
+    if any(digest and charts[name] is None for name, digest in digests.items()):
+        return None
+
+    response = run_summary(run)
+    response['chart_format'] = options['chart_format']
+    response['run_id'] = run.pk
+    _attach_charts(response, charts, options['image_mode'], options['chart_format'], digests)
+    return response
+
+def _save_run(input_hash, payload, response, options, charts=None):
+    digests = {name: store_chart_image(image) if image is not None else None
+               for name, image in charts.items()} if charts else None
+    run = save_statistics_run(input_hash, payload.get('dataType'), response, options['chart_format'], digests)
+    response['run_id'] = run.pk
+    return digests
+
+def _session_response(session_id, session, percentiles=None):
+    response = _statistics_summary(session.data_type, session.statistics(percentiles))
+    response['session_id'] = session_id
+    response['version'] = session.version
+    response['row_count'] = len(session.rows)
+    return response
+
+def _expected_version(request):
+    # Edits may send If-Match with the version they were made against; a newer session answers 409
+    value = request.headers.get('If-Match', '').strip().strip('"')
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError('If-Match must be the session version the edit is based on.')
+    return int(value)
+
+def _attach_session_charts(response, session, options):
+    stats = {**session.statistics(), **session.chart_data()}
+    chart_backend = get_chart_backend(options['chart_format'])
+    if session.data_type == 'ungrouped':
+        chart_specs = _ungrouped_chart_specs(stats, chart_backend, options['chart_format'])
+    else:
+        chart_specs = _grouped_chart_specs(stats['classes'], stats, chart_backend, options['chart_format'])
+    charts, missing = _cached_charts(chart_specs)
+    for name, spec in missing.items():
+        charts[name] = _render_chart(spec)
+    response['chart_format'] = options['chart_format']
+    _attach_charts(response, charts, options['image_mode'], options['chart_format'])
+
+def _statistics_summary(data_type, stats):
+    summary = {
+        'type': 'Ungrouped data' if data_type == 'ungrouped' else 'Grouped data',
+        'total_frequency': stats['total_frequency'],
+        'mean': format_number(stats['mean']),
+        'median': format_number(stats['median']),
+        'mode': stats['mode_display'],
+        'modal_label': stats['modal_label'] if data_type == 'grouped' else 'Not applicable',
+    }
+    summary.update(stats.get('descriptive') or {})
+    return summary
+
+def _cached_charts(chart_specs):
+    charts = {name: get_cached_chart(spec['kind'], spec['data'], spec['params'])
+              for name, spec in chart_specs.items()}
+    missing = {name: spec for name, spec in chart_specs.items() if charts[name] is None}
+    return charts, missing
+
+def _queue_chart_job(input_hash, payload, response, charts, missing, options):
+    # The run is stored first so the job can add its chart digests to it once they are drawn
+    _save_run(input_hash, payload, response, options)
+    ready = {name: image for name, image in charts.items() if image is not None}
+    job_id = submit_chart_job(missing, ready, options['image_mode'], options['chart_format'], response['run_id'])
+    if job_id is None:
+        return False
+    response['chart_job'] = job_id
+    response['chart_job_url'] = reverse('statistics-job', args=[job_id])
+    return True
+
+def _render_chart(spec):
+    with timed_phase('render'):
+        image = spec['render'](*spec['args'])
+    if image is not None:
+        set_cached_chart(spec['kind'], spec['data'], spec['params'], image)
+    return image
+
+async def _render_chart_async(spec):
+    try:
+        future = submit_render(spec['render'], spec['args'])
+        image = None if future is None else await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        # A render worker died; the next chart gets a fresh pool
+        future = None
+    if future is None:
+        # No room in the render queue (or no pool): draw the chart here, as the sync view does
+        image = await sync_to_async(spec['render'])(*spec['args'])
+    if image is not None:
+        await sync_to_async(set_cached_chart)(spec['kind'], spec['data'], spec['params'], image)
+    return image
+
+def _run_batch_dataset(item):
+    # Runs in a batch worker process, so it only takes and returns plain data. Charts are looked up
+    # and stored by the caller: a worker's own cache is not one the web workers read.
+    dataset, include_charts = item
+    if not isinstance(dataset, dict):
+        return {'error': 'Each dataset must be an object.'}, None, {}
+    try:
+        options = _statistics_options({**dataset, 'renderMode': 'sync'})
+        response, chart_specs = _prepare_statistics(*_parse_statistics(dataset), options)
+    except ValueError as exc:
+        return {'error': str(exc)}, None, {}
+    return response, options, chart_specs if include_charts else {}
+
+def _render_batch_chart(task):
+    render, args = task
+    return render(*args)
+
+def _attach_batch_charts(prepared):
+    with timed_phase('chart-cache'):
+        found = [_cached_charts(chart_specs) for _, _, chart_specs in prepared]
+    missing = [(charts, name, spec) for charts, specs in found for name, spec in specs.items()]
+    with timed_phase('render'):
+        images = map_datasets(_render_batch_chart, [(spec['render'], spec['args']) for _, _, spec in missing])
+    for (charts, name, spec), image in zip(missing, images):
+        if image is not None:
+            set_cached_chart(spec['kind'], spec['data'], spec['params'], image)
+        charts[name] = image
+    for (response, options, _), (charts, _) in zip(prepared, found):
+        if options is not None:
+            _attach_charts(response, charts, options['image_mode'], options['chart_format'])
+
+def _ungrouped_chart_specs(stats, backend, chart_format):
+    chart_data = list(zip(stats['values'], stats['weights']))
     return {
-        'total_frequency': total_frequency,
-        'mean': mean_value,
-        'median': median_value,
-        'mode': mode_value,
-        'mode_display': mode_display,
-        'modal_label': modal_label,
-        'cumulative_points': cumulative_points,
-        'modal_index': modal_index,
+        'histogram': _chart_spec('ungrouped-histogram', chart_data, _chart_params(chart_format),
+                                 backend.render_ungrouped_histogram,
+                                 stats['values'], stats['weights'], stats['median'], stats['mode_values']),
+        'ogive': _chart_spec('ogive', chart_data, _chart_params(chart_format, xlabel='Values'), backend.render_ogive,
+                             stats['ogive_points'], stats['total_frequency'], stats['median'], 'Values'),
     }
 
-def _render_ungrouped_histogram(values, median_value, mode_values):
-    if not values:
-        return None
+def _grouped_chart_specs(classes, stats, backend, chart_format):
+    chart_data = [(cls['lower'], cls['upper'], cls['frequency']) for cls in classes]
+    return {
+        'histogram': _chart_spec('grouped-histogram', chart_data, _chart_params(chart_format),
+                                 backend.render_grouped_histogram,
+                                 classes, stats['median'], stats['mode'], stats['modal_index']),
+        'ogive': _chart_spec('ogive', chart_data, _chart_params(chart_format, xlabel='Upper class boundary'),
+                             backend.render_ogive,
+                             stats['cumulative_points'], stats['total_frequency'], stats['median'],
+                             'Upper class boundary'),
+    }
 
-    bins = min(10, max(1, len(set(values))))
-    fig, ax = plt.subplots(figsize=(7, 4))
-    ax.hist(values, bins=bins, color='#6366f1', edgecolor='#312e81', alpha=0.85)
-    ax.set_xlabel('Values')
-    ax.set_ylabel('Frequency')
-    if median_value is not None:
-        ax.axvline(median_value, color='#0ea5e9', linestyle='--', linewidth=1.4,
-                   label=f'Median {_format_number(median_value)}')
-    for index, mode_value in enumerate(mode_values):
-        ax.axvline(mode_value, color='#f97316', linestyle='-', linewidth=1.2,
-                   label='Mode' if index == 0 else None)
-    ax.grid(alpha=0.2)
-    handles, labels = ax.get_legend_handles_labels()
-    if labels:
-        ax.legend()
-    fig.tight_layout()
-    return _figure_to_base64(fig)
-
-def _render_grouped_histogram(classes, median_value, mode_value, modal_index):
-    fig, ax = plt.subplots(figsize=(7, 4))
-    for cls in classes:
-        width = cls['upper'] - cls['lower']
-        ax.bar(cls['lower'], cls['frequency'], width=width, align='edge', color='#38bdf8', edgecolor='#0f172a', alpha=0.85)
-
-    if median_value is not None:
-        ax.axvline(median_value, color='#0ea5e9', linestyle='--', linewidth=1.4,
-                   label=f'Median {_format_number(median_value)}')
-
-    if 0 <= modal_index < len(classes):
-        modal_class = classes[modal_index]
-        prev_class = classes[modal_index - 1] if modal_index > 0 else None
-        next_class = classes[modal_index + 1] if modal_index < len(classes) - 1 else None
-
-        if prev_class and next_class:
-            ax.plot([prev_class['upper'], modal_class['lower']],
-                    [prev_class['frequency'], modal_class['frequency']],
-                    color='#f97316', linestyle='--', linewidth=1.2,
-                    label='Mode construction')
-            ax.plot([modal_class['upper'], next_class['lower']],
-                    [modal_class['frequency'], next_class['frequency']],
-                    color='#f97316', linestyle='--', linewidth=1.2)
-
-            intersection = _line_intersection(
-                (prev_class['upper'], prev_class['frequency']),
-                (modal_class['lower'], modal_class['frequency']),
-                (next_class['lower'], next_class['frequency']),
-                (modal_class['upper'], modal_class['frequency'])
-            )
-            if intersection:
-                mode_x, mode_y = intersection
-                ax.scatter(mode_x, mode_y, color='#f97316')
-                ax.vlines(mode_x, 0, mode_y, color='#f97316', linewidth=1.4, label='Mode')
-        elif mode_value is not None:
-            ax.vlines(mode_value, 0, modal_class['frequency'], color='#f97316', linewidth=1.4, label='Mode')
-    ax.set_xlabel('Class intervals')
-    ax.set_ylabel('Frequency')
-    ax.grid(alpha=0.2)
-    handles, labels = ax.get_legend_handles_labels()
-    if labels:
-        ax.legend()
-    fig.tight_layout()
-    return _figure_to_base64(fig)
-
-def _render_ogive(points, total_frequency, median_value, xlabel):
-    fig, ax = plt.subplots(figsize=(7, 4))
-    median_level = total_frequency / 2 if total_frequency else None
-    intersection_x = None
-    if points:
-        xs, ys = zip(*points)
-        ax.plot(xs, ys, marker='o', color='#22c55e')
-        if median_level is not None:
-            for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
-                if (y0 <= median_level <= y1) or (y1 <= median_level <= y0):
-                    if y1 == y0:
-                        intersection_x = x1
-                    else:
-                        ratio = (median_level - y0) / (y1 - y0)
-                        intersection_x = x0 + ratio * (x1 - x0)
-                    break
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel('Cumulative frequency')
-    if median_level is not None and points:
-        start_x = points[0][0]
-        target_x = intersection_x if intersection_x is not None else median_value
-        if target_x is not None:
-            ax.hlines(median_level, start_x, target_x, colors='#0ea5e9', linestyles='--', linewidth=1.2,
-                      label='Median level (N/2)')
-            ax.vlines(target_x, 0, median_level, colors='#0ea5e9', linestyles='-', linewidth=1.5,
-                      label=f'Median {_format_number(target_x)}')
-            ax.scatter(target_x, median_level, color='#0ea5e9')
-    ax.grid(alpha=0.2)
-    handles, labels = ax.get_legend_handles_labels()
-    if labels:
-        ax.legend()
-    fig.tight_layout()
-    return _figure_to_base64(fig)
-
-def _figure_to_base64(fig):
-    buffer = BytesIO()
-    fig.savefig(buffer, format='png', dpi=150)
-    plt.close(fig)
-    buffer.seek(0)
-    return base64.b64encode(buffer.read()).decode('ascii')
-
-def _line_intersection(p1, p2, p3, p4):
-    (x1, y1), (x2, y2) = p1, p2
-    (x3, y3), (x4, y4) = p3, p4
-    denominator = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
-    if abs(denominator) < 1e-12:
-        return None
-    numerator_x = (x1 * y2 - y1 * x2) * (x3 - x4) - (x1 - x2) * (x3 * y4 - y3 * x4)
-    numerator_y = (x1 * y2 - y1 * x2) * (y3 - y4) - (y1 - y2) * (x3 * y4 - y3 * x4)
-    return numerator_x / denominator, numerator_y / denominator
+def _chart_spec(kind, data, params, render, *args):
+    # render and args must be picklable so the chart can be drawn in a worker process
+    return {'kind': kind, 'data': data, 'params': params, 'render': render, 'args': args}
+
+def _without_charts(response, chart_specs, options):
+    # Admission control had no room to draw charts: same response shape, images left empty
+    _attach_charts(response, dict.fromkeys(chart_specs), options['image_mode'], options['chart_format'])
+    response['charts_skipped'] = True
+    return response
+
+def _attach_charts(response, charts, image_mode, chart_format, digests=None):
+    if image_mode == 'url' and digests is None:
+        digests = {name: store_chart_image(image) if image is not None else None for name, image in charts.items()}
+    for name, image in charts.items():
+        if image_mode == 'url':
+            response[f'{name}_url'] = _chart_url(digests[name], chart_format) if digests[name] else None
+        else:
+            response[f'{name}_image'] = _encode_image(image)
+
+def _chart_url(digest, chart_format):
+    return reverse('statistics-chart', args=[digest, chart_format])
 
-def _format_number(value):
-    if value is None:
+def _encode_image(image):
+    if image is None:
         return None
-    rounded = round(float(value), 4)
-    return int(rounded) if rounded.is_integer() else rounded
\ No newline at end of file
+    with timed_phase('base64'):
+        return EncodedText(base64.b64encode(image))
+
+def _chart_params(chart_format, **extra):
+    return {'format': chart_format, 'figsize': FIGURE_SIZE, 'dpi': FIGURE_DPI, **extra}
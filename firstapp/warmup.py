@@ -0,0 +1,49 @@
+import gc
+import time
+
+from django.db import connections
+from django.urls import get_resolver
+
+from .charts import CHART_BACKENDS, get_chart_backend
+from .statistics import compute_grouped_statistics, compute_ungrouped_statistics
+
+WARMUP_PAIRS = [(1.0, 2), (2.0, 3), (4.0, 1)]
+WARMUP_CLASSES = [
+    {'lower': 0.0, 'upper': 10.0, 'frequency': 2},
+    {'lower': 10.0, 'upper': 20.0, 'frequency': 5},
+    {'lower': 20.0, 'upper': 30.0, 'frequency': 3},
+]
+
+
+def warm_up(chart_formats=None):
+    # Loads the URLconf (and with it every view module) and draws a tiny histogram and ogive in each
+    # chart format, so matplotlib's imports, font cache and text layout are paid for before the first
+    # request. Nothing touches the database or the caches. Returns {step: seconds}.
+    timings = {}
+    started = time.perf_counter()
+    get_resolver().url_patterns
+    timings['urls'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ungrouped = compute_ungrouped_statistics(WARMUP_PAIRS)
+    grouped = compute_grouped_statistics(WARMUP_CLASSES)
+    timings['statistics'] = time.perf_counter() - started
+
+    for chart_format in chart_formats or CHART_BACKENDS:
+        started = time.perf_counter()
+        backend = get_chart_backend(chart_format)
+        backend.render_ungrouped_histogram(ungrouped['values'], ungrouped['weights'], ungrouped['median'],
+                                           ungrouped['mode_values'])
+        backend.render_grouped_histogram(WARMUP_CLASSES, grouped['median'], grouped['mode'], grouped['modal_index'])
+        backend.render_ogive(ungrouped['ogive_points'], ungrouped['total_frequency'], ungrouped['median'], 'Values')
+        timings[f'render_{chart_format}'] = time.perf_counter() - started
+    return timings
+
+
+def prepare_fork():
+    # Called in the gunicorn master after warm_up: workers must not inherit open database connections,
+    # and freezing the heap stops their garbage collector from writing to (and so copying) every page
+    # the master loaded. The master re-enables the collector afterwards (see docker/gunicorn.conf.py).
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,133 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Reservation
+from .rollups import record_reservations
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ('commit', 'queue')
+
+_queue = None
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def write_behind_enabled():
+    return getattr(settings, 'RESERVATION_WRITE_BEHIND', False)
+
+
+def write_behind_durability():
+    durability = getattr(settings, 'RESERVATION_WRITE_BEHIND_DURABILITY', 'commit')
+    if durability not in DURABILITY_MODES:
+        raise ValueError('RESERVATION_WRITE_BEHIND_DURABILITY must be either commit or queue.')
+    return durability
+
+
+def enqueue_reservation(reservation):
+    # Returns 'queued', 'committed' or 'pending' (the commit timed out while the writer was already
+    # inserting the row), or None when the caller should write the row directly instead: the queue
+    # is full, or the commit timed out before the writer reached the row and it was withdrawn
+    pending = _get_queue()
+    done = Future()
+    try:
+        pending.put_nowait((reservation, done))
+    except queue.Full:
+        return None
+    if write_behind_durability() == 'queue':
+        return 'queued'
+    try:
+        done.result(timeout=getattr(settings, 'RESERVATION_WRITE_BEHIND_COMMIT_TIMEOUT', 10))
+    except TimeoutError:
+        # A cancelled row is skipped by the writer, so writing it here cannot create a duplicate
+        return None if done.cancel() else 'pending'
+    return 'committed'
+
+
+def stop_writer(timeout=5):
+    # Lets the writer finish the batch it is collecting, then writes anything still queued
+    # from the calling thread; registered with atexit so a graceful worker exit loses nothing
+    if _queue is None:
+        return
+    if _writer is not None and _writer.is_alive():
+        try:
+            _queue.put(None, timeout=timeout)
+            _writer.join(timeout)
+        except queue.Full:
+            pass
+    batch = []
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not None:
+            batch.append(item)
+    if batch:
+        _write_batch(batch)
+
+
+def _get_queue():
+    global _queue, _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            if _queue is None:
+                _queue = queue.Queue(maxsize=getattr(settings, 'RESERVATION_WRITE_BEHIND_QUEUE_LIMIT', 1000))
+                atexit.register(stop_writer)
+            _writer = threading.Thread(target=_writer_loop, name='reservation-writer', daemon=True)
+            _writer.start()
+        return _queue
+
+
+def _writer_loop():
+    batch_size = getattr(settings, 'RESERVATION_WRITE_BEHIND_BATCH_SIZE', 100)
+    interval = getattr(settings, 'RESERVATION_WRITE_BEHIND_INTERVAL', 0.05)
+    while True:
+        item = _queue.get()
+        if item is None:
+            return
+        batch = [item]
+        stopping = False
+        deadline = time.monotonic() + interval
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        _write_batch(batch)
+        if stopping:
+            return
+
+
+def _write_batch(batch):
+    # Rows whose request gave up waiting (and wrote them itself) are cancelled and skipped
+    batch = [(reservation, done) for reservation, done in batch if done.set_running_or_notify_cancel()]
+    if not batch:
+        return
+    connection.close_if_unusable_or_obsolete()
+    reservations = [reservation for reservation, done in batch]
+    try:
+        with transaction.atomic():
+            Reservation.objects.bulk_create(reservations)
+            record_reservations(reservations)
+    except Exception as exc:
+        logger.exception('Failed to write %d queued reservations', len(batch))
+        for reservation, done in batch:
+            done.set_exception(exc)
+        return
+    for reservation, done in batch:
+        done.set_result(reservation)
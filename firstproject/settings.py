@@ -1,4 +1,5 @@
 
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -24,6 +25,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost so latency and response size cover the whole middleware stack
+    'firstapp.metrics.MetricsMiddleware',
+    # Inside the metrics middleware so the recorded response size is what goes over the wire
+    'firstapp.compression.CompressionMiddleware',
+
     'django.middleware.security.SecurityMiddleware',
 
     # Whitenoise middleware must be just after SecurityMiddleware
@@ -35,6 +41,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Limits how many render-heavy statistics requests run at once across all workers
+    'firstapp.admission.AdmissionMiddleware',
 ]
 
 TEMPLATES = [
@@ -58,10 +66,135 @@ WSGI_APPLICATION = 'firstproject.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',  # DB file stays in BASE_DIR
+        # DB file stays in BASE_DIR; DJANGO_DB_NAME points a process at another file
+        'NAME': os.environ.get('DJANGO_DB_NAME') or BASE_DIR / 'db.sqlite3',
+        # Keep each worker's connection open between requests instead of reconnecting every time
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL is switched on once, after migrate (firstapp.apps), as it is stored in the file itself
+            'init_command': 'PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered statistics charts, keyed by a hash of the parsed table (LRU, bounded, expiring)
+    'charts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'statistics-charts',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 256},
+    },
+    # PNG bytes served by content-hash URL; on disk so every gunicorn worker can serve them
+    'chart_images': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'chart-images',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+    # Status of charts rendered off-request; shared so any worker can answer the poll
+    'render_jobs': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'render-jobs',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+    # Rendered menu JSON, versioned and shared by every worker so a change invalidates all of them
+    'menu': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'menu',
+        'TIMEOUT': None,
+    },
+}
+CHART_CACHE_ALIAS = 'charts'
+CHART_IMAGE_CACHE_ALIAS = 'chart_images'
+RENDER_JOB_CACHE_ALIAS = 'render_jobs'
+MENU_CACHE_ALIAS = 'menu'
+# How long other workers wait for (and serve the previous menu during) a rebuild
+MENU_REBUILD_LOCK_TIMEOUT = 10
+
+# 'sync' draws charts in the request, 'async' in a process pool; clients may pass renderMode
+STATISTICS_RENDER_MODE = 'sync'
+STATISTICS_RENDER_WORKERS = 2
+STATISTICS_RENDER_QUEUE_LIMIT = 16
+# Render and batch pools start their workers this way, never by forking the threaded web worker
+STATISTICS_RENDER_START_METHOD = 'forkserver'
+# Seconds after which a chart job still pending is reported as failed
+STATISTICS_RENDER_JOB_TIMEOUT = 120
+# 'png' (matplotlib, imported on first use) or 'svg'; clients may pass chartFormat
+STATISTICS_CHART_FORMAT = 'png'
+# Ogives are downsampled to this many points and histograms merged to this many bars before drawing
+STATISTICS_CHART_MAX_POINTS = 1000
+STATISTICS_CHART_MAX_BARS = 600
+
+# Statistics requests estimated to cost at least the threshold (ms; any PNG chart does) share these slots
+STATISTICS_ADMISSION = True
+STATISTICS_ADMISSION_COST_THRESHOLD = 250
+STATISTICS_ADMISSION_SLOTS = 2
+STATISTICS_ADMISSION_QUEUE = 4
+STATISTICS_ADMISSION_WAIT = 2.0
+# When no slot frees up: 'degrade' answers without charts, 'reject' with 503 and Retry-After
+STATISTICS_ADMISSION_OVERLOAD = 'degrade'
+STATISTICS_ADMISSION_RETRY_AFTER = 5
+
+# statistics/batch fans datasets out over this many processes once a batch reaches the threshold
+STATISTICS_BATCH_WORKERS = 4
+STATISTICS_BATCH_PARALLEL_THRESHOLD = 8
+STATISTICS_BATCH_MAX_DATASETS = 1000
+
+# Grouped tables with at least this many rows are parsed and summarised with NumPy
+STATISTICS_VECTORIZE_THRESHOLD = 2000
+
+# Percentiles reported when a request does not ask for its own
+STATISTICS_PERCENTILES = (5, 10, 90, 95)
+# Streamed uploads with more distinct values than this switch to a quantile sketch (no mode reported)
+STATISTICS_SKETCH_THRESHOLD = 1000000
+STATISTICS_SKETCH_RELATIVE_ERROR = 0.01
+
+# statistics/sessions: idle expiry in seconds, sessions memoised per worker, and the smallest edit log
+# that is folded back into a snapshot (edits may send If-Match: <version> to get a 409 on conflict)
+STATISTICS_SESSION_MAX_ROWS = 200000
+STATISTICS_SESSION_TTL = 60 * 60 * 24
+STATISTICS_SESSION_MEMO_SIZE = 32
+STATISTICS_SESSION_COMPACT_MIN_ROWS = 1000
+
+# Server-Timing header and per-request timing log lines; slow sampled requests are profiled to disk
+STATISTICS_TIMING = False
+STATISTICS_PROFILE_THRESHOLD_MS = None
+STATISTICS_PROFILE_SAMPLE_RATE = 0.1
+STATISTICS_PROFILE_DIR = BASE_DIR / 'cache' / 'profiles'
+
+# Bulk reservation uploads are validated row by row and inserted in batches of this size
+RESERVATION_BULK_BATCH_SIZE = 500
+RESERVATION_BULK_MAX_ROWS = 10000
+
+# reservation/report reads per-day rollups; run reconcile_rollups periodically to repair skipped signals
+RESERVATION_REPORT_MAX_DAYS = 731
+# Largest page reservation/list will return; pages are keyset based so depth costs nothing
+RESERVATION_LIST_MAX_LIMIT = 200
+
+# Reservations are queued and inserted in batches by one writer thread per worker (firstapp.write_behind)
+RESERVATION_WRITE_BEHIND = False
+# 'commit' answers once the batch has committed (202 "pending" past the timeout), 'queue' once queued
+RESERVATION_WRITE_BEHIND_DURABILITY = 'commit'
+RESERVATION_WRITE_BEHIND_BATCH_SIZE = 100
+RESERVATION_WRITE_BEHIND_INTERVAL = 0.05
+RESERVATION_WRITE_BEHIND_QUEUE_LIMIT = 1000
+RESERVATION_WRITE_BEHIND_COMMIT_TIMEOUT = 10
+
+# 'auto' uses orjson when installed (with the standard library for input it rejects); 'json' forces it off
+JSON_BACKEND = 'auto'
+# JSON responses of at least the minimum size are compressed with the first encoding the client accepts
+JSON_COMPRESSION = ('br', 'gzip')
+JSON_COMPRESSION_MIN_BYTES = 16 * 1024
+JSON_COMPRESSION_BROTLI_QUALITY = 5
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},